@@ -3,13 +3,40 @@
 __author__ = """Christoph Rist"""
 __email__ = "c.rist@posteo.de"
 
-from .particles import add_voxels, add_point_cloud, add_flow_mesh, add_boxes
-from .scene_setup import setup_scene, add_cameras_default
-from .system_setup import setup_system
-from .object_spotlight import add_spotlight_ground
-from .cli import process_file
+import importlib
+
 import numpy as np
 
+# public name -> submodule. Submodules are imported on first access, so that
+# e.g. data_inspect works without importing bpy.
+_lazy_imports = {
+    "add_boxes": ".particles",
+    "add_voxels": ".particles",
+    "add_point_cloud": ".particles",
+    "add_flow_mesh": ".particles",
+    "setup_scene": ".scene_setup",
+    "add_cameras_default": ".scene_setup",
+    "setup_system": ".system_setup",
+    "add_spotlight_ground": ".object_spotlight",
+    "process_file": ".cli",
+}
+
+
+def __getattr__(name):
+    try:
+        module_name = _lazy_imports[name]
+    except KeyError:
+        raise AttributeError(
+            "module '{}' has no attribute '{}'".format(__name__, name)
+        ) from None
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_imports))
+
 
 __all__ = [
     "add_boxes",
@@ -43,5 +70,3 @@ def furthest_point_sampling_thresh(pts, dist_thresh: float = 0.1):
         farthest_pts_idxs.append(farthest_pt_idx)
         distances = np.minimum(distances, calc_distances(farthest_pts[-1], pts))
     return np.stack(farthest_pts, axis=0), np.array(farthest_pts_idxs)
-
-
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Render many data files in one blender process.
+
+The scene (world, cameras, render settings) and cached materials are set up once.
+For every file, its objects are added, all cameras are rendered and all datablocks
+that were created for the file are removed again.
+"""
+
+import glob
+import json
+import logging
+import pathlib
+import time
+import typing
+
+from .blender_kitti import (
+    add_objects_from_data,
+    make_scene,
+    extract_data_tasks_from_file,
+    filter_tasks,
+    load_task_data,
+)
+from .datablocks import datablock_scope, free_datablocks
+from .material_shader import is_cached_material
+from .prepared_cache import prepared_cache_from_config
+from .profiling import stage
+from .render_stage import (
+    add_cameras_from_config,
+    apply_render_settings,
+    format_output_path,
+    render_settings_from_config,
+    render_views,
+)
+from .system_setup import setup_system
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+MANIFEST_SUFFIXES = {".txt", ".lst", ".manifest"}
+
+
+def collect_input_files(inputs: typing.Iterable[str]) -> [pathlib.Path]:
+    """Data files from directories (all *.npz), manifests (one path per line,
+    relative to the manifest), glob patterns or plain file paths.
+    """
+    files = []
+    for x in inputs:
+        path = pathlib.Path(x)
+        if path.is_dir():
+            files.extend(sorted(path.glob("*.npz")))
+        elif path.is_file() and path.suffix in MANIFEST_SUFFIXES:
+            with open(str(path), "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        files.append(path.parent / line)
+        elif path.is_file():
+            files.append(path)
+        else:
+            matches = sorted(glob.glob(x, recursive=True))
+            if not matches:
+                logger.warning("No input files for '{}'.".format(x))
+            files.extend(pathlib.Path(m) for m in matches)
+
+    # remove duplicates, keep order
+    unique = {}
+    for f in files:
+        unique.setdefault(f.resolve(), f)
+    return list(unique.values())
+
+
+def build_file_objects(
+    filepath: pathlib.Path,
+    scene,
+    config: {str: typing.Any},
+    prepared_cache=None,
+    name_prefix: str = None,
+) -> {str: float}:
+    """Add the objects of a data file to scene.
+
+    :param name_prefix: prepended to the object names of the file (to add
+        several files with the same file_desc to one scene)
+    :return: seconds for loading the data and building the objects
+    """
+    seconds = {}
+    t = time.perf_counter()
+    with stage("file_load", file=str(filepath)):
+        tasks, _file_config = extract_data_tasks_from_file(
+            str(filepath), data_types=config.get("data_types"), load=False
+        )
+        if "whitelist" in config:
+            tasks = filter_tasks(tasks, whitelist=config["whitelist"])
+        if name_prefix is not None:
+            for _task_f, task_kwargs in tasks.values():
+                task_kwargs["name_prefix"] = name_prefix + task_kwargs["name_prefix"]
+        load_task_data(tasks)
+    seconds["load"] = time.perf_counter() - t
+    seconds.update(
+        build_task_objects(tasks, scene, config, prepared_cache, file=str(filepath))
+    )
+    return seconds
+
+
+def build_task_objects(
+    tasks, scene, config: {str: typing.Any}, prepared_cache=None, **stage_info
+) -> {str: float}:
+    """Add the objects of (loaded) tasks to scene with the options of config.
+
+    :return: seconds for building the objects
+    """
+    t = time.perf_counter()
+    with stage("build", **stage_info):
+        add_objects_from_data(
+            tasks,
+            scene,
+            dedup=config.get("deduplicate", True),
+            num_workers=config.get("prepare_workers"),
+            cache=prepared_cache,
+        )
+    return {"build": time.perf_counter() - t}
+
+
+def render_batch(
+    inputs: typing.Iterable[str],
+    output_template: str = None,
+    config: {str: typing.Any} = None,
+    *,
+    skip_existing: bool = True,
+    summary_path: str = None,
+):
+    """Render all input files with one scene.
+
+    :param inputs: directories, manifests, glob patterns or files
+    :param output_template: output path per file and camera, see format_output_path
+        (default: 'output' of the render settings)
+    :param config: render config (as for make_scene_from_data_files), including
+        render settings, cameras and views (see render_stage)
+    :param skip_existing: skip files whose outputs all exist (resume a batch)
+    :param summary_path: write per file timings as JSON to this path
+    :return: list of per file summaries
+    """
+    if config is None:
+        config = {}
+    settings = render_settings_from_config(config)
+    if output_template is None:
+        output_template = settings["output"]
+
+    files = collect_input_files(inputs)
+    logger.info("Batch rendering {} files.".format(len(files)))
+
+    t_start = time.perf_counter()
+    scene = make_scene(config, fallback_scene_name="blender_kitti_batch")
+    cameras = add_cameras_from_config(scene, config)
+    try:
+        setup_system(enable_gpu_rendering=config.get("gpu", True), scene=scene)
+    except ImportError:
+        pass
+    apply_render_settings(scene, settings)
+    prepared_cache = prepared_cache_from_config(config)
+    t_setup = time.perf_counter() - t_start
+
+    summary = []
+    for index, filepath in enumerate(files):
+        outputs = {
+            name: format_output_path(output_template, filepath, index, name)
+            for name in cameras
+        }
+        entry = {
+            "file": str(filepath),
+            "outputs": {k: str(v) for k, v in outputs.items()},
+            "seconds": {},
+        }
+        summary.append(entry)
+
+        if skip_existing and all(p.is_file() for p in outputs.values()):
+            entry["status"] = "skipped"
+            continue
+
+        seconds = entry["seconds"]
+        t_file = time.perf_counter()
+        scope = None
+        try:
+            with datablock_scope(str(filepath)) as scope:
+                seconds.update(
+                    build_file_objects(filepath, scene, config, prepared_cache)
+                )
+
+                t = time.perf_counter()
+                seconds["views"] = render_views(scene, cameras, outputs)
+                seconds["render"] = time.perf_counter() - t
+            entry["status"] = "rendered"
+        except Exception as e:
+            logger.error("Failed to render '{}': {}".format(filepath, e))
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+        finally:
+            t = time.perf_counter()
+            if scope is not None:
+                # cached materials are kept for the next file
+                free_datablocks(scope, keep=is_cached_material)
+            seconds["cleanup"] = time.perf_counter() - t
+            seconds["total"] = time.perf_counter() - t_file
+
+        logger.info(
+            "[{}/{}] {} '{}' in {:.2f}s.".format(
+                index + 1, len(files), entry["status"], filepath, seconds["total"]
+            )
+        )
+
+    if summary_path is not None:
+        with open(str(summary_path), "w") as f:
+            json.dump(
+                {
+                    "setup_seconds": t_setup,
+                    "total_seconds": time.perf_counter() - t_start,
+                    "files": summary,
+                },
+                f,
+                indent=2,
+            )
+    return summary
@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the add_* entry points and create_mesh.
+
+Every (case, size) is timed separately: creation time (the add_* call), the
+peak memory of the process and the CPU render time at a fixed, low sample
+count. By default each case runs in a fresh blender process, so the peak
+memory belongs to that case alone. Results are written as JSON; compare them
+with compare_benchmarks to spot regressions between versions.
+
+Sizes are numbers of elements: points (point_cloud), occupied voxels (voxels,
+voxel_list), arrows (flow_mesh), wireframe triangles (boxes) and triangles
+(create_mesh).
+"""
+
+import datetime
+import json
+import logging
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import numpy as np
+
+from .box_geometry import num_tube_triangles_per_box
+from .bpy_helper import needs_bpy_bmesh
+from .datablocks import datablock_scope, free_datablocks
+from .mesh import create_mesh
+from .particles import (
+    add_boxes,
+    add_flow_mesh,
+    add_point_cloud,
+    add_voxel_list,
+    add_voxels,
+)
+from .profiling import _peak_rss_mb
+from .recording_bpy import get_recorder
+from .render_stage import apply_render_settings, render_camera
+from .scene_setup import add_cameras_default, is_cached_world, setup_scene
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+BENCHMARK_MESSAGE_PREFIX = "@blender_kitti_benchmark "
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+DEFAULT_RENDER_SAMPLES = 16
+DEFAULT_RENDER_RESOLUTION = (640, 360)
+
+_WORKER_EXPR = "import blender_kitti.benchmark as b; b.worker_main()"
+
+
+def _random_points(rng, size: int) -> np.ndarray:
+    points = rng.uniform(-20.0, 20.0, size=(size, 3))
+    points[:, 2] *= 0.1
+    return points.astype(np.float32)
+
+
+def _random_colors(rng, size: int) -> np.ndarray:
+    return rng.randint(0, 256, size=(size, 3)).astype(np.uint8)
+
+
+def _grid_shape(size: int) -> (int, int, int):
+    # grids with 25% occupancy, flat like the kitti voxel grids
+    side = int(np.ceil((4 * size / 8) ** 0.5))
+    return side, side, 8
+
+
+def _occupied_indices(rng, size: int, shape) -> np.ndarray:
+    return np.sort(rng.choice(int(np.prod(shape)), size=size, replace=False))
+
+
+def _case_point_cloud(rng, size: int):
+    points = _random_points(rng, size)
+    colors = _random_colors(rng, size)
+    return lambda scene: add_point_cloud(scene, points=points, colors=colors)
+
+
+def _case_voxels(rng, size: int):
+    shape = _grid_shape(size)
+    voxels = np.zeros(shape, dtype=bool)
+    voxels.reshape(-1)[_occupied_indices(rng, size, shape)] = True
+    colors = rng.randint(0, 256, size=shape + (3,)).astype(np.uint8)
+    return lambda scene: add_voxels(scene, voxels=voxels, colors=colors)
+
+
+def _case_voxel_list(rng, size: int):
+    shape = _grid_shape(size)
+    indices = _occupied_indices(rng, size, shape)
+    colors = _random_colors(rng, size)
+    return lambda scene: add_voxel_list(
+        indices=indices,
+        grid_shape=np.asarray(shape),
+        grid_origin=np.asarray([-20.0, -20.0, -1.0]),
+        voxel_size=np.asarray([40.0 / shape[0]]),
+        colors=colors,
+        scene=scene,
+    )
+
+
+def _case_flow_mesh(rng, size: int):
+    points = _random_points(rng, size)
+    flow = rng.normal(scale=0.5, size=(size, 3)).astype(np.float32)
+    colors = rng.uniform(size=(size, 4)).astype(np.float32)
+    return lambda scene: add_flow_mesh(
+        point_cloud=points, flow=flow, colors_rgba=colors, scene=scene
+    )
+
+
+def _case_boxes(rng, size: int):
+    num_boxes = max(1, size // num_tube_triangles_per_box())
+    boxes = {
+        "pos": _random_points(rng, num_boxes),
+        "dims": rng.uniform(0.5, 4.0, size=(num_boxes, 3)),
+        "rot": rng.uniform(-np.pi, np.pi, size=(num_boxes, 1)),
+    }
+    colors = rng.uniform(size=(num_boxes, 4))
+    return lambda scene: add_boxes(scene=scene, boxes=boxes, box_colors_rgba_f64=colors)
+
+
+def _case_create_mesh(rng, size: int):
+    # regular grid of squares (two triangles each) with a bit of noise
+    n = int(np.ceil((size / 2) ** 0.5))
+    x, y = np.meshgrid(np.linspace(-20.0, 20.0, n + 1), np.linspace(-20.0, 20.0, n + 1))
+    vertices = np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=-1)
+    vertices[:, 2] = rng.normal(scale=0.05, size=x.size)
+    i = np.arange(n * (n + 1)).reshape(n, n + 1)[:, :-1].ravel()
+    triangles = np.concatenate(
+        [
+            np.stack([i, i + 1, i + n + 2], axis=-1),
+            np.stack([i, i + n + 2, i + n + 1], axis=-1),
+        ]
+    )[:size]
+    colors = _random_colors(rng, vertices.shape[0])
+
+    @needs_bpy_bmesh()
+    def call(scene, *, bpy):
+        mesh, _, _ = create_mesh(
+            vertices,
+            triangles,
+            vertex_colors={"color": colors},
+            name="benchmark_mesh",
+        )
+        obj = bpy.data.objects.new("benchmark_mesh", mesh)
+        scene.collection.objects.link(obj)
+        return obj
+
+    return call
+
+
+BENCHMARK_CASES = {
+    "add_point_cloud": _case_point_cloud,
+    "add_voxels": _case_voxels,
+    "add_voxel_list": _case_voxel_list,
+    "add_flow_mesh": _case_flow_mesh,
+    "add_boxes": _case_boxes,
+    "create_mesh": _case_create_mesh,
+}
+
+
+def _current_rss_mb() -> typing.Optional[float]:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+@needs_bpy_bmesh()
+def _environment(*, bpy) -> {str: typing.Any}:
+    return {
+        "blender": bpy.app.version_string,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_case(
+    case: str,
+    size: int,
+    *,
+    render: bool = True,
+    render_samples: int = DEFAULT_RENDER_SAMPLES,
+    render_resolution=DEFAULT_RENDER_RESOLUTION,
+    render_threads: int = None,
+    seed: int = 0,
+) -> {str: typing.Any}:
+    """Run one benchmark case in this blender process.
+
+    Peak memory is the peak of the whole process. When several cases run in the
+    same process, only the first one (or a larger one) shows its own peak.
+    With the bpy stand-in (see recording_bpy) installed, the recorded calls and
+    buffer sizes are added to the result instead of a render time.
+    """
+    recorder = get_recorder()
+    if recorder is not None:
+        render = False
+    make_call = BENCHMARK_CASES[case]
+    call = make_call(np.random.RandomState(seed), size)
+
+    # cases can run one after the other in the same process
+    name = "benchmark_{}_{}".format(case, size)
+    with datablock_scope(name) as scope:
+        scene = setup_scene(name)
+        camera, _ = add_cameras_default(scene)
+
+        if recorder is not None:
+            recorder.reset()
+        rss_before = _current_rss_mb()
+        t_wall = time.perf_counter()
+        t_cpu = time.process_time()
+        call(scene)
+        result = {
+            "case": case,
+            "size": size,
+            "create_s": time.perf_counter() - t_wall,
+            "create_cpu_s": time.process_time() - t_cpu,
+            "rss_before_mb": rss_before,
+            "rss_after_create_mb": _current_rss_mb(),
+        }
+        if recorder is not None:
+            result["bpy"] = recorder.report()
+
+        if render:
+            scene.cycles.device = "CPU"
+            if hasattr(scene.cycles, "use_denoising"):
+                scene.cycles.use_denoising = False
+            apply_render_settings(
+                scene,
+                {
+                    "resolution": render_resolution,
+                    "resolution_percentage": 100,
+                    "samples": render_samples,
+                    # fixed sample count
+                    "adaptive_threshold": 0.0,
+                    "time_limit": None,
+                    "threads": render_threads,
+                    "persistent_data": False,
+                },
+            )
+            with tempfile.TemporaryDirectory() as tmp:
+                t_wall = time.perf_counter()
+                render_camera(scene, camera, pathlib.Path(tmp) / "render.png")
+                result["render_s"] = time.perf_counter() - t_wall
+            result["render_samples"] = render_samples
+            result["render_resolution"] = list(render_resolution)
+
+    result["peak_rss_mb"] = _peak_rss_mb()
+    # the HDR world is shared by the cases
+    free_datablocks(scope, keep=is_cached_world)
+    return result
+
+
+def worker_main(argv: [str] = None):
+    """Entry point of an isolated benchmark process (inside blender). The case
+    options are passed as JSON after '--' on the blender command line.
+    """
+    if argv is None:
+        argv = sys.argv
+    options = json.loads(argv[argv.index("--") + 1])
+    try:
+        result = run_case(**options)
+    except Exception as e:
+        result = {
+            "case": options["case"],
+            "size": options["size"],
+            "error": "{}: {}".format(type(e).__name__, e),
+        }
+    sys.stdout.write(BENCHMARK_MESSAGE_PREFIX + json.dumps(result) + "\n")
+    sys.stdout.flush()
+
+
+def _run_isolated(blender: str, options: {str: typing.Any}) -> {str: typing.Any}:
+    command = [
+        blender,
+        "--background",
+        "--factory-startup",
+        "--python-expr",
+        _WORKER_EXPR,
+        "--",
+        json.dumps(options),
+    ]
+    process = subprocess.run(
+        command, stdout=subprocess.PIPE, universal_newlines=True, check=False
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith(BENCHMARK_MESSAGE_PREFIX):
+            return json.loads(line[len(BENCHMARK_MESSAGE_PREFIX) :])
+    return {
+        "case": options["case"],
+        "size": options["size"],
+        "error": "Benchmark process exited with {}.".format(process.returncode),
+    }
+
+
+@needs_bpy_bmesh(default_return="blender")
+def _blender_binary(*, bpy):
+    return bpy.app.binary_path
+
+
+def run_benchmarks(
+    cases: typing.Iterable[str] = None,
+    sizes: typing.Iterable[int] = DEFAULT_SIZES,
+    *,
+    output_path: str = None,
+    isolate: bool = True,
+    blender: str = None,
+    label: str = None,
+    **case_options,
+) -> {str: typing.Any}:
+    """Run all (case, size) combinations.
+
+    :param cases: names of BENCHMARK_CASES (default: all)
+    :param isolate: run each case in a fresh blender process
+    :param blender: blender binary for isolated runs (default: the running one)
+    :param label: stored with the results, e.g. a version or commit
+    :param case_options: passed to run_case (render, render_samples, ...)
+    :return: results dict (also written as JSON to output_path)
+    """
+    if cases is None:
+        cases = list(BENCHMARK_CASES)
+    unknown = [c for c in cases if c not in BENCHMARK_CASES]
+    if unknown:
+        raise ValueError("Unknown benchmark cases: {}.".format(unknown))
+    if isolate and blender is None:
+        blender = _blender_binary()
+
+    results = []
+    for case in cases:
+        for size in sizes:
+            options = dict(case_options, case=case, size=int(size))
+            if isolate:
+                result = _run_isolated(blender, options)
+            else:
+                result = run_case(**options)
+            if "error" in result:
+                logger.warning(
+                    "Benchmark {} ({}) failed: {}".format(case, size, result["error"])
+                )
+            else:
+                logger.info(
+                    "Benchmark {} ({}): create {:.2f}s, render {}, peak {} MB.".format(
+                        case,
+                        size,
+                        result["create_s"],
+                        (
+                            "{:.2f}s".format(result["render_s"])
+                            if "render_s" in result
+                            else "-"
+                        ),
+                        (
+                            "{:.0f}".format(result["peak_rss_mb"])
+                            if result["peak_rss_mb"] is not None
+                            else "-"
+                        ),
+                    )
+                )
+            results.append(result)
+
+    summary = {
+        "label": label,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "isolated": isolate,
+        "stand_in": get_recorder() is not None,
+        "environment": _environment(),
+        "results": results,
+    }
+    if output_path is not None:
+        with open(str(output_path), "w") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+def compare_benchmarks(
+    baseline: {str: typing.Any},
+    current: {str: typing.Any},
+    tolerance: float = 0.1,
+    keys: typing.Iterable[str] = ("create_s", "render_s", "peak_rss_mb"),
+) -> [{str: typing.Any}]:
+    """Measurements of current that are more than tolerance (relative) above the
+    baseline. Both are results dicts of run_benchmarks (or loaded JSON files).
+    """
+    reference = {(r["case"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = reference.get((r["case"], r["size"]))
+        if b is None:
+            continue
+        for k in keys:
+            if b.get(k) is None or r.get(k) is None or b[k] <= 0.0:
+                continue
+            change = r[k] / b[k] - 1.0
+            if change > tolerance:
+                regressions.append(
+                    {
+                        "case": r["case"],
+                        "size": r["size"],
+                        "measurement": k,
+                        "baseline": b[k],
+                        "current": r[k],
+                        "change": change,
+                    }
+                )
+    return regressions
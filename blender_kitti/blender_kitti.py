@@ -4,18 +4,35 @@
 """
 import typing
 import logging
-import re
 import pathlib
+import hashlib
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
 from collections import defaultdict
 from ruamel.yaml import YAML
 
-from .particles import add_point_cloud, add_voxels, add_voxel_list
-from .mesh import add_object_from_mesh
+from .particles import (
+    add_point_cloud,
+    add_voxels,
+    add_voxel_list,
+    add_flow_mesh,
+    prepare_point_cloud,
+    prepare_voxels,
+    prepare_voxel_list,
+    prepare_flow_mesh,
+)
+from .mesh import add_object_from_mesh, prepare_mesh
 from .scene_setup import setup_scene
 from .object_spotlight import add_spotlight_ground
+from .bpy_helper import needs_bpy_bmesh
+from .datablocks import add_free_callback, datablock_scope, is_removed
+from .lazy_npz import open_npz, load_value
+from .data_inspect import global_config_key, regex_key
+from .profiling import stage
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -27,33 +44,222 @@ handler.setFormatter(formatter)
 handler.setLevel(logging.INFO)
 logger.addHandler(handler)
 
-"""
-TYPE+INSTANCE_NAME+ARG_NAME/OPTIONAL_DICT_KEY
-e.g. 'point_cloud+some_name+points
-e.g. 'mesh+some_name+vertices
-e.g. 'mesh+some_name+vertex_colors/semantics
-"""
-regex_key = re.compile(
-    r"([a-zA-Z0-9_-]+)\+([a-zA-Z0-9_-]+)\+([a-zA-Z0-9_-]+)(?:\/([a-zA-Z0-9_-]+))?"
-)
-
-global_config_key = "config"
 data_structures = {
     "point_cloud": add_point_cloud,
     "voxels": add_voxels,
     "voxel_list": add_voxel_list,
     "mesh": add_object_from_mesh,
+    "flow": add_flow_mesh,
 }
 
+# task function -> numpy-only prepare function that returns the task arguments
+# (with 'prepared' data) for the task function. Prepare functions do not touch
+# bpy and run in worker threads.
+task_preparers = {
+    add_point_cloud: prepare_point_cloud,
+    add_voxels: prepare_voxels,
+    add_voxel_list: prepare_voxel_list,
+    add_object_from_mesh: prepare_mesh,
+    add_flow_mesh: prepare_flow_mesh,
+}
+
+
+# task content hash -> (created object, task result)
+_content_cache = {}
+
+# task arguments that do not influence the created datablocks
+_hash_ignored_args = {"name_prefix", "scene", "prepared"}
+
+
+def _update_hash(h, value):
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        h.update("{}{}".format(value.dtype.str, value.shape).encode("utf-8"))
+        h.update(np.ascontiguousarray(value).reshape((-1)).view(np.uint8))
+    elif isinstance(value, dict):
+        h.update(b"{")
+        for k in sorted(value.keys(), key=str):
+            h.update(repr(k).encode("utf-8"))
+            _update_hash(h, value[k])
+        h.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        h.update(b"[")
+        for v in value:
+            _update_hash(h, v)
+        h.update(b"]")
+    else:
+        h.update(repr(value).encode("utf-8"))
+
+
+def hash_task(task_f, task_kwargs: {str: typing.Any}) -> str:
+    """Content hash of a task: the task function and all of its data arguments."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update("{}.{}".format(task_f.__module__, task_f.__name__).encode("utf-8"))
+    _update_hash(
+        h, {k: v for k, v in task_kwargs.items() if k not in _hash_ignored_args}
+    )
+    return h.hexdigest()
 
-def add_objects_from_data(tasks: {str: typing.Any}, scene):
+
+def _result_object(result):
+    obj = result[0] if isinstance(result, tuple) else result
+    return obj if hasattr(obj, "copy") and hasattr(obj, "children") else None
+
+
+@needs_bpy_bmesh()
+def _link_duplicate(obj, scene, name: str, parent=None, *, bpy):
+    """New object (and child objects) that share the data of obj."""
+    duplicate = obj.copy()
+    duplicate.name = name
+    duplicate.parent = parent
+    for i, child in enumerate(obj.children):
+        _link_duplicate(child, scene, "{}_child_{}".format(name, i), duplicate)
+    if scene is not None:
+        scene.collection.objects.link(duplicate)
+    return duplicate
+
+
+def _forget_removed_results():
+    """Remove the cache entries whose objects have been removed."""
+    for digest, (obj, _result) in list(_content_cache.items()):
+        if is_removed(obj):
+            del _content_cache[digest]
+
+
+# freed scopes may contain cached objects
+add_free_callback(_forget_removed_results)
+
+
+@needs_bpy_bmesh()
+def _reuse_cached_result(digest: str, task_kwargs, *, bpy):
+    try:
+        obj, result = _content_cache[digest]
+    except KeyError:
+        return None
+    # the object itself, not one with the same name: a removed object's name can
+    # be taken by an object with other data
+    if is_removed(obj):
+        del _content_cache[digest]
+        return None
+
+    name = "{}_obj_linked".format(task_kwargs.get("name_prefix", obj.name))
+    duplicate = _link_duplicate(obj, task_kwargs["scene"], name)
+    if isinstance(result, tuple):
+        return (duplicate,) + tuple(result[1:])
+    return duplicate
+
+
+def _prepare_task(task, cache=None, digest: str = None):
+    task_f, task_kwargs = task
+    try:
+        preparer = task_preparers.get(task_f)
+        if preparer is None:
+            return task_kwargs, None
+        # same TypeError as calling the task with wrong arguments
+        inspect.signature(task_f).bind(**task_kwargs)
+
+        with stage("prepare", task=task_kwargs.get("name_prefix")) as s:
+            if cache is None:
+                return preparer(**task_kwargs), None
+
+            if digest is None:
+                digest = hash_task(task_f, task_kwargs)
+            prepared = cache.get(digest)
+            if prepared is not None:
+                s.count("cache_hits")
+                return dict(task_kwargs, prepared=prepared), None
+            task_kwargs = preparer(**task_kwargs)
+            cache.put(digest, task_kwargs["prepared"])
+            return task_kwargs, None
+    except Exception as e:
+        # raised on the main thread when the task is committed
+        return None, e
+
+
+def prepare_tasks(tasks, num_workers: int = None, cache=None, digests=None):
+    """Run the numpy part of all tasks in a thread pool.
+
+    :param cache: PreparedCache to read prepared data from and write it to
+    :param digests: known task hashes (see hash_task) by instance name
+    :return: instance name -> (task arguments, exception or None)
+    """
+    if digests is None:
+        digests = {}
+    args = [(task, cache, digests.get(k)) for k, task in tasks.items()]
+
+    if num_workers is None:
+        num_workers = min(len(tasks), os.cpu_count() or 1)
+    if num_workers <= 1 or len(tasks) <= 1:
+        prepared = [_prepare_task(*a) for a in args]
+        return dict(zip(tasks.keys(), prepared))
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        prepared = pool.map(lambda a: _prepare_task(*a), args)
+        return dict(zip(tasks.keys(), prepared))
+
+
+def add_objects_from_data(
+    tasks: {str: typing.Any},
+    scene,
+    dedup: bool = True,
+    num_workers: int = None,
+    cache=None,
+):
+    """Run the given tasks in two phases: the numpy preparation of all tasks (see
+    task_preparers) runs in worker threads, then the blender objects are created
+    one after another on the calling thread.
+
+    :param dedup: Tasks with the same function and the same data as an earlier task
+        (also from an earlier call) do not create new meshes, images and materials.
+        Instead, a new object that links to the existing data is added to the scene.
+    :param num_workers: number of preparation threads (default: one per cpu)
+    :param cache: PreparedCache. Prepared data of tasks that were prepared before
+        (also in an earlier process) is memory mapped from disk instead.
+    """
 
     results = {}
+    pending = {}
+    digests = {}
     for instance_name, (task_f, task_kwargs) in tasks.items():
         if "scene" not in task_kwargs:
             task_kwargs["scene"] = scene
+        for k, v in task_kwargs.items():
+            task_kwargs[k] = load_value(v)
         try:
-            results[instance_name] = task_f(**task_kwargs)
+            if dedup:
+                digest = hash_task(task_f, task_kwargs)
+                result = _reuse_cached_result(digest, task_kwargs)
+                if result is not None:
+                    logger.info(
+                        "Reusing data with identical content for '{}'.".format(
+                            instance_name
+                        )
+                    )
+                    results[instance_name] = result
+                    continue
+                digests[instance_name] = digest
+        except ImportError:
+            logger.warning(
+                "Imports for '{}' unavailable. Ignoring task.".format(instance_name)
+            )
+            continue
+        pending[instance_name] = (task_f, task_kwargs)
+
+    prepared = prepare_tasks(pending, num_workers, cache, digests)
+
+    for instance_name, (task_f, _task_kwargs) in pending.items():
+        task_kwargs, error = prepared[instance_name]
+        try:
+            if error is not None:
+                raise error
+
+            with stage("upload", task=instance_name), datablock_scope(
+                instance_name, nested_only=True
+            ):
+                results[instance_name] = task_f(**task_kwargs)
+
+            obj = _result_object(results[instance_name])
+            digest = digests.get(instance_name)
+            if digest is not None and obj is not None:
+                _content_cache[digest] = (obj, results[instance_name])
         except ImportError:
             logger.warning(
                 "Imports for '{}' unavailable. Ignoring task.".format(instance_name)
@@ -105,14 +311,15 @@ def make_scene(
     if "scene_name" in config:
         scene_name = config["scene_name"]
 
-    scene = setup_scene(name=scene_name, use_background_image=use_background_image)
-    scene_maker(scene, config)
+    with datablock_scope(scene_name, nested_only=True):
+        scene = setup_scene(name=scene_name, use_background_image=use_background_image)
+        scene_maker(scene, config)
     return scene
 
 
 def extract_config_from_data(data) -> dict:
     try:
-        conf = data[global_config_key]
+        conf = load_value(data[global_config_key])
         conf = bytes(conf).decode("utf-8")
         yaml = YAML(typ="safe")
         return yaml.load(conf)
@@ -120,12 +327,48 @@ def extract_config_from_data(data) -> dict:
         return {}
 
 
-def extract_data_tasks_from_file(
-    filepath: str,
+def load_task_data(tasks):
+    """Read the array payloads of all (lazily extracted) tasks."""
+    with stage("load") as s:
+        for _task_f, task_kwargs in tasks.values():
+            for k, v in task_kwargs.items():
+                task_kwargs[k] = load_value(v)
+                if isinstance(task_kwargs[k], np.ndarray):
+                    s.count("bytes", task_kwargs[k].nbytes)
+    return tasks
+
+
+def filter_tasks(tasks, whitelist=None, data_types=None):
+    """Only keep tasks whose instance name is in whitelist and whose type is in
+    data_types (see data_structures). None keeps everything.
+    """
+    task_functions = None
+    if data_types is not None:
+        task_functions = {data_structures[t] for t in data_types}
+    if whitelist is not None:
+        whitelist = set(whitelist)
+    return {
+        k: v
+        for k, v in tasks.items()
+        if (whitelist is None or k in whitelist)
+        and (task_functions is None or v[0] in task_functions)
+    }
+
+
+def extract_data_tasks_from_arrays(
+    data: {str: typing.Any},
+    default_file_desc: str,
+    *,
+    whitelist=None,
+    data_types=None,
+    load: bool = True,
 ) -> {str: (typing.Callable, {str: typing.Any})}:
-    logger.info("Processing data file '{}'.".format(filepath))
-    data = np.load(filepath)
+    """Build tasks from a mapping 'TYPE+INSTANCE_NAME+ARG_NAME' -> array.
 
+    Values may be LazyArrays. Filters are applied on the key names, so only the
+    payloads of the remaining tasks are read (and only with load=True, otherwise
+    see load_task_data).
+    """
     global_config = extract_config_from_data(data)
 
     def filter_fn(x):
@@ -133,9 +376,17 @@ def extract_data_tasks_from_file(
             logger.warning("Ignoring unknown entry key '{}'.".format(x[0]))
         return x[1] is not None
 
+    if whitelist is not None:
+        whitelist = set(whitelist)
+
     matches = [(x, regex_key.fullmatch(x)) for x in data.keys()]
     matches = list(filter(filter_fn, matches))
-    matches = [(data[x[0]], x[1].groups()) for x in matches]
+    matches = [
+        (data[x[0]], x[1].groups())
+        for x in matches
+        if (whitelist is None or x[1].group(2) in whitelist)
+        and (data_types is None or x[1].group(1) in data_types)
+    ]
 
     x = defaultdict(lambda: defaultdict(dict))
     for d, key in matches:
@@ -153,7 +404,7 @@ def extract_data_tasks_from_file(
     try:
         file_desc = global_config["file_desc"]
     except KeyError:
-        file_desc = pathlib.Path(filepath).stem
+        file_desc = default_file_desc
         global_config["file_desc"] = file_desc
 
     tasks = {}
@@ -177,10 +428,35 @@ def extract_data_tasks_from_file(
         kwargs = task[1]
         try:
             yaml = YAML(typ="safe")
-            kwargs["config"] = yaml.load(kwargs["config"])
+            kwargs["config"] = yaml.load(load_value(kwargs["config"]))
         except KeyError:
             pass
         return task
 
     tasks = {k: m(v) for k, v in tasks.items()}
+    if load:
+        load_task_data(tasks)
     return tasks, global_config
+
+
+def extract_data_tasks_from_file(
+    filepath: str,
+    *,
+    whitelist=None,
+    data_types=None,
+    load: bool = True,
+) -> {str: (typing.Callable, {str: typing.Any})}:
+    """Tasks of an .npz file. Only key names and array headers are parsed before
+    filtering. Array payloads are read for the remaining tasks only (with
+    load=False: not before load_task_data or running the tasks). Uncompressed
+    arrays are memory mapped.
+    """
+    logger.info("Processing data file '{}'.".format(filepath))
+    data = open_npz(filepath)
+    return extract_data_tasks_from_arrays(
+        data,
+        pathlib.Path(filepath).stem,
+        whitelist=whitelist,
+        data_types=data_types,
+        load=load,
+    )
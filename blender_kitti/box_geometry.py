@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Numpy-only geometry for (oriented) bounding boxes.
+
+Boxes are described by their center position, their full edge lengths (dims) and a
+rotation. The rotation can be given per box as
+
+* yaw angle: shape [N] or [N, 1]
+* euler angles (XYZ): shape [N, 3]
+* quaternion (w, x, y, z): shape [N, 4]
+* rotation matrix: shape [N, 3, 3]
+"""
+import numpy as np
+
+
+# corners of the unit cube [-1, 1]^3 in binary order (x is the fastest axis)
+_UNIT_CUBE_CORNERS = np.array(
+    [[x, y, z] for z in (-1.0, 1.0) for y in (-1.0, 1.0) for x in (-1.0, 1.0)],
+    dtype=np.float64,
+)
+
+# triangles of the unit cube with outward facing normals
+_UNIT_CUBE_TRIANGLES = np.array(
+    [
+        [0, 2, 3],
+        [0, 3, 1],
+        [4, 5, 7],
+        [4, 7, 6],
+        [0, 1, 5],
+        [0, 5, 4],
+        [2, 6, 7],
+        [2, 7, 3],
+        [0, 4, 6],
+        [0, 6, 2],
+        [1, 3, 7],
+        [1, 7, 5],
+    ],
+    dtype=np.int32,
+)
+
+# the twelve edges of a box as pairs of corner indices
+BOX_EDGES = np.array(
+    [
+        [0, 1],
+        [2, 3],
+        [4, 5],
+        [6, 7],
+        [0, 2],
+        [1, 3],
+        [4, 6],
+        [5, 7],
+        [0, 4],
+        [1, 5],
+        [2, 6],
+        [3, 7],
+    ],
+    dtype=np.int32,
+)
+
+
+def _rotation_matrices_from_yaw(yaw: np.ndarray) -> np.ndarray:
+    c = np.cos(yaw)
+    s = np.sin(yaw)
+    r = np.zeros(yaw.shape + (3, 3), dtype=np.float64)
+    r[:, 0, 0] = c
+    r[:, 0, 1] = -s
+    r[:, 1, 0] = s
+    r[:, 1, 1] = c
+    r[:, 2, 2] = 1.0
+    return r
+
+
+def _rotation_matrices_from_euler_xyz(euler: np.ndarray) -> np.ndarray:
+    # same convention as blender's 'XYZ' rotation mode: R = Rz @ Ry @ Rx
+    cx, cy, cz = np.cos(euler).T
+    sx, sy, sz = np.sin(euler).T
+    r = np.empty((euler.shape[0], 3, 3), dtype=np.float64)
+    r[:, 0, 0] = cy * cz
+    r[:, 0, 1] = sx * sy * cz - cx * sz
+    r[:, 0, 2] = cx * sy * cz + sx * sz
+    r[:, 1, 0] = cy * sz
+    r[:, 1, 1] = sx * sy * sz + cx * cz
+    r[:, 1, 2] = cx * sy * sz - sx * cz
+    r[:, 2, 0] = -sy
+    r[:, 2, 1] = sx * cy
+    r[:, 2, 2] = cx * cy
+    return r
+
+
+def _rotation_matrices_from_quaternions(quat: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(quat, axis=-1, keepdims=True)
+    if np.any(norm == 0.0):
+        raise ValueError("Quaternions may not have length zero.")
+    w, x, y, z = (quat / norm).T
+    r = np.empty((quat.shape[0], 3, 3), dtype=np.float64)
+    r[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    r[:, 0, 1] = 2.0 * (x * y - z * w)
+    r[:, 0, 2] = 2.0 * (x * z + y * w)
+    r[:, 1, 0] = 2.0 * (x * y + z * w)
+    r[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    r[:, 1, 2] = 2.0 * (y * z - x * w)
+    r[:, 2, 0] = 2.0 * (x * z - y * w)
+    r[:, 2, 1] = 2.0 * (y * z + x * w)
+    r[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    return r
+
+
+def box_rotation_matrices(rotation: np.ndarray, num_boxes: int) -> np.ndarray:
+    """Convert any supported box rotation format to rotation matrices [N, 3, 3]."""
+    rotation = np.asarray(rotation, dtype=np.float64)
+    if rotation.ndim == 3 and rotation.shape[1:] == (3, 3):
+        r = rotation
+    elif rotation.ndim == 2 and rotation.shape[1] == 4:
+        r = _rotation_matrices_from_quaternions(rotation)
+    elif rotation.ndim == 2 and rotation.shape[1] == 3:
+        r = _rotation_matrices_from_euler_xyz(rotation)
+    elif rotation.ndim == 1 or (rotation.ndim == 2 and rotation.shape[1] == 1):
+        r = _rotation_matrices_from_yaw(rotation.reshape((-1,)))
+    else:
+        raise ValueError(
+            "Cannot handle box rotations with shape {}.".format(rotation.shape)
+        )
+
+    if r.shape[0] != num_boxes:
+        raise ValueError(
+            "Got {} box rotations for {} boxes.".format(r.shape[0], num_boxes)
+        )
+    return r
+
+
+def box_corners(
+    positions: np.ndarray, dims: np.ndarray, rotation: np.ndarray
+) -> np.ndarray:
+    """Corners of the given boxes with shape [N, 8, 3]."""
+    positions = np.asarray(positions, dtype=np.float64).reshape((-1, 3))
+    dims = np.asarray(dims, dtype=np.float64).reshape((-1, 3))
+    r = box_rotation_matrices(rotation, positions.shape[0])
+
+    corners_local = _UNIT_CUBE_CORNERS[None, ...] * (0.5 * dims)[:, None, :]
+    return np.einsum("nij,nkj->nki", r, corners_local) + positions[:, None, :]
+
+
+def box_wireframe_edges(
+    positions: np.ndarray, dims: np.ndarray, rotation: np.ndarray
+) -> (np.ndarray, np.ndarray):
+    """Box outlines as plain edge geometry.
+
+    :return: vertices [N * 8, 3] (float32) and edges [N * 12, 2] (int32)
+    """
+    corners = box_corners(positions, dims, rotation)
+    num_boxes = corners.shape[0]
+    offsets = (np.arange(num_boxes, dtype=np.int32) * 8)[:, None, None]
+    edges = (BOX_EDGES[None, ...] + offsets).reshape((-1, 2))
+    return corners.reshape((-1, 3)).astype(np.float32), edges
+
+
+def box_wireframe_tubes(
+    positions: np.ndarray,
+    dims: np.ndarray,
+    rotation: np.ndarray,
+    thickness: float,
+) -> (np.ndarray, np.ndarray):
+    """Box outlines as renderable geometry, one square beam per box edge.
+
+    Each beam is a cuboid with the given thickness, centered on its box edge and
+    extended by half the thickness at both ends so that the beams close the corners.
+
+    :return: vertices [N * 12 * 8, 3] (float32) and triangles [N * 12 * 12, 3] (int32)
+    """
+    positions = np.asarray(positions, dtype=np.float64).reshape((-1, 3))
+    dims = np.asarray(dims, dtype=np.float64).reshape((-1, 3))
+    num_boxes = positions.shape[0]
+    r = box_rotation_matrices(rotation, num_boxes)
+
+    half_dims = 0.5 * dims
+    half_thickness = 0.5 * thickness
+
+    # every box edge is parallel to one of the local box axes. The beam of an edge
+    # is therefore axis aligned in the local box frame.
+    beam_axis = np.repeat(np.arange(3), 4)
+    corner_a = _UNIT_CUBE_CORNERS[BOX_EDGES[:, 0]]
+    corner_b = _UNIT_CUBE_CORNERS[BOX_EDGES[:, 1]]
+    # sign pattern of the beam center: zero along the beam axis
+    center_signs = 0.5 * (corner_a + corner_b)
+
+    # [N, 12, 3]
+    beam_centers = center_signs[None, ...] * half_dims[:, None, :]
+    beam_half_extents = np.full((num_boxes, 12, 3), half_thickness, dtype=np.float64)
+    beam_half_extents[:, np.arange(12), beam_axis] += half_dims[:, beam_axis]
+
+    # [N, 12, 8, 3]
+    vertices_local = (
+        beam_centers[:, :, None, :]
+        + _UNIT_CUBE_CORNERS[None, None, ...] * beam_half_extents[:, :, None, :]
+    )
+    vertices = np.einsum("nij,nbkj->nbki", r, vertices_local)
+    vertices += positions[:, None, None, :]
+
+    offsets = (np.arange(num_boxes * 12, dtype=np.int32) * 8)[:, None, None]
+    triangles = (_UNIT_CUBE_TRIANGLES[None, ...] + offsets).reshape((-1, 3))
+    return vertices.reshape((-1, 3)).astype(np.float32), triangles
+
+
+def num_tube_triangles_per_box() -> int:
+    return 12 * _UNIT_CUBE_TRIANGLES.shape[0]
@@ -29,6 +29,33 @@ try:
 except ImportError:
     mathutils = None
 
+# modules passed to functions decorated with needs_bpy_bmesh
+_modules = {"bpy": bpy, "bmesh": bmesh, "mathutils": mathutils}
+
+
+class _Module:
+    """Default value of the bpy/bmesh/mathutils kw-only args. Resolved to the
+    current module when the function is called.
+    """
+
+    def __repr__(self):
+        return "<blender module>"
+
+
+_MODULE = _Module()
+
+
+def set_bpy_modules(**modules):
+    """Replace bpy, bmesh and/or mathutils for all functions decorated with
+    needs_bpy_bmesh (e.g. with a stand-in, see recording_bpy).
+    """
+    unknown = set(modules) - set(_modules)
+    if unknown:
+        raise ValueError("Unknown modules: {}.".format(sorted(unknown)))
+    _modules.update(modules)
+    globals().update(modules)
+
+
 def needs_bpy_bmesh(
     default_return=None, alternative_func=None, run_anyway: bool = False
 ):
@@ -36,17 +63,15 @@ def needs_bpy_bmesh(
     is not actually available.
     """
 
-    # list modules to look for in kw-only args
-    m = {"bpy": bpy, "bmesh": bmesh, "mathutils": mathutils}
-
     def inner(func):
         argspec = inspect.getfullargspec(func)
         kwonly = set(argspec.kwonlyargs)
         defaults = argspec.kwonlydefaults
 
-        n = {k: v for k, v in m.items() if k in kwonly}
+        # list modules to look for in kw-only args
+        names = [k for k in _modules if k in kwonly]
 
-        if not n:
+        if not names:
             logger.warning(
                 "Neither bpy nor bmesh in kwonly function args of '{}'.".format(
                     func.__name__
@@ -54,38 +79,36 @@ def needs_bpy_bmesh(
             )
 
         if defaults is not None:
-            if any(k in defaults for k in n):
+            if any(k in defaults for k in names):
                 raise RuntimeError("Default value is not allowed.")
 
         def caller(f, *args, **kw):
-            return f(*args, **kw)
-
-        # True if all requested modules are available
-        valid = all(v is not None for v in n.values())
-
-        if valid or run_anyway:
-            decorated = decorate(func, caller)
-
-        else:
-
-            def replacement(_f, *args, **kw):
-                if alternative_func is not None:
-                    return alternative_func(*args, **kw)
-                elif default_return is not None:
-                    return default_return
-                else:
-                    raise ImportError(
-                        "Cannot call '{}' which requires bpy/bmesh.".format(
-                            func.__name__
-                        )
-                    )
-
-            decorated = decorate(func, replacement)
+            for k in names:
+                if kw.get(k) is _MODULE:
+                    kw[k] = _modules[k]
+
+            # True if all requested modules are available
+            if run_anyway or all(kw[k] is not None for k in names):
+                return f(*args, **kw)
+
+            if alternative_func is not None:
+                return alternative_func(*args, **kw)
+            elif default_return is not None:
+                return default_return
+            else:
+                raise ImportError(
+                    "Cannot call '{}' which requires bpy/bmesh.".format(func.__name__)
+                )
 
         # make decorated callable without specifying bpy
+        if func.__kwdefaults__ is None:
+            func.__kwdefaults__ = {}
+        func.__kwdefaults__.update({k: _MODULE for k in names})
+
+        decorated = decorate(func, caller)
         if decorated.__kwdefaults__ is None:
             decorated.__kwdefaults__ = {}
-        decorated.__kwdefaults__.update(n)
+        decorated.__kwdefaults__.update({k: _MODULE for k in names})
         return decorated
 
     return inner
@@ -5,6 +5,7 @@
 """
 
 import click
+import json
 import logging
 import typing
 import pathlib
@@ -15,10 +16,23 @@ from .blender_kitti import (
     add_objects_from_data,
     make_scene,
     extract_data_tasks_from_file,
+    filter_tasks,
+    load_task_data,
 )
 from .system_setup import setup_system
-from .scene_setup import add_cameras_default
 from .bpy_helper import needs_bpy_bmesh
+from .data_inspect import format_report, inspect_file
+from .prepared_cache import prepared_cache_from_config
+from .scene_setup import RENDER_PROFILES
+from .profiling import enable_profiling, stage, write_profile
+from .render_stage import (
+    RENDER_PRESETS,
+    add_cameras_from_config,
+    apply_render_settings,
+    format_output_path,
+    render_settings_from_config,
+    render_views,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -32,7 +46,8 @@ logger.addHandler(handler)
 
 
 def process_file(filename: str, scene=None):
-    tasks, global_config = extract_data_tasks_from_file(filename)
+    with stage("file_load", file=filename):
+        tasks, global_config = extract_data_tasks_from_file(filename)
     if scene is None:
         try:
             scene = make_scene(global_config)
@@ -41,30 +56,43 @@ def process_file(filename: str, scene=None):
             scene, cameras = None, None
 
     try:
-        add_objects_from_data(tasks, scene)
+        with stage("build", file=filename):
+            add_objects_from_data(tasks, scene)
     except ImportError:
         pass
     return scene, global_config
 
 
+def load_render_config(render_config: typing.Union[str, None]) -> dict:
+    """Render config from a YAML file path or a YAML string."""
+    if render_config is None:
+        return {}
+    yaml = YAML(typ="safe")
+    if pathlib.Path(render_config).is_file():
+        with open(render_config, "r") as f:
+            return yaml.load(f) or {}
+    return yaml.load(render_config) or {}
+
+
 def make_scene_from_data_files(render_config: typing.Union[str, None], filenames):
 
-    if render_config is not None:
-        yaml = YAML(typ="safe")
-        config = yaml.load(render_config)
-    else:
-        config = {}
+    config = load_render_config(render_config)
 
     tasks = {}
 
     if isinstance(filenames, str):
         filenames = [filenames]
 
-    for filename in filenames:
-        tasks_from_file, config_from_file = extract_data_tasks_from_file(filename)
-        # Todo check for conflicts and abort if necessary
-        tasks.update(tasks_from_file)
-        config.update(config_from_file)
+    with stage("file_load") as s:
+        for filename in filenames:
+            # only parse keys and headers, payloads are read after filtering
+            tasks_from_file, config_from_file = extract_data_tasks_from_file(
+                filename, data_types=config.get("data_types"), load=False
+            )
+            # Todo check for conflicts and abort if necessary
+            tasks.update(tasks_from_file)
+            config.update(config_from_file)
+            s.count("files")
 
     try:
         scene = make_scene(config)
@@ -74,10 +102,18 @@ def make_scene_from_data_files(render_config: typing.Union[str, None], filenames
 
     if "whitelist" in config:
         # only keep the instances that are in the whitelist
-        instance_whitelist = set(config["whitelist"])
-        tasks = dict((k, v) for k, v in tasks.items() if k in instance_whitelist)
+        tasks = filter_tasks(tasks, whitelist=config["whitelist"])
 
-    add_objects_from_data(tasks, scene)
+    load_task_data(tasks)
+    prepared_cache = prepared_cache_from_config(config)
+    with stage("build"):
+        add_objects_from_data(
+            tasks,
+            scene,
+            dedup=config.get("deduplicate", True),
+            num_workers=config.get("prepare_workers"),
+            cache=prepared_cache,
+        )
 
     # Todo apply config
     try:
@@ -88,6 +124,19 @@ def make_scene_from_data_files(render_config: typing.Union[str, None], filenames
     return scene, config
 
 
+def _with_render_settings(config: dict, **settings):
+    """Override render settings in config (settings that are None are ignored)."""
+    settings = {k: v for k, v in settings.items() if v is not None}
+    if settings:
+        config["render"] = dict(config.get("render") or {}, **settings)
+    return config
+
+
+def _print_inspection(filenames):
+    for filename in filenames:
+        click.echo(format_report(inspect_file(str(filename))))
+
+
 @needs_bpy_bmesh(default_return=None)
 def render_scene(*, bpy):
     bpy.ops.render.render(write_still=True)
@@ -99,13 +148,445 @@ def render_scene(*, bpy):
 @click.option("--python", required=False)
 @click.option("--background/--no-background", required=False)
 @click.option("--render_config", default=None)
+@click.option(
+    "--render_profile",
+    type=click.Choice(RENDER_PROFILES),
+    default=None,
+    help="'final' (cycles) or 'preview' (EEVEE), overrides the render config.",
+)
+@click.option(
+    "--preset",
+    type=click.Choice(sorted(RENDER_PRESETS)),
+    default=None,
+    help="Cycles performance preset, overrides the render config.",
+)
+@click.option(
+    "--output",
+    default=None,
+    help="Output path template with {stem}, {name}, {parent}, {index}, {camera}"
+    " (default: 'output' of the render settings).",
+)
+@click.option("--profile", default=None, help="Write per stage timings as JSON.")
+@click.option(
+    "--dry-run",
+    "dry_run",
+    is_flag=True,
+    help="Only show the tasks and estimated scene memory of the data files.",
+)
 @click.argument("filenames", type=click.Path(exists=True), nargs=-1)
-def render(python, background, render_config: typing.Union[str, None], filenames):
+def render(
+    python,
+    background,
+    render_config: typing.Union[str, None],
+    render_profile,
+    preset,
+    output,
+    profile,
+    dry_run,
+    filenames,
+):
+    """Render all views (cameras) of the render config for the given data files."""
+    if dry_run:
+        _print_inspection(filenames)
+        return
+    if profile is not None:
+        enable_profiling(profile)
+    scene, config = make_scene_from_data_files(render_config, filenames)
+    cameras = add_cameras_from_config(scene, config)
+
+    settings = render_settings_from_config(
+        _with_render_settings(config, profile=render_profile, preset=preset)
+    )
+    apply_render_settings(scene, settings)
+    if output is None:
+        output = settings["output"]
+
+    # fields refer to the first data file
+    filepath = pathlib.Path(filenames[0]) if filenames else pathlib.Path("render")
+    outputs = {name: format_output_path(output, filepath, 0, name) for name in cameras}
+    render_views(scene, cameras, outputs)
+    write_profile()
+
+
+@click.command(
+    context_settings={"ignore_unknown_options": True, "allow_extra_args": True}
+)
+@click.option("--python", required=False)
+@click.option("--background/--no-background", required=False)
+@click.option("--render_config", default=None)
+@click.option(
+    "--render_profile",
+    type=click.Choice(RENDER_PROFILES),
+    default=None,
+    help="'final' (cycles) or 'preview' (EEVEE), overrides the render config.",
+)
+@click.option(
+    "--preset",
+    type=click.Choice(sorted(RENDER_PRESETS)),
+    default=None,
+    help="Cycles performance preset, overrides the render config.",
+)
+@click.option(
+    "--output",
+    default=None,
+    help="Output path template with {stem}, {name}, {parent}, {index}, {camera}"
+    " (default: 'output' of the render settings).",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=True,
+    help="Skip files whose outputs already exist.",
+)
+@click.option("--summary", default=None, help="Write per file timings as JSON.")
+@click.option("--profile", default=None, help="Write per stage timings as JSON.")
+@click.option(
+    "--dry-run",
+    "dry_run",
+    is_flag=True,
+    help="Only show the tasks and estimated scene memory of the data files.",
+)
+@click.argument("inputs", nargs=-1)
+def render_batch(
+    python,
+    background,
+    render_config,
+    render_profile,
+    preset,
+    output,
+    resume,
+    summary,
+    profile,
+    dry_run,
+    inputs,
+):
+    """Render many data files (directories, manifests or glob patterns) in one
+    blender process.
     """
+    from . import batch
+
+    if dry_run:
+        _print_inspection(batch.collect_input_files(inputs))
+        return
+    if profile is not None:
+        enable_profiling(profile)
+    config = _with_render_settings(
+        load_render_config(render_config), profile=render_profile, preset=preset
+    )
+    batch.render_batch(
+        inputs,
+        output,
+        config,
+        skip_existing=resume,
+        summary_path=summary,
+    )
+    write_profile()
+
 
+@click.command(
+    context_settings={"ignore_unknown_options": True, "allow_extra_args": True}
+)
+@click.option("--python", required=False)
+@click.option("--background/--no-background", required=False)
+@click.option("--render_config", default=None)
+@click.option(
+    "--render_profile",
+    type=click.Choice(RENDER_PROFILES),
+    default=None,
+    help="'final' (cycles) or 'preview' (EEVEE), overrides the render config.",
+)
+@click.option(
+    "--preset",
+    type=click.Choice(sorted(RENDER_PRESETS)),
+    default=None,
+    help="Cycles performance preset, overrides the render config.",
+)
+@click.option(
+    "--output",
+    default=None,
+    help="Output path template with {stem}, {name}, {parent}, {index}, {camera}"
+    " (default: 'output' of the render settings).",
+)
+@click.option("--workers", default=2, show_default=True, help="Blender processes.")
+@click.option(
+    "--threads", default=None, type=int, help="Threads per worker (cpus / workers)."
+)
+@click.option("--blender", default=None, help="Blender binary for the workers.")
+@click.option("--max_restarts", default=3, show_default=True)
+@click.option(
+    "--resume/--no-resume",
+    default=True,
+    help="Skip views whose outputs already exist.",
+)
+@click.option("--summary", default=None, help="Write jobs and throughput as JSON.")
+@click.argument("inputs", nargs=-1)
+def render_farm(
+    python,
+    background,
+    render_config,
+    render_profile,
+    preset,
+    output,
+    workers,
+    threads,
+    blender,
+    max_restarts,
+    resume,
+    summary,
+    inputs,
+):
+    """Render all views of many data files with several blender worker
+    processes.
     """
-    scene, config = make_scene_from_data_files(render_config, filenames)
-    add_cameras_default(scene)
+    from . import farm
+
+    config = _with_render_settings(
+        load_render_config(render_config), profile=render_profile, preset=preset
+    )
+    farm.run_farm(
+        inputs,
+        config,
+        num_workers=workers,
+        threads_per_worker=threads,
+        output_template=output,
+        blender=blender,
+        skip_existing=resume,
+        max_restarts=max_restarts,
+        summary_path=summary,
+    )
+
+
+@click.command(
+    context_settings={"ignore_unknown_options": True, "allow_extra_args": True}
+)
+@click.option("--python", required=False)
+@click.option("--background/--no-background", required=False)
+@click.option("--render_config", default=None)
+@click.option(
+    "--render_profile",
+    type=click.Choice(RENDER_PROFILES),
+    default=None,
+    help="'final' (cycles) or 'preview' (EEVEE), overrides the render config.",
+)
+@click.option(
+    "--preset",
+    type=click.Choice(sorted(RENDER_PRESETS)),
+    default=None,
+    help="Cycles performance preset, overrides the render config.",
+)
+@click.option(
+    "--output",
+    default=None,
+    help="Default output path template of the jobs with {stem}, {name}, {parent},"
+    " {index}, {camera} (default: 'output' of the render settings).",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    default=None,
+    help="Unix socket to listen on (default: /tmp/blender_kitti.sock).",
+)
+def serve(
+    python, background, render_config, render_profile, preset, output, socket_path
+):
+    """Keep a scene set up and render jobs received over a Unix socket (see
+    blender_kitti.server).
+    """
+    from . import server
+
+    if socket_path is None:
+        socket_path = server.DEFAULT_SOCKET_PATH
+    config = _with_render_settings(
+        load_render_config(render_config), profile=render_profile, preset=preset
+    )
+    server.serve(config, socket_path=socket_path, output_template=output)
+
+
+@click.command(
+    context_settings={"ignore_unknown_options": True, "allow_extra_args": True}
+)
+@click.option("--python", required=False)
+@click.option("--background/--no-background", required=False)
+@click.option("--render_config", default=None)
+@click.option(
+    "--render_profile",
+    type=click.Choice(RENDER_PROFILES),
+    default=None,
+    help="'final' (cycles) or 'preview' (EEVEE), overrides the render config.",
+)
+@click.option(
+    "--preset",
+    type=click.Choice(sorted(RENDER_PRESETS)),
+    default=None,
+    help="Cycles performance preset, overrides the render config.",
+)
+@click.option("--output", required=True, help="Image path of the contact sheet.")
+@click.option(
+    "--mapping",
+    default=None,
+    help="Write the cell to file mapping as JSON (default: output path with"
+    " suffix .json).",
+)
+@click.option(
+    "--columns", default=None, type=int, help="Grid columns (default: square)."
+)
+@click.option(
+    "--cell_size",
+    default=None,
+    type=float,
+    help="Cell size in scene units (default: largest extent of the data).",
+)
+@click.option(
+    "--margin",
+    default=2.0,
+    show_default=True,
+    help="Space between the data of neighboring cells.",
+)
+@click.option(
+    "--share_prototypes/--no-share_prototypes",
+    default=True,
+    help="Use one mesh for identical particle prototypes.",
+)
+@click.option("--profile", default=None, help="Write per stage timings as JSON.")
+@click.argument("inputs", nargs=-1)
+def render_contact_sheet(
+    python,
+    background,
+    render_config,
+    render_profile,
+    preset,
+    output,
+    mapping,
+    columns,
+    cell_size,
+    margin,
+    share_prototypes,
+    profile,
+    inputs,
+):
+    """Render many data files (directories, manifests or glob patterns) on a
+    grid into one image with a top view camera.
+    """
+    from . import contact_sheet
+
+    if profile is not None:
+        enable_profiling(profile)
+    config = _with_render_settings(
+        load_render_config(render_config), profile=render_profile, preset=preset
+    )
+    if mapping is None:
+        mapping = pathlib.Path(output).with_suffix(".json")
+    contact_sheet.render_contact_sheet(
+        inputs,
+        output,
+        config,
+        columns=columns,
+        cell_size=cell_size,
+        margin=margin,
+        share_prototypes=share_prototypes,
+        mapping_path=mapping,
+    )
+    write_profile()
+
+
+@click.command(
+    context_settings={"ignore_unknown_options": True, "allow_extra_args": True}
+)
+@click.option("--python", required=False)
+@click.option("--background/--no-background", required=False)
+@click.option("--output", default=None, help="Write the results as JSON.")
+@click.option(
+    "--case",
+    "cases",
+    multiple=True,
+    help="Benchmark case of blender_kitti.benchmark.BENCHMARK_CASES (repeatable,"
+    " default: all).",
+)
+@click.option(
+    "--size",
+    "sizes",
+    multiple=True,
+    type=int,
+    help="Number of elements (repeatable, default: 10k, 100k, 1M).",
+)
+@click.option(
+    "--samples",
+    default=None,
+    type=int,
+    help="Render samples (0 to skip rendering, default: 16).",
+)
+@click.option(
+    "--isolate/--no-isolate",
+    default=True,
+    help="Run every case in a fresh blender process.",
+)
+@click.option("--blender", default=None, help="Blender binary for isolated runs.")
+@click.option("--label", default=None, help="Stored with the results.")
+@click.option(
+    "--compare",
+    default=None,
+    type=click.Path(exists=True),
+    help="Report regressions against these (JSON) results.",
+)
+@click.option("--tolerance", default=0.1, show_default=True)
+@click.option(
+    "--stand-in",
+    "stand_in",
+    is_flag=True,
+    help="Run without blender (plain python) with the recording bpy stand-in."
+    " Records bpy calls and buffer sizes instead of rendering.",
+)
+def run_benchmark(
+    python,
+    background,
+    output,
+    cases,
+    sizes,
+    samples,
+    isolate,
+    blender,
+    label,
+    compare,
+    tolerance,
+    stand_in,
+):
+    """Time the add_* functions and create_mesh and a low sample CPU render."""
+    from . import benchmark
+    from . import recording_bpy
 
-    scene.render.filepath = "/tmp/test.png"
-    render_scene()
+    unknown = sorted(set(cases) - set(benchmark.BENCHMARK_CASES))
+    if unknown:
+        raise click.BadParameter(
+            "{} (choose from {})".format(
+                ", ".join(unknown), ", ".join(benchmark.BENCHMARK_CASES)
+            ),
+            param_hint="'--case'",
+        )
+    if samples is None:
+        samples = benchmark.DEFAULT_RENDER_SAMPLES
+    if stand_in:
+        recording_bpy.install()
+        isolate = False
+    results = benchmark.run_benchmarks(
+        cases or None,
+        sizes or benchmark.DEFAULT_SIZES,
+        output_path=output,
+        isolate=isolate,
+        blender=blender,
+        label=label,
+        render=samples > 0,
+        render_samples=samples,
+    )
+    if compare is not None:
+        with open(compare, "r") as f:
+            baseline = json.load(f)
+        for r in benchmark.compare_benchmarks(baseline, results, tolerance):
+            logger.warning(
+                "Regression {} ({}) {}: {:.3g} -> {:.3g} ({:+.0%}).".format(
+                    r["case"],
+                    r["size"],
+                    r["measurement"],
+                    r["baseline"],
+                    r["current"],
+                    r["change"],
+                )
+            )
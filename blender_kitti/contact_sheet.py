@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Contact sheets: many data files laid out on a grid in one scene and rendered
+with a single top view orthographic camera.
+
+    mapping = render_contact_sheet(["predictions/*.npz"], "/tmp/sheet.png")
+    mapping[(0, 1)]  # data file in the first row, second column
+
+Row 0 is the top row of the image. The data of every file keeps its coordinates
+relative to the center of its cell (the objects are parented to an empty at the
+cell offset), so the same scene location is at the same place in every cell.
+
+Identical data is linked instead of copied (see add_objects_from_data) and
+uncolored particles use the cached default material. With share_prototypes,
+the particle prototypes of all cells that have the same geometry and materials
+use one mesh.
+"""
+
+import json
+import logging
+import math
+import pathlib
+import typing
+
+import numpy as np
+
+from .batch import build_file_objects, collect_input_files
+from .blender_kitti import make_scene
+from .bpy_helper import needs_bpy_bmesh
+from .datablocks import datablock_scope, free_datablocks
+from .material_shader import is_cached_material
+from .prepared_cache import prepared_cache_from_config
+from .render_stage import (
+    apply_render_settings,
+    render_camera,
+    render_settings_from_config,
+)
+from .scene_setup import create_camera_top_view_ortho
+from .system_setup import setup_system
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+CONTACT_SHEET_CAMERA = "CameraContactSheet"
+
+
+def grid_shape(num_cells: int, columns: int = None) -> (int, int):
+    """Rows and columns of a grid with num_cells cells (default: about square)."""
+    if num_cells < 1:
+        raise ValueError("A contact sheet needs at least one cell.")
+    if columns is None:
+        columns = math.ceil(math.sqrt(num_cells))
+    if columns < 1:
+        raise ValueError("A contact sheet needs at least one column.")
+    return math.ceil(num_cells / columns), columns
+
+
+def cell_offset(row: int, column: int, cell_size: (float, float)) -> (float, float):
+    """Center of a cell in the scene (x to the right, y up in the image)."""
+    return column * cell_size[0], -row * cell_size[1]
+
+
+@needs_bpy_bmesh()
+def _objects_of(scope, *, bpy) -> list:
+    pointers = {x.as_pointer() for x in bpy.data.objects}
+    return [x for x in scope.alive() if x.as_pointer() in pointers]
+
+
+def _half_extent(objects) -> (float, float):
+    """Largest distance of the bounding boxes of objects from the origin in x
+    and y.
+    """
+    half = np.zeros((2,))
+    for obj in objects:
+        if obj.type not in ("MESH", "CURVE"):
+            continue
+        corners = np.asarray([tuple(c) for c in obj.bound_box], dtype=np.float64)
+        matrix = np.asarray(obj.matrix_world, dtype=np.float64)
+        world = corners @ matrix[:3, :3].T + matrix[:3, 3]
+        half = np.maximum(half, np.abs(world[:, :2]).max(axis=0))
+    return float(half[0]), float(half[1])
+
+
+def share_particle_prototypes(objects) -> int:
+    """Let particle prototypes (objects instanced by their parent) with the same
+    vertices and materials use one mesh.
+
+    :return: number of prototypes whose mesh was replaced
+    """
+    meshes = {}
+    num_shared = 0
+    for obj in objects:
+        parent = obj.parent
+        if obj.type != "MESH" or parent is None or parent.instance_type == "NONE":
+            continue
+        mesh = obj.data
+        co = np.empty((len(mesh.vertices) * 3,), dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        materials = tuple(0 if m is None else m.as_pointer() for m in mesh.materials)
+        shared = meshes.setdefault((co.tobytes(), materials), mesh)
+        if shared != mesh:
+            obj.data = shared
+            num_shared += 1
+    return num_shared
+
+
+@needs_bpy_bmesh()
+def _add_cell_parent(scene, name: str, offset: (float, float), objects, *, bpy):
+    empty = bpy.data.objects.new(name, None)
+    empty.location = (offset[0], offset[1], 0.0)
+    scene.collection.objects.link(empty)
+    for obj in objects:
+        if obj.parent is None:
+            obj.parent = empty
+    return empty
+
+
+def _add_contact_sheet_camera(
+    scene, rows: int, columns: int, cell_size: (float, float)
+):
+    """Top view camera that sees the whole grid at the render resolution."""
+    width, height = columns * cell_size[0], rows * cell_size[1]
+    center = ((columns - 1) * cell_size[0] / 2.0, -(rows - 1) * cell_size[1] / 2.0)
+    aspect = scene.render.resolution_x / scene.render.resolution_y
+    # ortho_scale is the extent along the longer side of the image
+    if aspect >= 1.0:
+        scale = max(width, height * aspect)
+    else:
+        scale = max(height, width / aspect)
+    cam = create_camera_top_view_ortho(
+        name=CONTACT_SHEET_CAMERA, center=center, scale=scale
+    )
+    scene.collection.objects.link(cam)
+    return cam
+
+
+def render_contact_sheet(
+    inputs: typing.Iterable[str],
+    output: str,
+    config: {str: typing.Any} = None,
+    *,
+    columns: int = None,
+    cell_size: typing.Union[float, typing.Tuple[float, float], None] = None,
+    margin: float = 2.0,
+    share_prototypes: bool = True,
+    mapping_path: str = None,
+) -> {(int, int): pathlib.Path}:
+    """Render all input files on a grid into one image.
+
+    :param inputs: directories, manifests, glob patterns or files (see
+        batch.collect_input_files)
+    :param output: image path
+    :param config: render config (render settings, see render_stage; cameras and
+        views are ignored)
+    :param columns: number of grid columns (default: about square grid)
+    :param cell_size: width (and height) of a cell in scene units (default: the
+        largest extent of the data plus margin)
+    :param margin: space between the data of neighboring cells (only without
+        cell_size)
+    :param share_prototypes: see share_particle_prototypes
+    :param mapping_path: write the cell to file mapping as JSON to this path
+    :return: (row, column) -> data file, for the files that were added
+    """
+    if config is None:
+        config = {}
+    settings = render_settings_from_config(config)
+    files = collect_input_files(inputs)
+    rows, columns = grid_shape(len(files), columns)
+    logger.info(
+        "Contact sheet of {} files on a {}x{} grid.".format(len(files), rows, columns)
+    )
+
+    scene = make_scene(config, fallback_scene_name="blender_kitti_contact_sheet")
+    try:
+        setup_system(enable_gpu_rendering=config.get("gpu", True), scene=scene)
+    except ImportError:
+        pass
+    apply_render_settings(scene, settings)
+    prepared_cache = prepared_cache_from_config(config)
+
+    mapping = {}
+    cells = {}
+    scope = None
+    try:
+        with datablock_scope("contact_sheet") as scope:
+            for index, filepath in enumerate(files):
+                cell = divmod(index, columns)
+                cell_scope = None
+                try:
+                    with datablock_scope(str(filepath)) as cell_scope:
+                        build_file_objects(
+                            filepath,
+                            scene,
+                            config,
+                            prepared_cache,
+                            name_prefix="cell_{}_{}_".format(*cell),
+                        )
+                except Exception as e:
+                    logger.error("Failed to add '{}': {}".format(filepath, e))
+                    # the cell stays empty
+                    if cell_scope is not None:
+                        free_datablocks(cell_scope, keep=is_cached_material)
+                    continue
+                cells[cell] = _objects_of(cell_scope)
+                mapping[cell] = filepath
+
+            if share_prototypes:
+                num_shared = share_particle_prototypes(
+                    [obj for objects in cells.values() for obj in objects]
+                )
+                logger.info("Shared the mesh of {} prototypes.".format(num_shared))
+
+            if cell_size is None:
+                # bounding boxes need the evaluated object matrices
+                scene.view_layers[0].update()
+                extents = [_half_extent(objects) for objects in cells.values()]
+                cell_size = tuple(
+                    2.0 * max([e[i] for e in extents], default=0.0) + margin
+                    for i in range(2)
+                )
+            elif not isinstance(cell_size, (tuple, list)):
+                cell_size = (cell_size, cell_size)
+            cell_size = tuple(float(x) for x in cell_size)
+
+            for cell, objects in cells.items():
+                _add_cell_parent(
+                    scene,
+                    "contact_sheet_cell_{}_{}".format(*cell),
+                    cell_offset(*cell, cell_size),
+                    objects,
+                )
+            camera = _add_contact_sheet_camera(scene, rows, columns, cell_size)
+            render_camera(scene, camera, pathlib.Path(output))
+    finally:
+        if scope is not None:
+            # cached materials are kept for the next sheet
+            free_datablocks(scope, keep=is_cached_material)
+
+    if mapping_path is not None:
+        with open(str(mapping_path), "w") as f:
+            json.dump(
+                {
+                    "image": str(output),
+                    "rows": rows,
+                    "columns": columns,
+                    "cell_size": list(cell_size),
+                    "cells": [
+                        {"row": row, "column": column, "file": str(filepath)}
+                        for (row, column), filepath in mapping.items()
+                    ],
+                },
+                f,
+                indent=2,
+            )
+    return mapping
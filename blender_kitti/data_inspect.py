@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""Inspect data files without blender: tasks, arrays and estimated scene memory.
+
+Only the key names and .npy headers of a data file are read (see lazy_npz),
+except for voxel grids, whose occupied cells are counted. This module does not
+import bpy (nor the modules that do), so it starts fast in plain python:
+
+    $ blender_kitti_inspect data.npz
+"""
+
+import collections
+import json
+import pathlib
+import re
+import typing
+
+import click
+
+from .lazy_npz import LazyArray, load_value, open_npz
+
+"""
+TYPE+INSTANCE_NAME+ARG_NAME/OPTIONAL_DICT_KEY
+e.g. 'point_cloud+some_name+points
+e.g. 'mesh+some_name+vertices
+e.g. 'mesh+some_name+vertex_colors/semantics
+"""
+regex_key = re.compile(
+    r"([a-zA-Z0-9_-]+)\+([a-zA-Z0-9_-]+)\+([a-zA-Z0-9_-]+)(?:\/([a-zA-Z0-9_-]+))?"
+)
+
+global_config_key = "config"
+
+# rough bytes per element of the blender mesh data (positions, topology and
+# derived data like normals), including the evaluated copy of the mesh
+_BYTES_PER_VERTEX = 2 * 24
+_BYTES_PER_EDGE = 2 * 8
+_BYTES_PER_LOOP = 2 * 8
+_BYTES_PER_POLYGON = 2 * 4
+
+# flow arrows (see particles._arrow_template with the default 10 segments)
+_ARROW_VERTICES = 31
+_ARROW_LOOPS = 100
+_ARROW_POLYGONS = 23
+
+
+def _shape(args: {str: typing.Any}, name: str):
+    value = args.get(name)
+    return None if value is None else tuple(value.shape)
+
+
+def _instancer_elements(num_points: int, colored: bool) -> {str: int}:
+    # one pseudo triangle per point with a uv per loop, colors in an image
+    return {
+        "vertices": 3 * num_points,
+        "loops": 3 * num_points,
+        "polygons": num_points,
+        "attribute_bytes": 3 * num_points * 8 + (4 * num_points if colored else 0),
+    }
+
+
+def _elements_point_cloud(args):
+    num_points = _shape(args, "points")[0]
+    return dict(
+        instances=num_points, **_instancer_elements(num_points, "colors" in args)
+    )
+
+
+def _elements_voxels(args):
+    # the only payload that is read: occupied cells of the grid
+    num_voxels = int(load_value(args["voxels"]).sum())
+    return dict(
+        instances=num_voxels, **_instancer_elements(num_voxels, "colors" in args)
+    )
+
+
+def _elements_voxel_list(args):
+    num_voxels = _shape(args, "indices")[0]
+    return dict(
+        instances=num_voxels, **_instancer_elements(num_voxels, "colors" in args)
+    )
+
+
+def _elements_mesh(args):
+    num_vertices = _shape(args, "vertices")[0]
+    num_triangles = _shape(args, "triangles")[0]
+    attribute_bytes = 0
+    for name, per_element in [
+        ("vertex_colors", 4 * num_vertices),
+        ("face_colors", 4 * 3 * num_triangles),
+        ("scalar_values", 4 * num_vertices),
+    ]:
+        attribute_bytes += per_element * len(args.get(name) or {})
+    return {
+        "vertices": num_vertices,
+        "loops": 3 * num_triangles,
+        "polygons": num_triangles,
+        "attribute_bytes": attribute_bytes,
+    }
+
+
+def _elements_flow(args):
+    num_arrows = _shape(args, "point_cloud")[0]
+    return {
+        "instances": num_arrows,
+        "vertices": _ARROW_VERTICES * num_arrows,
+        "loops": _ARROW_LOOPS * num_arrows,
+        "polygons": _ARROW_POLYGONS * num_arrows,
+        # two byte color layers per loop
+        "attribute_bytes": 2 * 4 * _ARROW_LOOPS * num_arrows,
+    }
+
+
+_element_counters = {
+    "point_cloud": _elements_point_cloud,
+    "voxels": _elements_voxels,
+    "voxel_list": _elements_voxel_list,
+    "mesh": _elements_mesh,
+    "flow": _elements_flow,
+}
+
+
+def estimate_scene_bytes(elements: {str: int}) -> int:
+    """Rough memory of the blender mesh data for the element counts of a task
+    (without render engine copies like the BVH).
+    """
+    loops = elements.get("loops", 0)
+    return (
+        elements.get("vertices", 0) * _BYTES_PER_VERTEX
+        # about one edge per two loops
+        + loops // 2 * _BYTES_PER_EDGE
+        + loops * _BYTES_PER_LOOP
+        + elements.get("polygons", 0) * _BYTES_PER_POLYGON
+        + elements.get("attribute_bytes", 0)
+    )
+
+
+def parse_data_keys(keys: typing.Iterable[str]):
+    """Split data keys into {(type, instance): {arg: key or {dict_key: key}}}.
+
+    :return: tasks and the keys that do not match TYPE+INSTANCE+ARG
+    """
+    tasks = collections.OrderedDict()
+    unknown = []
+    for key in keys:
+        match = regex_key.fullmatch(key)
+        if match is None:
+            if key != global_config_key:
+                unknown.append(key)
+            continue
+        data_type, instance, arg, dict_key = match.groups()
+        args = tasks.setdefault((data_type, instance), {})
+        if dict_key is None:
+            args[arg] = key
+        else:
+            args.setdefault(arg, {})[dict_key] = key
+    return tasks, unknown
+
+
+def _describe_array(value: LazyArray) -> {str: typing.Any}:
+    return {
+        "shape": list(value.shape),
+        "dtype": str(value.dtype),
+        "bytes": value.nbytes,
+        "memory_mapped": value.is_memory_mapped,
+    }
+
+
+def inspect_data(data: {str: typing.Any}) -> {str: typing.Any}:
+    """Report of the tasks in a mapping key -> LazyArray (see open_npz)."""
+    tasks, unknown = parse_data_keys(data.keys())
+
+    report = {"tasks": [], "unknown_keys": unknown}
+    if global_config_key in data:
+        report["config"] = bytes(load_value(data[global_config_key])).decode("utf-8")
+
+    for (data_type, instance), arg_keys in tasks.items():
+        args = {
+            arg: (
+                {k: data[v] for k, v in key.items()}
+                if isinstance(key, dict)
+                else data[key]
+            )
+            for arg, key in arg_keys.items()
+        }
+        arrays = {}
+        for arg, value in args.items():
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    arrays["{}/{}".format(arg, k)] = _describe_array(v)
+            else:
+                arrays[arg] = _describe_array(value)
+
+        task = {
+            "type": data_type,
+            "instance": instance,
+            "arrays": arrays,
+            "payload_bytes": sum(a["bytes"] for a in arrays.values()),
+        }
+        counter = _element_counters.get(data_type)
+        if counter is None:
+            task["error"] = "unknown data type"
+        else:
+            try:
+                task["elements"] = counter(args)
+                task["estimated_scene_bytes"] = estimate_scene_bytes(task["elements"])
+            except (KeyError, TypeError, IndexError) as e:
+                task["error"] = "missing or invalid argument: {}".format(e)
+        report["tasks"].append(task)
+
+    report["payload_bytes"] = sum(t["payload_bytes"] for t in report["tasks"])
+    report["estimated_scene_bytes"] = sum(
+        t.get("estimated_scene_bytes", 0) for t in report["tasks"]
+    )
+    return report
+
+
+def inspect_file(filepath: str) -> {str: typing.Any}:
+    """Report of an .npz data file (see inspect_data)."""
+    return dict(inspect_data(open_npz(filepath)), file=str(filepath))
+
+
+def _mb(num_bytes: int) -> str:
+    return "{:.1f} MB".format(num_bytes / 2**20)
+
+
+def format_report(report: {str: typing.Any}) -> str:
+    lines = ["{}:".format(report.get("file", "data"))]
+    for task in report["tasks"]:
+        lines.append(
+            "  {}+{}: {}".format(
+                task["type"],
+                task["instance"],
+                (
+                    task["error"]
+                    if "error" in task
+                    else ", ".join(
+                        "{} {}".format(v, k)
+                        for k, v in task["elements"].items()
+                        if k != "attribute_bytes"
+                    )
+                    + ", ~{} in the scene".format(_mb(task["estimated_scene_bytes"]))
+                ),
+            )
+        )
+        for name, a in task["arrays"].items():
+            lines.append(
+                "    {}: {} {} ({}{})".format(
+                    name,
+                    a["dtype"],
+                    tuple(a["shape"]),
+                    _mb(a["bytes"]),
+                    ", memory mapped" if a["memory_mapped"] else "",
+                )
+            )
+    for key in report["unknown_keys"]:
+        lines.append("  unknown key '{}'".format(key))
+    if "config" in report:
+        lines.append("  config: {} characters".format(len(report["config"])))
+    lines.append(
+        "  total: {} payload, ~{} in the scene".format(
+            _mb(report["payload_bytes"]), _mb(report["estimated_scene_bytes"])
+        )
+    )
+    return "\n".join(lines)
+
+
+@click.command()
+@click.option("--json", "as_json", is_flag=True, help="Print the report as JSON.")
+@click.argument("filenames", type=click.Path(exists=True), nargs=-1)
+def inspect(as_json, filenames):
+    """Show the tasks, arrays and estimated scene memory of data files without
+    starting blender.
+    """
+    reports = [inspect_file(str(pathlib.Path(f))) for f in filenames]
+    if as_json:
+        click.echo(json.dumps(reports, indent=2))
+    else:
+        for report in reports:
+            click.echo(format_report(report))
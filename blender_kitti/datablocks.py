@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Registry of the datablocks (objects, meshes, images, materials, ...) created
+in a scope, so that they can be removed again in bulk.
+
+    with datablock_scope("file_0001") as scope:
+        add_objects_from_data(tasks, scene)
+    free_datablocks(scope)
+
+Scopes can be nested: within an open scope, add_objects_from_data opens a scope
+per task and make_scene one per scene (without one they record nothing, see
+nested_only). A scope records everything that was added to bpy.data while it
+was open (including datablocks created by bpy.ops), so freeing the outer scope
+also frees the datablocks of the inner ones. Datablocks are removed with a single
+bpy.data.batch_remove call, which does not leave orphan data behind.
+"""
+
+import contextlib
+import logging
+import typing
+
+from .bpy_helper import needs_bpy_bmesh
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+# bpy.data collections that are tracked
+TRACKED_DATABLOCKS = (
+    "objects",
+    "meshes",
+    "curves",
+    "materials",
+    "images",
+    "textures",
+    "node_groups",
+    "cameras",
+    "lights",
+    "worlds",
+    "collections",
+    "scenes",
+)
+
+
+def is_removed(datablock) -> bool:
+    try:
+        # removed datablocks raise ReferenceError on access
+        _ = datablock.name
+        return False
+    except ReferenceError:
+        return True
+
+
+class DatablockScope:
+    def __init__(self, name: str, parent: "DatablockScope" = None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        # datablocks created while the scope was open (filled on close)
+        self.datablocks = []
+        self.closed = False
+
+    def alive(self) -> list:
+        """Recorded datablocks that have not been removed yet."""
+        return [x for x in self.datablocks if not is_removed(x)]
+
+    def __repr__(self):
+        return "DatablockScope('{}', {} datablocks)".format(
+            self.name, len(self.datablocks)
+        )
+
+
+@needs_bpy_bmesh()
+def _snapshot(*, bpy) -> {str: set}:
+    return {
+        k: {x.as_pointer() for x in getattr(bpy.data, k)} for k in TRACKED_DATABLOCKS
+    }
+
+
+@needs_bpy_bmesh()
+def _created_since(snapshot: {str: set}, *, bpy) -> list:
+    return [
+        x
+        for k in TRACKED_DATABLOCKS
+        for x in getattr(bpy.data, k)
+        if x.as_pointer() not in snapshot[k]
+    ]
+
+
+@needs_bpy_bmesh()
+def _batch_remove(datablocks: list, *, bpy):
+    # the scene of the context cannot be removed
+    current_scene = bpy.context.scene
+    datablocks = [x for x in datablocks if x != current_scene]
+    if datablocks:
+        bpy.data.batch_remove(datablocks)
+    return len(datablocks)
+
+
+class DatablockRegistry:
+    def __init__(self):
+        # closed top level scopes that have not been freed
+        self.scopes = []
+        self._open = []
+        # called without arguments after datablocks have been removed
+        self.free_callbacks = []
+
+    @contextlib.contextmanager
+    def scope(
+        self, name: str, free: bool = False, keep=None, nested_only: bool = False
+    ):
+        """Record the datablocks created in the with block.
+
+        :param free: remove them when the block is left
+        :param keep: predicate for datablocks that are not removed (with free)
+        :param nested_only: record only within an open scope, otherwise yield None.
+            Top level scopes are kept until they are freed.
+        """
+        parent = self._open[-1] if self._open else None
+        if nested_only and parent is None:
+            yield None
+            return
+        scope = DatablockScope(name, parent)
+        snapshot = _snapshot()
+        self._open.append(scope)
+        try:
+            yield scope
+        finally:
+            self._open.pop()
+            scope.datablocks = _created_since(snapshot)
+            scope.closed = True
+            if parent is None:
+                self.scopes.append(scope)
+            else:
+                parent.children.append(scope)
+            if free:
+                self.free(scope, keep=keep)
+
+    def find(self, name: str) -> [DatablockScope]:
+        """Closed scopes with this name (top level and nested)."""
+        found = []
+        todo = list(self.scopes)
+        while todo:
+            scope = todo.pop(0)
+            if scope.name == name:
+                found.append(scope)
+            todo.extend(scope.children)
+        return found
+
+    def _forget(self, scope: DatablockScope):
+        if scope.parent is None:
+            if scope in self.scopes:
+                self.scopes.remove(scope)
+        elif scope in scope.parent.children:
+            scope.parent.children.remove(scope)
+
+    def free(
+        self,
+        scope: typing.Union[DatablockScope, str, None] = None,
+        keep: typing.Callable = None,
+    ) -> int:
+        """Remove the datablocks of a scope (or of all scopes with this name, or
+        of all closed scopes) in one batch.
+
+        :param keep: predicate for datablocks that are not removed
+        :return: number of removed datablocks
+        """
+        if scope is None:
+            scopes = list(self.scopes)
+        elif isinstance(scope, str):
+            scopes = self.find(scope)
+        else:
+            scopes = [scope]
+
+        datablocks = []
+        seen = set()
+        for s in scopes:
+            if not s.closed:
+                raise RuntimeError("Scope '{}' is still open.".format(s.name))
+            for x in s.alive():
+                if x.as_pointer() in seen or (keep is not None and keep(x)):
+                    continue
+                seen.add(x.as_pointer())
+                datablocks.append(x)
+            self._forget(s)
+
+        num_removed = _batch_remove(datablocks)
+        for callback in self.free_callbacks:
+            callback()
+        logger.info(
+            "Removed {} datablocks of {} scope(s).".format(num_removed, len(scopes))
+        )
+        return num_removed
+
+
+registry = DatablockRegistry()
+
+
+def add_free_callback(callback: typing.Callable[[], None]):
+    """Call callback after datablocks have been removed (e.g. to drop references
+    to them from caches).
+    """
+    registry.free_callbacks.append(callback)
+
+
+def datablock_scope(
+    name: str, free: bool = False, keep=None, nested_only: bool = False
+):
+    """Scope of the global registry, see DatablockRegistry.scope."""
+    return registry.scope(name, free=free, keep=keep, nested_only=nested_only)
+
+
+def free_datablocks(
+    scope: typing.Union[DatablockScope, str, None] = None, keep=None
+) -> int:
+    """Free scopes of the global registry, see DatablockRegistry.free."""
+    return registry.free(scope, keep=keep)
+
+
+@needs_bpy_bmesh()
+def remove_all_datablocks(
+    keep_scenes: bool = True, kinds: typing.Tuple[str, ...] = TRACKED_DATABLOCKS, *, bpy
+) -> int:
+    """Remove all tracked datablocks of the file (also those not created in a
+    scope). Scenes (and their worlds) are kept with keep_scenes.
+
+    :param kinds: bpy.data collections to clear (default: all tracked ones)
+    """
+    skip = ("scenes", "worlds") if keep_scenes else ()
+    datablocks = [x for k in kinds if k not in skip for x in getattr(bpy.data, k)]
+    if set(kinds) >= set(TRACKED_DATABLOCKS) - set(skip):
+        # nothing the scopes recorded is left
+        registry.scopes.clear()
+    num_removed = _batch_remove(datablocks)
+    for callback in registry.free_callbacks:
+        callback()
+    return num_removed
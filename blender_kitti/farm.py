@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""Local render farm: (file, camera) jobs rendered by several blender processes.
+
+The scheduler starts N background blender workers with a thread budget each.
+Workers talk to the scheduler with JSON lines: jobs are written to the stdin of
+a worker, results are printed to stdout with the prefix FARM_MESSAGE_PREFIX
+(everything else blender prints is ignored). A worker keeps the objects of its
+current file loaded, so the scheduler hands out the remaining cameras of that
+file to the same worker first. Crashed workers are restarted and their job is
+queued again.
+"""
+
+import collections
+import json
+import logging
+import os
+import pathlib
+import queue
+import subprocess
+import sys
+import threading
+import time
+import typing
+
+from .batch import build_file_objects, collect_input_files
+from .blender_kitti import make_scene
+from .bpy_helper import needs_bpy_bmesh
+from .datablocks import datablock_scope, free_datablocks
+from .material_shader import is_cached_material
+from .prepared_cache import prepared_cache_from_config
+from .render_stage import (
+    add_cameras_from_config,
+    apply_render_settings,
+    format_output_path,
+    render_camera,
+    render_settings_from_config,
+)
+from .system_setup import setup_system
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+FARM_MESSAGE_PREFIX = "@blender_kitti_farm "
+
+_WORKER_EXPR = "import blender_kitti.farm as farm; farm.worker_main()"
+
+
+def _send(message: {str: typing.Any}):
+    sys.stdout.write(FARM_MESSAGE_PREFIX + json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def worker_main(argv: [str] = None):
+    """Entry point of a worker (inside blender). The worker options are passed as
+    JSON after '--' on the blender command line.
+    """
+    if argv is None:
+        argv = sys.argv
+    options = json.loads(argv[argv.index("--") + 1])
+    config = options["config"]
+    threads = options["threads"]
+
+    settings = render_settings_from_config(config)
+    settings["threads"] = threads
+    output_template = options.get("output") or settings["output"]
+    config.setdefault("prepare_workers", threads)
+
+    scene = make_scene(config, fallback_scene_name="blender_kitti_farm")
+    cameras = add_cameras_from_config(scene, config)
+    try:
+        setup_system(enable_gpu_rendering=config.get("gpu", False), scene=scene)
+    except ImportError:
+        pass
+    apply_render_settings(scene, settings)
+    prepared_cache = prepared_cache_from_config(config)
+
+    _send({"event": "ready", "pid": os.getpid(), "cameras": list(cameras)})
+
+    current_file = None
+    scope = None
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        if job.get("op") == "stop":
+            break
+
+        filepath = pathlib.Path(job["file"])
+        output = format_output_path(
+            output_template, filepath, job["index"], job["camera"]
+        )
+        if options.get("skip_existing", True) and output.is_file():
+            _send({"event": "skipped", "id": job["id"], "output": str(output)})
+            continue
+
+        seconds = {}
+        try:
+            if job["file"] != current_file:
+                if scope is not None:
+                    free_datablocks(scope, keep=is_cached_material)
+                    scope = None
+                current_file = None
+                with datablock_scope(job["file"]) as scope:
+                    seconds.update(
+                        build_file_objects(filepath, scene, config, prepared_cache)
+                    )
+                current_file = job["file"]
+
+            t = time.perf_counter()
+            render_camera(scene, cameras[job["camera"]], output)
+            seconds["render"] = time.perf_counter() - t
+            _send(
+                {
+                    "event": "done",
+                    "id": job["id"],
+                    "output": str(output),
+                    "seconds": seconds,
+                }
+            )
+        except Exception as e:
+            current_file = None
+            _send({"event": "failed", "id": job["id"], "error": str(e)})
+
+
+@needs_bpy_bmesh(default_return="blender")
+def _blender_binary(*, bpy):
+    return bpy.app.binary_path
+
+
+class _Worker:
+    """Blender worker process. Messages are put on the shared event queue as
+    (worker, message); an 'exit' message follows when the process ended.
+    """
+
+    def __init__(self, index: int, command: [str], env, events: queue.Queue):
+        self.index = index
+        self.ready = False
+        self.file = None
+        self.job = None
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+            universal_newlines=True,
+            bufsize=1,
+        )
+        self._reader = threading.Thread(target=self._read, args=(events,), daemon=True)
+        self._reader.start()
+
+    def _read(self, events: queue.Queue):
+        for line in self.process.stdout:
+            if line.startswith(FARM_MESSAGE_PREFIX):
+                events.put((self, json.loads(line[len(FARM_MESSAGE_PREFIX) :])))
+        events.put((self, {"event": "exit", "returncode": self.process.wait()}))
+
+    def send(self, message: {str: typing.Any}) -> bool:
+        try:
+            self.process.stdin.write(json.dumps(message) + "\n")
+            self.process.stdin.flush()
+            return True
+        except (BrokenPipeError, OSError):
+            # the exit message follows
+            return False
+
+
+def _next_job(pending: collections.deque, file: str):
+    """Next job for a worker, prefer jobs of the file it has loaded."""
+    if file is not None:
+        for job in pending:
+            if job["file"] == file:
+                pending.remove(job)
+                return job
+    return pending.popleft()
+
+
+def run_farm(
+    inputs: typing.Iterable[str],
+    config: {str: typing.Any} = None,
+    *,
+    num_workers: int = 2,
+    threads_per_worker: int = None,
+    output_template: str = None,
+    blender: str = None,
+    skip_existing: bool = True,
+    max_restarts: int = 3,
+    max_attempts: int = 2,
+    summary_path: str = None,
+):
+    """Render all cameras of all input files with num_workers blender processes.
+
+    :param inputs: directories, manifests, glob patterns or files
+    :param config: render config (see render_stage), passed to the workers
+    :param threads_per_worker: render threads per worker (default: cpus / workers)
+    :param output_template: see format_output_path (default: render settings)
+    :param blender: blender binary for the workers (default: the running one)
+    :param max_restarts: restarts of crashed workers (in total)
+    :param max_attempts: attempts per job before it is given up
+    :param summary_path: write jobs and throughput as JSON to this path
+    :return: summary dict
+    """
+    if config is None:
+        config = {}
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+    if blender is None:
+        blender = _blender_binary()
+
+    files = [str(f) for f in collect_input_files(inputs)]
+    options = {
+        "config": config,
+        "threads": threads_per_worker,
+        "output": output_template,
+        "skip_existing": skip_existing,
+    }
+    command = [
+        blender,
+        "--background",
+        "--factory-startup",
+        "--threads",
+        str(threads_per_worker),
+        "--python-expr",
+        _WORKER_EXPR,
+        "--",
+        json.dumps(options),
+    ]
+    env = dict(os.environ)
+    for k in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        env[k] = str(threads_per_worker)
+
+    logger.info(
+        "Render farm with {} workers and {} threads each for {} files.".format(
+            num_workers, threads_per_worker, len(files)
+        )
+    )
+
+    events = queue.Queue()
+    workers = [_Worker(i, command, env, events) for i in range(num_workers)]
+
+    t_start = time.perf_counter()
+    jobs = None
+    pending = collections.deque()
+    results = {}
+    restarts = 0
+    num_rendered = 0
+
+    def assign_idle():
+        for w in workers:
+            if w.ready and w.job is None and pending:
+                job = _next_job(pending, w.file)
+                job["attempts"] += 1
+                w.job = job
+                w.file = job["file"]
+                w.send(job)
+
+    def finished():
+        return jobs is not None and not pending and all(w.job is None for w in workers)
+
+    while workers and not finished():
+        worker, message = events.get()
+        event = message["event"]
+
+        if event == "ready":
+            worker.ready = True
+            if jobs is None:
+                # cameras (views) are known once the first scene is set up
+                jobs = [
+                    {
+                        "id": i,
+                        "file": f,
+                        "index": index,
+                        "camera": camera,
+                        "attempts": 0,
+                    }
+                    for i, (index, f, camera) in enumerate(
+                        (index, f, camera)
+                        for index, f in enumerate(files)
+                        for camera in message["cameras"]
+                    )
+                ]
+                pending.extend(jobs)
+
+        elif event in ("done", "skipped", "failed"):
+            job = worker.job
+            worker.job = None
+            if event == "failed":
+                logger.warning(
+                    "Job {} ({} '{}') failed: {}".format(
+                        job["id"], job["file"], job["camera"], message["error"]
+                    )
+                )
+                # the worker unloaded the file
+                worker.file = None
+                if job["attempts"] < max_attempts:
+                    pending.append(job)
+                else:
+                    results[job["id"]] = dict(job, status="failed", **message)
+            else:
+                results[job["id"]] = dict(job, status=event, **message)
+                if event == "done":
+                    num_rendered += 1
+                    elapsed = time.perf_counter() - t_start
+                    logger.info(
+                        "[{}/{}] rendered '{}' ({:.1f} frames per hour).".format(
+                            len(results),
+                            len(jobs),
+                            message["output"],
+                            3600.0 * num_rendered / elapsed,
+                        )
+                    )
+
+        elif event == "exit":
+            workers.remove(worker)
+            job = worker.job
+            if job is not None:
+                logger.warning(
+                    "Worker {} exited with {} during job {}.".format(
+                        worker.index, message["returncode"], job["id"]
+                    )
+                )
+                if job["attempts"] < max_attempts:
+                    pending.appendleft(job)
+                else:
+                    results[job["id"]] = dict(job, status="crashed", **message)
+            if (jobs is None or pending) and restarts < max_restarts:
+                restarts += 1
+                logger.info("Restarting worker {}.".format(worker.index))
+                workers.append(_Worker(worker.index, command, env, events))
+
+        assign_idle()
+
+    for w in workers:
+        w.send({"op": "stop"})
+    for w in workers:
+        w.process.wait()
+
+    elapsed = time.perf_counter() - t_start
+    unfinished = [j for j in pending if j["id"] not in results]
+    summary = {
+        "workers": num_workers,
+        "threads_per_worker": threads_per_worker,
+        "restarts": restarts,
+        "seconds": elapsed,
+        "frames_rendered": num_rendered,
+        "frames_per_hour": 3600.0 * num_rendered / elapsed if elapsed > 0 else 0.0,
+        "jobs": [results[k] for k in sorted(results)]
+        + [dict(j, status="unfinished") for j in unfinished],
+    }
+    logger.info(
+        "Rendered {} frames in {:.1f}s ({:.1f} frames per hour).".format(
+            num_rendered, elapsed, summary["frames_per_hour"]
+        )
+    )
+    if summary_path is not None:
+        with open(str(summary_path), "w") as f:
+            json.dump(summary, f, indent=2)
+    return summary
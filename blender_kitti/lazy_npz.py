@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Lazy access to the arrays of an .npz file.
+
+Opening a file only reads the zip directory and the .npy headers (shape, dtype) of
+all members. Array payloads are read on LazyArray.load(). Members that are stored
+without compression are memory mapped instead of read.
+"""
+
+import struct
+import zipfile
+
+import numpy as np
+
+# size of the fixed part of a zip local file header
+_ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def _read_npy_header(fp):
+    """Shape, fortran order, dtype and size of the .npy header, None for format
+    versions without a public header reader (3.0, utf-8 field names).
+    """
+    version = np.lib.format.read_magic(fp)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+    else:
+        return None
+    return shape, fortran_order, dtype, fp.tell()
+
+
+def _member_data_offset(filepath: str, info: zipfile.ZipInfo) -> int:
+    """File offset of the (uncompressed) data of a zip member."""
+    with open(filepath, "rb") as f:
+        f.seek(info.header_offset)
+        local_header = f.read(_ZIP_LOCAL_HEADER_SIZE)
+    filename_length, extra_length = struct.unpack("<HH", local_header[26:30])
+    return info.header_offset + _ZIP_LOCAL_HEADER_SIZE + filename_length + extra_length
+
+
+class LazyArray:
+    """Array in an .npz file. Shape and dtype are known without reading the data."""
+
+    def __init__(
+        self,
+        filepath: str,
+        member: str,
+        shape: tuple,
+        dtype: np.dtype,
+        fortran_order: bool,
+        data_offset: int = None,
+    ):
+        self.filepath = filepath
+        self.member = member
+        self.shape = shape
+        self.dtype = dtype
+        self.fortran_order = fortran_order
+        # file offset of the raw array data if the member can be memory mapped
+        self.data_offset = data_offset
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    @property
+    def nbytes(self) -> int:
+        return self.size * self.dtype.itemsize
+
+    @property
+    def is_memory_mapped(self) -> bool:
+        return self.data_offset is not None
+
+    def load(self) -> np.ndarray:
+        if self.data_offset is not None:
+            if self.size == 0:
+                return np.empty(self.shape, dtype=self.dtype)
+            return np.memmap(
+                self.filepath,
+                dtype=self.dtype,
+                mode="r",
+                offset=self.data_offset,
+                shape=self.shape,
+                order="F" if self.fortran_order else "C",
+            )
+        with zipfile.ZipFile(self.filepath) as zf:
+            with zf.open(self.member) as f:
+                return np.lib.format.read_array(f, allow_pickle=False)
+
+    def __repr__(self):
+        return "LazyArray('{}', shape={}, dtype={})".format(
+            self.member, self.shape, self.dtype
+        )
+
+
+def open_npz(filepath) -> {str: LazyArray}:
+    """Keys and lazy arrays of an .npz file (see np.savez)."""
+    filepath = str(filepath)
+    arrays = {}
+    with zipfile.ZipFile(filepath) as zf:
+        for info in zf.infolist():
+            if not info.filename.endswith(".npy"):
+                continue
+            with zf.open(info) as f:
+                header = _read_npy_header(f)
+            if header is None:
+                # the array is read once to find its shape and dtype
+                with zf.open(info) as f:
+                    array = np.lib.format.read_array(f, allow_pickle=False)
+                header = (array.shape, np.isfortran(array), array.dtype, None)
+            shape, fortran_order, dtype, header_size = header
+
+            data_offset = None
+            if (
+                info.compress_type == zipfile.ZIP_STORED
+                and header_size is not None
+                and not dtype.hasobject
+            ):
+                data_offset = _member_data_offset(filepath, info) + header_size
+
+            key = info.filename[: -len(".npy")]
+            arrays[key] = LazyArray(
+                filepath, info.filename, shape, dtype, fortran_order, data_offset
+            )
+    return arrays
+
+
+def load_value(value):
+    """Load value if it is a LazyArray, return it unchanged otherwise."""
+    if isinstance(value, LazyArray):
+        return value.load()
+    if isinstance(value, dict):
+        return {k: load_value(v) for k, v in value.items()}
+    return value
@@ -2,7 +2,11 @@
 """"""
 import typing
 
-import bpy
+try:
+    import bpy
+except ImportError:
+    # outside of blender, see recording_bpy
+    bpy = None
 
 from .colormap_turbo import turbo_colormap_data
 
@@ -113,16 +117,103 @@ class NodeOutput:
         return self.node_rgb_color_select.color_input
 
 
+# blender's color ramp supports at most 32 elements
+MAX_COLOR_RAMP_STOPS = 32
+
+COLORMAPS = {
+    "turbo": turbo_colormap_data,
+    "gray": [[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]],
+}
+
+
+def _get_colormap(colormap):
+    if isinstance(colormap, str):
+        try:
+            return COLORMAPS[colormap]
+        except KeyError:
+            raise ValueError("Unknown colormap '{}'.".format(colormap))
+    return colormap
+
+
+def _set_color_ramp(color_ramp, colormap):
+    colormap = _get_colormap(colormap)
+    n_colors = len(colormap)
+    if n_colors < 2:
+        raise ValueError("Colormap needs at least two colors.")
+    n_stops = min(n_colors, MAX_COLOR_RAMP_STOPS)
+    indices = [round(i * (n_colors - 1) / (n_stops - 1)) for i in range(n_stops)]
+
+    elements = color_ramp.elements
+    # a ramp always keeps at least one element
+    while len(elements) > 1:
+        elements.remove(elements[-1])
+    elements[0].position = 0.0
+    elements[0].color = list(colormap[indices[0]]) + [1.0]
+    for i in range(1, n_stops):
+        element = elements.new(position=i / (n_stops - 1))
+        element.color = list(colormap[indices[i]]) + [1.0]
+
+
 def make_color_ramp_node(nodes, colormap):
     node = nodes.new(type="ShaderNodeValToRGB")
-    color_ramp_elements = node.color_ramp.elements
+    _set_color_ramp(node.color_ramp, colormap)
+    return node
 
-    n_stops = len(colormap)
-    for i, color in enumerate(colormap):
-        element = color_ramp_elements.new(position=i / (n_stops - 1))
-        element.color = color + [1.0]
 
-    return node
+class NodePseudoColor:
+    """Map a scalar input to a color: (value - min) / (max - min) -> colormap
+
+    Adds math and color ramp nodes to the given node tree (not a node group), so
+    value range and colormap live in the material and can be changed at any time
+    without touching the geometry data or other materials.
+    """
+
+    def __init__(
+        self,
+        node_tree,
+        *,
+        colormap=turbo_colormap_data,
+        min_value: float = 0.0,
+        max_value: float = 1.0,
+        location=(0, 0),
+    ):
+        nodes = node_tree.nodes
+        links = node_tree.links
+
+        self.node_add = nodes.new(type="ShaderNodeMath")
+        self.node_add.operation = "ADD"
+        self.node_add.location = location
+
+        self.node_scale = nodes.new(type="ShaderNodeMath")
+        self.node_scale.operation = "MULTIPLY"
+        self.node_scale.location = (location[0] + 200, location[1])
+
+        self.node_ramp = make_color_ramp_node(nodes, colormap)
+        self.node_ramp.location = (location[0] + 400, location[1])
+
+        links.new(self.node_add.outputs[0], self.node_scale.inputs[0])
+        links.new(self.node_scale.outputs[0], self.node_ramp.inputs[0])
+
+        self.set_range(min_value, max_value)
+
+    def set_range(self, min_value: float, max_value: float):
+        if max_value <= min_value:
+            raise ValueError(
+                "Invalid value range ({}, {}).".format(min_value, max_value)
+            )
+        self.node_add.inputs[1].default_value = -min_value
+        self.node_scale.inputs[1].default_value = 1 / (max_value - min_value)
+
+    def set_colormap(self, colormap):
+        _set_color_ramp(self.node_ramp.color_ramp, colormap)
+
+    @property
+    def value_input(self):
+        return self.node_add.inputs[0]
+
+    @property
+    def color_output(self):
+        return self.node_ramp.outputs[0]
 
 
 def make_pseudo_color(
@@ -132,26 +223,15 @@ def make_pseudo_color(
     max_value: float = 1.0,
     location=(0, 0),
 ):
-    nodes = node_tree.nodes
-    links = node_tree.links
-
-    node_add = nodes.new(type="ShaderNodeMath")
-    node_add.inputs[1].default_value = -min_value
-    node_add.operation = "ADD"
-    node_add.location = location
-
-    node_scale = nodes.new(type="ShaderNodeMath")
-    node_scale.inputs[1].default_value = 1 / (max_value - min_value)
-    node_scale.operation = "MULTIPLY"
-    node_scale.location = (location[0] + 200, location[1])
-
-    node_ramp = make_color_ramp_node(nodes, colormap)
-
-    links.new(node_add.outputs[0], node_scale.inputs[0])
-    links.new(node_scale.outputs[0], node_ramp.inputs[0])
-
+    pseudo_color = NodePseudoColor(
+        node_tree,
+        colormap=colormap,
+        min_value=min_value,
+        max_value=max_value,
+        location=location,
+    )
     # input / output
-    return node_add.inputs[0], node_ramp.outputs[0]
+    return pseudo_color.value_input, pseudo_color.color_output
 
 
 class ColorAttrSelector:
@@ -162,6 +242,8 @@ class ColorAttrSelector:
         vertex_attr_rgb,
         vertex_attr_scalar,
         default_color=NodeRGBColorSelect.COLOR_BLACK,
+        value_range=(0.0, 1.0),
+        colormap=turbo_colormap_data,
     ):
         self._attrs = list(vertex_attr_rgb) + list(vertex_attr_scalar)
         self._cut = len(vertex_attr_rgb)
@@ -179,7 +261,15 @@ class ColorAttrSelector:
         self.scalar_attr_node.location = 0, -200
         self.scalar_attr_node.attribute_name = "<unset>"
 
-        input_scalar, output_pseudo_rgb = make_pseudo_color(node_tree)
+        self.pseudo_color = NodePseudoColor(
+            node_tree,
+            colormap=colormap,
+            min_value=value_range[0],
+            max_value=value_range[1],
+            location=(200, -200),
+        )
+        input_scalar = self.pseudo_color.value_input
+        output_pseudo_rgb = self.pseudo_color.color_output
 
         # switch between RGB and scalar
         self.node_color_switch = nodes.new(type="ShaderNodeMixRGB")
@@ -217,10 +307,10 @@ class ColorAttrSelector:
                 self.node_color_default.inputs[0].default_value = 1.0
             else:
                 self.node_color_default.inputs[0].default_value = 0.0
-                target = (
-                    self.rgb_attr_node if desc < self._cut else self.scalar_attr_node
-                )
+                is_rgb = desc < self._cut
+                target = self.rgb_attr_node if is_rgb else self.scalar_attr_node
                 target.attribute_name = self._attrs[desc]
+                self.node_color_switch.inputs[0].default_value = 0.0 if is_rgb else 1.0
 
         else:
             if desc not in self._attrs:
@@ -237,6 +327,13 @@ class ColorAttrSelector:
     def __iter__(self):
         return iter(self._attrs)
 
+    def set_value_range(self, min_value: float, max_value: float):
+        """Value range of the scalar attributes that is mapped onto the colormap."""
+        self.pseudo_color.set_range(min_value, max_value)
+
+    def set_colormap(self, colormap):
+        self.pseudo_color.set_colormap(colormap)
+
     @property
     def attrs(self):
         return self._attrs
@@ -326,6 +423,8 @@ def make_nodes_vertex_color_material(
     vertex_attr_scalar: [str],
     default_color,
     mode: str = "select",
+    value_range=(0.0, 1.0),
+    colormap=turbo_colormap_data,
 ):
 
     if mode not in ["select", "mix"]:
@@ -359,6 +458,8 @@ def make_nodes_vertex_color_material(
             material.node_tree,
             vertex_attr_rgb=vertex_attr_rgb,
             vertex_attr_scalar=vertex_attr_scalar,
+            value_range=value_range,
+            colormap=colormap,
         )
 
     # create shader node
@@ -378,6 +479,42 @@ def make_nodes_vertex_color_material(
     return selector
 
 
+# shared materials (and their color selectors) by material parameters
+_material_cache = {}
+
+
+def _color_key(color, decimals: int = 4):
+    return tuple(round(float(c), decimals) for c in color)
+
+
+def get_cached_material(key, factory):
+    """Return the cached entry for key. Call factory() to create it if the key is
+    unknown or its material has been removed from bpy.data in the meantime.
+    """
+    try:
+        entry = _material_cache[key]
+        mat = entry[0] if isinstance(entry, tuple) else entry
+        # removed datablocks raise ReferenceError on access
+        _ = mat.name
+        return entry
+    except (KeyError, ReferenceError):
+        entry = factory()
+        _material_cache[key] = entry
+        return entry
+
+
+def is_cached_material(material) -> bool:
+    for entry in _material_cache.values():
+        mat = entry[0] if isinstance(entry, tuple) else entry
+        if mat == material:
+            return True
+    return False
+
+
+def clear_material_cache():
+    _material_cache.clear()
+
+
 def create_or_get_material(name_material: str):
     try:
         return bpy.data.materials[name_material]
@@ -385,10 +522,49 @@ def create_or_get_material(name_material: str):
         return bpy.data.materials.new(name=name_material)
 
 
-def create_simple_material(base_color, name_material: str):
-    mat = create_or_get_material(name_material)
-    color_selector = make_nodes_simple_material(mat, base_color)
-    return mat, color_selector
+def create_simple_material(
+    base_color, name_material: str, *, use_cache: bool = False
+):
+    """Simple single color material. With use_cache, one material is shared by all
+    callers that request the same color (name_material is only used on creation).
+    """
+
+    def make():
+        mat = create_or_get_material(name_material)
+        color_selector = make_nodes_simple_material(mat, base_color)
+        return mat, color_selector
+
+    if use_cache:
+        return get_cached_material(("simple", _color_key(base_color)), make)
+    return make()
+
+
+def create_attribute_color_material(
+    attribute_name: str, name_material: str = None
+):
+    """One material for all objects that carry their color in the geometry
+    attribute attribute_name.
+    """
+
+    def make():
+        name = name_material
+        if name is None:
+            name = "material_attribute_{}".format(attribute_name)
+        mat = bpy.data.materials.new(name=name)
+        mat.use_nodes = True
+        nodes = mat.node_tree.nodes
+        nodes.clear()
+
+        node_attr = nodes.new(type="ShaderNodeAttribute")
+        node_attr.location = 0, 0
+        node_attr.attribute_name = attribute_name
+
+        color_selector = NodeOutput(
+            mat.node_tree, input_color_link=node_attr.outputs[0], location=(200, 0)
+        )
+        return mat, color_selector
+
+    return get_cached_material(("attribute", attribute_name), make)
 
 
 def create_uv_mapped_material(color_image, name_material: str = "material_point_cloud"):
@@ -403,10 +579,18 @@ def create_vertex_color_material(
     default_color,
     mode: str = "select",
     name_material: str = "material_vertex_color",
+    value_range=(0.0, 1.0),
+    colormap=turbo_colormap_data,
 ):
     mat = create_or_get_material(name_material)
     selector = make_nodes_vertex_color_material(
-        mat, vertex_attr_rgb, vertex_attr_scalar, default_color, mode
+        mat,
+        vertex_attr_rgb,
+        vertex_attr_scalar,
+        default_color,
+        mode,
+        value_range=value_range,
+        colormap=colormap,
     )
     return mat, selector
 
@@ -1,9 +1,127 @@
 # -*- coding: utf-8 -*-
 """"""
+import logging
+import time
+import typing
+
 import numpy as np
 
 from .bpy_helper import needs_bpy_bmesh
 from .material_shader import create_vertex_color_material
+from .mesh_io import load_mesh_mmap
+from .profiling import stage
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+# value range that is mapped onto the colormap for scalar values by default
+DEFAULT_SCALAR_RANGE = (0.0, 3.5)
+
+# 'full': blender's mesh.validate(), 'fast': numpy checks of the input arrays,
+# 'none': trust the input (e.g. from a producer that guarantees valid indices)
+VALIDATE_MODES = ("full", "fast", "none")
+
+
+def check_mesh_arrays(
+    num_vertices: int,
+    vertex_index: np.ndarray,
+    loop_start: np.ndarray,
+    loop_total: np.ndarray,
+):
+    """Cheap vectorized checks of index bounds and loop totals.
+
+    :raises ValueError: if the arrays do not describe a valid polygon mesh
+    """
+    if vertex_index.size > 0:
+        if vertex_index.min() < 0 or vertex_index.max() >= num_vertices:
+            raise ValueError(
+                "Vertex indices out of bounds [0, {}).".format(num_vertices)
+            )
+    if loop_start.shape != loop_total.shape:
+        raise ValueError("loop_start and loop_total differ in shape.")
+    if loop_total.size == 0:
+        if vertex_index.size > 0:
+            raise ValueError("Loops without polygons.")
+        return
+    if loop_total.min() < 3:
+        raise ValueError("Polygons need at least three loops.")
+    if int(loop_total.sum()) != vertex_index.shape[0]:
+        raise ValueError("Sum of loop totals does not match the number of loops.")
+    if loop_start[0] != 0 or np.any(np.diff(loop_start) != loop_total[:-1]):
+        raise ValueError("Polygon loop starts are not contiguous.")
+
+
+def check_mesh_input(
+    validate: str,
+    num_vertices: int,
+    vertex_index: np.ndarray,
+    loop_start: np.ndarray,
+    loop_total: np.ndarray,
+):
+    """Checks of the mesh arrays in 'fast' validate mode (see VALIDATE_MODES),
+    before the mesh is created. Nothing is left behind for invalid input then.
+    """
+    if validate not in VALIDATE_MODES:
+        raise ValueError("Unknown validate mode '{}'.".format(validate))
+    if validate == "fast":
+        with stage("mesh_check") as s:
+            s.count("loops", vertex_index.shape[0])
+            check_mesh_arrays(num_vertices, vertex_index, loop_start, loop_total)
+
+
+def finalize_mesh(mesh, validate: str = "full"):
+    """mesh.update() followed by validation in the given mode (see
+    VALIDATE_MODES). 'fast' checks are done before the mesh is created, see
+    check_mesh_input.
+    """
+    if validate not in VALIDATE_MODES:
+        raise ValueError("Unknown validate mode '{}'.".format(validate))
+
+    with stage("mesh_finalize", validate=validate) as s:
+        s.count("vertices", len(mesh.vertices))
+        s.count("polygons", len(mesh.polygons))
+        t_start = time.perf_counter()
+        mesh.update()
+        t_update = time.perf_counter()
+        if validate == "full":
+            mesh.validate()
+        t_end = time.perf_counter()
+
+    logger.info(
+        "Finalized mesh '{}' (validate='{}'): update {:.3f}s, validation {:.3f}s.".format(
+            mesh.name,
+            validate,
+            t_update - t_start,
+            t_end - t_update,
+        )
+    )
+
+
+def prepare_mesh_arrays(vertices: np.ndarray, triangles: np.ndarray) -> dict:
+    """Flat arrays as expected by foreach_set (numpy only, no bpy)."""
+    assert vertices.ndim == 2 and vertices.shape[1] == 3
+    assert triangles.ndim == 2 and triangles.shape[1] == 3
+    assert triangles.dtype in [np.int32, np.int64] and vertices.dtype in [
+        np.float32,
+        np.float64,
+    ]
+
+    vertex_index = np.ascontiguousarray(triangles, dtype=np.int32).reshape((-1))
+    num_polygons = vertex_index.shape[0] // 3
+    return {
+        "num_vertices": vertices.shape[0],
+        "co": np.ascontiguousarray(vertices, dtype=np.float32).reshape((-1)),
+        "vertex_index": vertex_index,
+        "loop_start": np.arange(0, vertex_index.shape[0], 3, np.int32),
+        "loop_total": np.full(fill_value=3, shape=(num_polygons,), dtype=np.int32),
+    }
 
 
 @needs_bpy_bmesh(run_anyway=True)
@@ -14,25 +132,29 @@ def create_mesh(
     face_colors: {str: np.ndarray} = None,
     scalar_values: {str: np.ndarray} = None,
     use_smooth: bool = True,
+    scalar_range=DEFAULT_SCALAR_RANGE,
+    validate: str = "full",
     *,
     name: str,
+    prepared: dict = None,
     bpy,
 ):
-    assert vertices.ndim == 2 and vertices.shape[1] == 3
-    assert triangles.ndim == 2 and triangles.shape[1] == 3
-    assert triangles.dtype in [np.int32, np.int64] and vertices.dtype in [
-        np.float32,
-        np.float64,
-    ]
-
-    # Vertices and edges (straightforward)
-    num_vertices = vertices.shape[0]
-    vertices = vertices.reshape((-1))
-    vertex_index = triangles.reshape((-1))
+    """
+    :param prepared: result of prepare_mesh (skips the numpy conversions)
+    """
+    if prepared is None:
+        prepared = prepare_mesh_arrays(vertices, triangles)
+    vertex_colors = prepared.get("vertex_colors", vertex_colors)
+    face_colors = prepared.get("face_colors", face_colors)
+
+    num_vertices = prepared["num_vertices"]
+    vertices = prepared["co"]
+    vertex_index = prepared["vertex_index"]
     num_vertex_indices = vertex_index.shape[0]
-    loop_start = np.arange(0, num_vertex_indices, 3, np.int32)
-    loop_total = np.full(fill_value=3, shape=(num_vertex_indices // 3,), dtype=np.int32)
+    loop_start = prepared["loop_start"]
+    loop_total = prepared["loop_total"]
     num_loops = loop_start.shape[0]
+    check_mesh_input(validate, num_vertices, vertex_index, loop_start, loop_total)
 
     # Create mesh object based on the arrays above
     try:
@@ -70,38 +192,86 @@ def create_mesh(
 
     if scalar_values is not None:
         attr_keys_scalar.update(
-            add_vertex_colors_from_scalar(mesh, vertex_index, scalar_values)
+            add_vertex_colors_from_scalar(
+                mesh, vertex_index, scalar_values, scalar_range
+            )
         )
 
-    mesh.update()
-    mesh.validate()
+    finalize_mesh(mesh, validate)
     return mesh, attr_keys_rgb, attr_keys_scalar
 
 
+def has_attribute_api(mesh) -> bool:
+    """Generic mesh attributes (blender 2.93+) instead of legacy vertex colors."""
+    return hasattr(mesh, "attributes")
+
+
+def _check_uint8_colors(colors: np.ndarray):
+    if colors.dtype != np.uint8 or colors.ndim != 2 or colors.shape[-1] not in [3, 4]:
+        raise ValueError("Need vertex colors in RGB (0-255) uint8 format.")
+
+
+def _to_float_rgba(colors: np.ndarray) -> np.ndarray:
+    colors = colors.astype(np.float32) / 255.0
+    if colors.shape[-1] == 3:
+        colors = np.concatenate((colors, np.ones_like(colors[:, :1])), axis=-1)
+    return colors
+
+
+def prepare_colors(colors: np.ndarray) -> np.ndarray:
+    """uint8 RGB(A) colors as float32 RGBA in [0, 1]. Colors that are already in
+    this format (see prepare_mesh) are returned unchanged.
+    """
+    if colors.dtype == np.float32 and colors.ndim == 2 and colors.shape[-1] == 4:
+        return colors
+    _check_uint8_colors(colors)
+    return _to_float_rgba(colors)
+
+
+def srgb_to_linear(rgba: np.ndarray) -> np.ndarray:
+    """Linear float RGBA of sRGB float RGBA colors [..., 4], alpha is kept."""
+    rgb = rgba[..., :3]
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, np.power((rgb + 0.055) / 1.055, 2.4))
+    return np.concatenate((linear, rgba[..., 3:]), axis=-1).astype(np.float32)
+
+
+def _add_byte_color_attribute(mesh, name: str, colors: np.ndarray, domain: str):
+    """Store uint8 colors as byte color attribute (4 bytes per element)."""
+    attr = mesh.attributes.new(name=name, type="BYTE_COLOR", domain=domain)
+    values = prepare_colors(colors)
+    try:
+        # blender 3.4+: write the (sRGB) byte values without color management
+        attr.data.foreach_set("color_srgb", values.reshape([-1]))
+    except (AttributeError, TypeError):
+        # 'color' is linear, blender converts it back to sRGB bytes
+        attr.data.foreach_set("color", srgb_to_linear(values).reshape([-1]))
+
+
+def _add_float_attribute(mesh, name: str, values: np.ndarray, domain: str = "POINT"):
+    attr = mesh.attributes.new(name=name, type="FLOAT", domain=domain)
+    attr.data.foreach_set("value", values.astype(np.float32, copy=False))
+
+
+def _add_loop_color_layer(mesh, name: str, loop_colors: np.ndarray):
+    """Legacy per loop float RGBA colors (blender < 2.93)."""
+    vcol_lay = mesh.vertex_colors.new(name=name)
+    vcol_lay.data.foreach_set("color", loop_colors.reshape([-1]))
+
+
 def add_vertex_color_layers_from_face_colors(
     mesh, vertex_indices, face_colors: {str: np.ndarray}
 ) -> {str}:
     vertex_attr_keys = set()
     for fcolor_name, fcolors in face_colors.items():
-        if (
-            fcolors.dtype != np.uint8
-            or fcolors.ndim != 2
-            or fcolors.shape[-1] not in [3, 4]
-        ):
-            raise ValueError("Need vertex colors in RGB (0-255) uint8 format.")
-
-        fcolors = fcolors.astype(np.float32) / 255.0
-        if fcolors.shape[-1] == 3:
-            fcolors = np.concatenate((fcolors, np.ones_like(fcolors[:, :1])), axis=-1)
-
-        # repeat face colors 3 times (for each vertex)
-        fcolors = np.repeat(fcolors, 3, axis=0)
-        fcolors = np.reshape(fcolors, [-1])
-        assert fcolors.shape[0] == 4 * vertex_indices.shape[0]
+        fcolors = prepare_colors(fcolors)
+        assert fcolors.shape[0] * 3 == vertex_indices.shape[0]
 
         attr_key = "fcolor_{}".format(fcolor_name)
-        vcol_lay = mesh.vertex_colors.new(name=attr_key)
-        vcol_lay.data.foreach_set("color", fcolors)
+        if has_attribute_api(mesh):
+            _add_byte_color_attribute(mesh, attr_key, fcolors, domain="FACE")
+        else:
+            # repeat face colors 3 times (for each vertex)
+            _add_loop_color_layer(mesh, attr_key, np.repeat(fcolors, 3, axis=0))
         vertex_attr_keys.add(attr_key)
     return vertex_attr_keys
 
@@ -112,69 +282,238 @@ def add_vertex_color_layers(
 
     vertex_attr_keys = set()
     for vcolor_name, vcolors in vertex_colors.items():
-        if (
-            vcolors.dtype != np.uint8
-            or vcolors.ndim != 2
-            or vcolors.shape[-1] not in [3, 4]
-        ):
-            raise ValueError("Need vertex colors in RGB (0-255) uint8 format.")
-
-        vcolors = vcolors.astype(np.float32) / 255.0
-        if vcolors.shape[-1] == 3:
-            vcolors = np.concatenate((vcolors, np.ones_like(vcolors[:, :1])), axis=-1)
-
-        # replicate vertex colors for each triangle at a vertex
-        vcolors = vcolors[vertex_indices]
-        vcolors = vcolors.reshape([-1])
-        assert vcolors.shape[0] == 4 * vertex_indices.shape[0]
+        vcolors = prepare_colors(vcolors)
 
         attr_key = "vcolor_{}".format(vcolor_name)
+        if has_attribute_api(mesh):
+            _add_byte_color_attribute(mesh, attr_key, vcolors, domain="POINT")
+        else:
+            # replicate vertex colors for each triangle at a vertex
+            _add_loop_color_layer(mesh, attr_key, vcolors[vertex_indices])
         vertex_attr_keys.add(attr_key)
-        vcol_lay = mesh.vertex_colors.new(name="vcolor_{}".format(vcolor_name))
-        vcol_lay.data.foreach_set("color", vcolors)
 
     return vertex_attr_keys
 
 
 def add_vertex_colors_from_scalar(
-    mesh, vertex_indices, scalar_values: {str: np.ndarray}
+    mesh,
+    vertex_indices,
+    scalar_values: {str: np.ndarray},
+    value_range=DEFAULT_SCALAR_RANGE,
 ) -> {str}:
-    def add_values(v, name):
-        colors = np.tile(v[:, None], reps=[1, 3])
-        # add alpha
-        colors = np.concatenate((colors, np.ones_like(colors[:, :1])), axis=-1)
-
-        # replicate vertex colors for each triangle at a vertex
-        colors = colors[vertex_indices]
-        colors = colors.reshape([-1])
-        assert colors.shape[0] == 4 * vertex_indices.shape[0]
-
-        attr_key = "vcolor_{}".format(name)
-        vcol_lay = mesh.vertex_colors.new(name=attr_key)
-        vcol_lay.data.foreach_set("color", colors)
-        return attr_key
+    """Store raw scalar values as float attributes. Mapping to colors happens in
+    the material (see ColorAttrSelector.set_value_range).
 
+    Legacy vertex color layers cannot hold arbitrary floats. In that case the
+    values are normalized with value_range and baked into grayscale colors.
+    """
     vertex_attr_keys = set()
     for scolor_name, s_values in scalar_values.items():
         if s_values.dtype != np.float32 or s_values.ndim != 1:
             raise ValueError("Need scalar values in [N] float32 format.")
 
-        # Todo: learn how blender handles value ranges.
-        # Todo: use something that is less random.
-        value_ranges = [
-            (0.0, 3.5),
-        ]
-
-        for r in value_ranges:
-            values = (s_values - r[0]) / (r[1] - r[0])
+        attr_key = "scalar_{}".format(scolor_name)
+        if has_attribute_api(mesh):
+            _add_float_attribute(mesh, attr_key, s_values)
+        else:
+            values = (s_values - value_range[0]) / (value_range[1] - value_range[0])
             values = np.clip(values, 0.0, 1.0)
-            vertex_attr_keys.add(
-                add_values(values, "{}_{:.2f}_{:.2f}".format(scolor_name, r[0], r[1]))
-            )
+            colors = np.tile(values[:, None], reps=[1, 3])
+            # add alpha
+            colors = np.concatenate((colors, np.ones_like(colors[:, :1])), axis=-1)
+            # replicate vertex colors for each triangle at a vertex
+            _add_loop_color_layer(mesh, attr_key, colors[vertex_indices])
+        vertex_attr_keys.add(attr_key)
 
     return vertex_attr_keys
 
 
+def _contiguous_chunks(source: np.ndarray, dtype, chunk_size: int):
+    """Flat buffer of source in dtype, filled chunk by chunk. Returns source itself
+    (no copy) if it already has the requested memory layout.
+    """
+    dtype = np.dtype(dtype)
+    if source.dtype == dtype and source.flags["C_CONTIGUOUS"]:
+        return source.reshape((-1))
+
+    target = np.empty(source.size, dtype=dtype)
+    num_cols = source.size // max(source.shape[0], 1)
+    for start in range(0, source.shape[0], chunk_size):
+        chunk = source[start : start + chunk_size]
+        target[start * num_cols : (start + chunk.shape[0]) * num_cols] = chunk.reshape(
+            (-1)
+        )
+    return target
+
+
+def _foreach_set_chunked(
+    collection, attr: str, source: np.ndarray, dtype, chunk_size: int
+):
+    buffer = _contiguous_chunks(source, dtype, chunk_size)
+    collection.foreach_set(attr, buffer)
+    # free the converted copy before the next property is uploaded
+    del buffer
+
+
+def _add_byte_color_attribute_chunked(
+    mesh, name: str, colors: np.ndarray, chunk_size: int
+):
+    """Point domain byte color attribute of (memory mapped) uint8 colors. The
+    python API only writes byte colors as floats, so one float RGBA buffer is
+    filled chunk by chunk straight from the uint8 source.
+    """
+    attr = mesh.attributes.new(name=name, type="BYTE_COLOR", domain="POINT")
+    num_channels = colors.shape[1]
+    values = np.ones((colors.shape[0], 4), dtype=np.float32)
+    for start in range(0, colors.shape[0], chunk_size):
+        np.divide(
+            colors[start : start + chunk_size],
+            np.float32(255.0),
+            out=values[start : start + chunk_size, :num_channels],
+        )
+    try:
+        # blender 3.4+: write the (sRGB) byte values without color management
+        attr.data.foreach_set("color_srgb", values.reshape((-1)))
+    except (AttributeError, TypeError):
+        # 'color' is linear, converted in place to keep one buffer
+        for start in range(0, colors.shape[0], chunk_size):
+            chunk = values[start : start + chunk_size]
+            chunk[...] = srgb_to_linear(chunk)
+        attr.data.foreach_set("color", values.reshape((-1)))
+
+
+@needs_bpy_bmesh(run_anyway=True)
+def create_mesh_streaming(
+    vertices: np.ndarray,
+    triangles: np.ndarray,
+    vertex_colors: {str: np.ndarray} = None,
+    use_smooth: bool = True,
+    chunk_size: int = 1 << 20,
+    validate: str = "full",
+    *,
+    name: str,
+    bpy,
+):
+    """Create a (very large) triangle mesh from memory mapped or strided arrays.
+
+    The mesh is sized up front and filled property by property. At most one
+    converted property buffer is alive at any time; sources that already have the
+    right dtype and layout (e.g. float32 vertices in a .npy file opened with
+    mmap_mode='r') are passed to blender without any copy.
+    """
+    assert vertices.ndim == 2 and vertices.shape[1] == 3
+    assert triangles.ndim == 2 and triangles.shape[1] == 3
+
+    try:
+        if name in bpy.data.meshes:
+            raise RuntimeError("Mesh '{}' already exists.".format(name))
+    except AttributeError:
+        pass
+    if validate not in VALIDATE_MODES:
+        raise ValueError("Unknown validate mode '{}'.".format(validate))
+
+    num_vertices = vertices.shape[0]
+    num_triangles = triangles.shape[0]
+
+    if validate == "fast" and num_triangles > 0:
+        # streamed check, the index buffer is never fully loaded here
+        for start in range(0, num_triangles, chunk_size):
+            chunk = triangles[start : start + chunk_size]
+            if chunk.min() < 0 or chunk.max() >= num_vertices:
+                raise ValueError(
+                    "Vertex indices out of bounds [0, {}).".format(num_vertices)
+                )
+
+    mesh = bpy.data.meshes.new(name=name)
+    mesh.vertices.add(num_vertices)
+    mesh.loops.add(3 * num_triangles)
+    mesh.polygons.add(num_triangles)
+
+    _foreach_set_chunked(mesh.vertices, "co", vertices, np.float32, chunk_size)
+    _foreach_set_chunked(
+        mesh.loops, "vertex_index", triangles, np.int32, chunk_size
+    )
+
+    mesh.polygons.foreach_set(
+        "loop_start", np.arange(0, 3 * num_triangles, 3, dtype=np.int32)
+    )
+    mesh.polygons.foreach_set(
+        "loop_total", np.full(fill_value=3, shape=(num_triangles,), dtype=np.int32)
+    )
+    mesh.polygons.foreach_set(
+        "use_smooth", np.full(fill_value=use_smooth, shape=(num_triangles,), dtype=bool)
+    )
+
+    attr_keys_rgb = set()
+    if vertex_colors is not None:
+        for vcolor_name, vcolors in vertex_colors.items():
+            if vcolors.dtype != np.uint8 or vcolors.shape[-1] not in [3, 4]:
+                raise ValueError("Need vertex colors in RGB (0-255) uint8 format.")
+            attr_key = "vcolor_{}".format(vcolor_name)
+            if has_attribute_api(mesh):
+                _add_byte_color_attribute_chunked(mesh, attr_key, vcolors, chunk_size)
+            else:
+                # replicate vertex colors for each triangle at a vertex
+                loop_colors = np.empty((3 * num_triangles, 4), dtype=np.float32)
+                for start in range(0, num_triangles, chunk_size):
+                    chunk = np.asarray(triangles[start : start + chunk_size])
+                    loop_colors[3 * start : 3 * (start + chunk.shape[0])] = (
+                        _to_float_rgba(np.asarray(vcolors[chunk.reshape((-1))]))
+                    )
+                _add_loop_color_layer(mesh, attr_key, loop_colors)
+                del loop_colors
+            attr_keys_rgb.add(attr_key)
+
+    # loop starts and totals are generated here, 'fast' checks are done above
+    finalize_mesh(mesh, validate)
+    return mesh, attr_keys_rgb
+
+
+@needs_bpy_bmesh()
+def add_object_from_mesh_file(
+    filepath: str,
+    *,
+    scene,
+    name_prefix: str,
+    use_smooth: bool = True,
+    chunk_size: int = 1 << 20,
+    validate: str = "full",
+    bpy,
+):
+    """Add a large mesh from a binary PLY file or a directory with
+    'vertices.npy', 'triangles.npy' (and 'vertex_colors.npy').
+    """
+    source = load_mesh_mmap(filepath)
+    vertex_colors = None
+    if "vertex_colors" in source:
+        vertex_colors = {"file": source["vertex_colors"]}
+
+    mesh, attr_keys_rgb = create_mesh_streaming(
+        source["vertices"],
+        source["triangles"],
+        vertex_colors,
+        use_smooth,
+        chunk_size,
+        validate,
+        name="{}_mesh".format(name_prefix),
+    )
+    del source
+
+    obj = bpy.data.objects.new("{}_obj".format(name_prefix), mesh)
+    mat, select_vertex_color = create_vertex_color_material(
+        list(attr_keys_rgb),
+        [],
+        (0.0, 0.0, 0.0, 1.0),
+        mode="select",
+        name_material="{}_material".format(name_prefix),
+    )
+    select_vertex_color(0 if attr_keys_rgb else -1)
+    obj.data.materials.append(mat)
+
+    scene.collection.objects.link(obj)
+    return obj, {"vertex_color_selector": select_vertex_color}
+
+
 @needs_bpy_bmesh(run_anyway=True)
 def create_obj_from_mesh(
     vertices: np.ndarray,
@@ -182,10 +521,24 @@ def create_obj_from_mesh(
     vertex_colors: {str: np.ndarray} = None,
     face_colors: {str: np.ndarray} = None,
     scalar_values: {str: np.ndarray} = None,
+    use_smooth: bool = True,
+    material=None,
+    scalar_range=DEFAULT_SCALAR_RANGE,
+    colormap="turbo",
+    validate: str = "full",
     *,
     name_prefix: str,
+    prepared: dict = None,
     bpy,
 ):
+    """
+    :param material: If given, use this (shared) material instead of creating a
+        vertex color material for the object. No color selector is returned then.
+    :param scalar_range: (min, max) of scalar values mapped onto the colormap
+    :param colormap: name of a colormap in COLORMAPS or list of RGB colors
+    :param validate: mesh validation mode, one of VALIDATE_MODES
+    :param prepared: result of prepare_mesh
+    """
 
     obj_name = "{}_obj".format(name_prefix)
     try:
@@ -200,21 +553,33 @@ def create_obj_from_mesh(
         vertex_colors,
         face_colors,
         scalar_values,
+        use_smooth,
+        scalar_range,
+        validate,
         name="{}_mesh".format(name_prefix),
+        prepared=prepared,
     )
     obj = bpy.data.objects.new(obj_name, mesh)
 
+    if material is not None:
+        obj.data.materials.append(material)
+        return obj, None
+
     default_color = 0.0, 0.0, 0.0, 1.0  # black
-    mat, select_vertex_color = create_vertex_color_material(
-        list(attr_keys_rgb),
-        list(attr_keys_scalar),
-        default_color,
-        mode="select",
-        name_material="{}_material".format(name_prefix),
-    )
+    with stage("material"):
+        mat, select_vertex_color = create_vertex_color_material(
+            list(attr_keys_rgb),
+            list(attr_keys_scalar),
+            default_color,
+            mode="select",
+            name_material="{}_material".format(name_prefix),
+            # legacy vertex color layers hold values that are already normalized
+            value_range=scalar_range if has_attribute_api(mesh) else (0.0, 1.0),
+            colormap=colormap,
+        )
 
     # Todo: handle multiple vertex color layers
-    if vertex_colors is None:
+    if vertex_colors is None and face_colors is None:
         select_vertex_color(-1)
     else:
         select_vertex_color(0)
@@ -223,15 +588,30 @@ def create_obj_from_mesh(
     return obj, select_vertex_color
 
 
+def prepare_mesh(**task_kwargs) -> {str: typing.Any}:
+    """Numpy part of add_object_from_mesh. Does not touch bpy and can run in a
+    worker thread. Returns the task arguments for add_object_from_mesh.
+    """
+    prepared = prepare_mesh_arrays(task_kwargs["vertices"], task_kwargs["triangles"])
+    for key in ("vertex_colors", "face_colors"):
+        if task_kwargs.get(key) is not None:
+            prepared[key] = {k: prepare_colors(v) for k, v in task_kwargs[key].items()}
+    return dict(task_kwargs, prepared=prepared)
+
+
 def add_object_from_mesh(
     vertices: np.ndarray,
     triangles: np.ndarray,
     vertex_colors: {str: np.ndarray} = None,
     face_colors: {str: np.ndarray} = None,
     scalar_values: {str: np.ndarray} = None,
+    scalar_range=DEFAULT_SCALAR_RANGE,
+    colormap="turbo",
+    validate: str = "full",
     *,
     scene,
     name_prefix: str,
+    prepared: dict = None,
 ):
     obj, select_vertex_color = create_obj_from_mesh(
         vertices,
@@ -239,7 +619,11 @@ def add_object_from_mesh(
         vertex_colors,
         face_colors,
         scalar_values,
+        scalar_range=tuple(float(x) for x in np.reshape(scalar_range, (2,))),
+        colormap=colormap,
+        validate=str(validate),
         name_prefix=name_prefix,
+        prepared=prepared,
     )
 
     scene.collection.objects.link(obj)
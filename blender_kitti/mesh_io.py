@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Memory mapped mesh sources (numpy only).
+
+Arrays returned by these functions are (possibly strided) views into memory mapped
+files. Nothing is read before the data is accessed, so large meshes can be streamed
+into blender chunk by chunk (see mesh.create_mesh_streaming).
+"""
+import pathlib
+
+import numpy as np
+
+
+_PLY_TYPES = {
+    "char": "i1",
+    "int8": "i1",
+    "uchar": "u1",
+    "uint8": "u1",
+    "short": "i2",
+    "int16": "i2",
+    "ushort": "u2",
+    "uint16": "u2",
+    "int": "i4",
+    "int32": "i4",
+    "uint": "u4",
+    "uint32": "u4",
+    "float": "f4",
+    "float32": "f4",
+    "double": "f8",
+    "float64": "f8",
+}
+
+_PLY_FORMATS = {
+    "binary_little_endian": "<",
+    "binary_big_endian": ">",
+}
+
+
+def _read_ply_header(filepath: pathlib.Path):
+    elements = []
+    byte_order = None
+    with open(str(filepath), "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError("'{}' is not a PLY file.".format(filepath))
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError("Unexpected end of PLY header in '{}'.".format(filepath))
+            words = line.decode("ascii").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if words[0] == "end_header":
+                break
+            if words[0] == "format":
+                try:
+                    byte_order = _PLY_FORMATS[words[1]]
+                except KeyError:
+                    raise NotImplementedError(
+                        "Cannot memory map PLY format '{}'.".format(words[1])
+                    )
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                if words[1] == "list":
+                    elements[-1][2].append((words[4], words[2], words[3]))
+                else:
+                    elements[-1][2].append((words[2], words[1], None))
+        header_size = f.tell()
+
+    if byte_order is None:
+        raise ValueError("Missing format line in PLY header of '{}'.".format(filepath))
+    return byte_order, elements, header_size
+
+
+def _element_dtype(byte_order: str, properties, list_length: int = None):
+    fields = []
+    for name, t, list_item_type in properties:
+        if list_item_type is None:
+            fields.append((name, byte_order + _PLY_TYPES[t]))
+        else:
+            if list_length is None:
+                raise NotImplementedError(
+                    "Cannot memory map PLY list property '{}'.".format(name)
+                )
+            fields.append(("{}_count".format(name), byte_order + _PLY_TYPES[t]))
+            fields.append(
+                (name, byte_order + _PLY_TYPES[list_item_type], (list_length,))
+            )
+    return np.dtype(fields)
+
+
+def _field_block_view(data: np.ndarray, names: [str]) -> np.ndarray:
+    """[N, len(names)] view of consecutive fields with the same dtype (no copy)."""
+    fields = data.dtype.fields
+    base = fields[names[0]][0]
+    offset = fields[names[0]][1]
+    for i, name in enumerate(names):
+        if fields[name][0] != base or fields[name][1] != offset + i * base.itemsize:
+            return np.stack([data[n] for n in names], axis=-1)
+    return np.ndarray(
+        shape=(data.shape[0], len(names)),
+        dtype=base,
+        buffer=data,
+        offset=offset,
+        strides=(data.dtype.itemsize, base.itemsize),
+    )
+
+
+def read_ply_mmap(filepath) -> {str: np.ndarray}:
+    """Memory map a binary triangle mesh PLY file.
+
+    :return: dict with 'vertices' [N, 3], 'triangles' [M, 3] and optionally
+        'vertex_colors' [N, 3|4] (uint8)
+    """
+    filepath = pathlib.Path(filepath)
+    byte_order, elements, offset = _read_ply_header(filepath)
+
+    result = {}
+    for name, count, properties in elements:
+        if name == "face":
+            dtype = _element_dtype(byte_order, properties, list_length=3)
+        else:
+            dtype = _element_dtype(byte_order, properties)
+
+        data = np.memmap(
+            str(filepath), dtype=dtype, mode="r", offset=offset, shape=(count,)
+        )
+        offset += count * dtype.itemsize
+
+        if name == "vertex":
+            result["vertices"] = _field_block_view(data, ["x", "y", "z"])
+            channels = [c for c in ("red", "green", "blue", "alpha") if c in dtype.names]
+            if len(channels) >= 3:
+                result["vertex_colors"] = _field_block_view(data, channels)
+        elif name == "face":
+            key = "vertex_indices" if "vertex_indices" in dtype.names else "vertex_index"
+            counts = data["{}_count".format(key)]
+            if count > 0 and not (counts == 3).all():
+                raise NotImplementedError("Only triangle meshes are supported.")
+            result["triangles"] = data[key]
+
+    if "vertices" not in result or "triangles" not in result:
+        raise ValueError("'{}' does not contain a triangle mesh.".format(filepath))
+    return result
+
+
+def load_mesh_npy(directory) -> {str: np.ndarray}:
+    """Memory map 'vertices.npy', 'triangles.npy' and optionally
+    'vertex_colors.npy' from the given directory.
+    """
+    directory = pathlib.Path(directory)
+    result = {}
+    for key in ("vertices", "triangles", "vertex_colors"):
+        filepath = directory / "{}.npy".format(key)
+        if filepath.is_file():
+            result[key] = np.load(str(filepath), mmap_mode="r")
+        elif key != "vertex_colors":
+            raise FileNotFoundError("Cannot find mesh file '{}'.".format(filepath))
+    return result
+
+
+def load_mesh_mmap(path) -> {str: np.ndarray}:
+    path = pathlib.Path(path)
+    if path.is_dir():
+        return load_mesh_npy(path)
+    if path.suffix.lower() == ".ply":
+        return read_ply_mmap(path)
+    raise ValueError("Unknown mesh source '{}'.".format(path))
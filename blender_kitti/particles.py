@@ -4,16 +4,26 @@ import typing
 import logging
 import numpy as np
 
-import bpy
-import bmesh
+try:
+    import bpy
+    import bmesh
+except ImportError:
+    # outside of blender, see recording_bpy
+    bpy = None
+    bmesh = None
 
 from .material_shader import (
     create_flow_material,
     create_simple_material,
     create_uv_mapped_material,
+    create_attribute_color_material,
     add_nodes_to_material,
 )
-
+from .mesh import check_mesh_input, create_obj_from_mesh, finalize_mesh
+from .bpy_helper import needs_bpy_bmesh
+from .box_geometry import box_wireframe_tubes, num_tube_triangles_per_box
+from .profiling import stage
+from .render_arrays import linear_to_srgb8
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -26,95 +36,138 @@ handler.setLevel(logging.INFO)
 logger.addHandler(handler)
 
 
-def _create_instancer_mesh(positions: np.ndarray, name="mesh_points"):
-    """Create mesh with where each point is a pseudo face
-    (three vertices at the same position.
+def _prepare_instancer(positions: np.ndarray) -> {str: np.ndarray}:
+    """Arrays of the instancer mesh (numpy only): each point is a pseudo face
+    (three vertices at the same position) with the point index as u coordinate.
     """
     assert positions.ndim == 2
     assert positions.shape[1] == 3
 
+    num_points = len(positions)
+    point_index = np.arange(num_points, dtype=np.float32)
+    return {
+        "co": np.repeat(positions.astype(np.float32), 3, axis=0).reshape((-1)),
+        "vertex_index": np.arange(0, 3 * num_points, dtype=np.int32),
+        "loop_start": np.arange(0, 3 * num_points, 3, np.int32),
+        "loop_total": np.full(fill_value=3, shape=(num_points,), dtype=np.int32),
+        # one uv per loop, loop i belongs to point i // 3
+        "uv": np.stack(
+            (np.repeat(point_index, 3), np.zeros(3 * num_points, dtype=np.float32)),
+            axis=-1,
+        ).reshape((-1)),
+    }
+
+
+def _prepare_color_pixels(colors_rgba: np.ndarray) -> np.ndarray:
+    """Flat float32 RGBA pixels of a color image with one pixel per point."""
+    assert colors_rgba.ndim == 2
+    # dtype and alpha channel checks
+    if colors_rgba.dtype == np.float32:
+        pass
+    elif colors_rgba.dtype == np.uint8:
+        colors_rgba = colors_rgba.astype(np.float32) / 255.0
+    else:
+        raise NotImplementedError(
+            "Cannot handle colors_rgba with dtype {}.".format(str(colors_rgba.dtype))
+        )
+    if colors_rgba.shape[1] == 3:
+        colors_rgba = np.concatenate(
+            (colors_rgba, np.ones_like(colors_rgba[:, :1])), axis=-1
+        )
+    elif colors_rgba.shape[1] == 4:
+        pass
+    else:
+        raise NotImplementedError(
+            "Cannot handle colors_rgba with shape {}.".format(colors_rgba.shape)
+        )
+    assert colors_rgba.shape[1] == 4
+    return np.ascontiguousarray(colors_rgba).reshape((-1))
+
+
+def _prepare_particles(positions: np.ndarray, colors=None) -> dict:
+    """Numpy part of a particle system: instancer arrays and color pixels."""
+    if colors is None:
+        pixels = None
+    elif isinstance(colors, np.ndarray):
+        pixels = _prepare_color_pixels(colors)
+    else:
+        pixels = [_prepare_color_pixels(c) for c in colors]
+    return {"instancer": _prepare_instancer(positions), "pixels": pixels}
+
+
+def _create_instancer_mesh(
+    positions: np.ndarray, name="mesh_points", validate: str = "full", arrays=None
+):
+    """Create mesh with where each point is a pseudo face
+    (three vertices at the same position.
+    """
+    if arrays is None:
+        arrays = _prepare_instancer(positions)
+
     if name in bpy.data.meshes:
         raise RuntimeError("Mesh '{}' already exists.".format(name))
-    mesh = bpy.data.meshes.new(name=name)
 
-    num_vertices = len(positions)
+    num_vertices = arrays["loop_start"].shape[0]
+    check_mesh_input(
+        validate,
+        3 * num_vertices,
+        arrays["vertex_index"],
+        arrays["loop_start"],
+        arrays["loop_total"],
+    )
+
+    mesh = bpy.data.meshes.new(name=name)
     mesh.vertices.add(num_vertices * 3)
-    mesh.vertices.foreach_set("co", np.repeat(positions, 3, axis=0).reshape((-1)))
+    mesh.vertices.foreach_set("co", arrays["co"])
     mesh.loops.add(num_vertices * 3)
-    mesh.loops.foreach_set("vertex_index", np.arange(0, 3 * num_vertices))
-
-    loop_start = np.arange(0, 3 * num_vertices, 3, np.int32)
-    loop_total = np.full(fill_value=3, shape=(num_vertices,), dtype=np.int32)
-    num_loops = loop_start.shape[0]
+    mesh.loops.foreach_set("vertex_index", arrays["vertex_index"])
 
-    mesh.polygons.add(num_loops)
-    mesh.polygons.foreach_set("loop_start", loop_start)
-    mesh.polygons.foreach_set("loop_total", loop_total)
+    mesh.polygons.add(num_vertices)
+    mesh.polygons.foreach_set("loop_start", arrays["loop_start"])
+    mesh.polygons.foreach_set("loop_total", arrays["loop_total"])
 
-    mesh.update()
-    mesh.validate()
+    finalize_mesh(mesh, validate)
 
-    logger.info("Created instancer mesh with {} vertices.".format(len(positions)))
+    logger.info("Created instancer mesh with {} vertices.".format(num_vertices))
 
     return mesh
 
 
 def _create_instancer_obj(
-    positions: np.ndarray, name_instancer_obj: str, name_mesh: str
+    positions: np.ndarray,
+    name_instancer_obj: str,
+    name_mesh: str,
+    validate: str = "full",
+    arrays=None,
 ):
-    assert positions.ndim == 2 and positions.shape[1] == 3
+    if arrays is None:
+        arrays = _prepare_instancer(positions)
 
     if name_instancer_obj in bpy.data.objects:
         raise RuntimeError("Object '{}' already exists.".format(name_instancer_obj))
 
-    mesh = _create_instancer_mesh(positions, name_mesh)
+    mesh = _create_instancer_mesh(positions, name_mesh, validate, arrays)
 
-    vert_uvs = np.repeat(np.arange(0, len(mesh.vertices)), 3, axis=0)
-    # add zero y coordinate
-    vert_uvs = np.stack((vert_uvs, np.zeros_like(vert_uvs)), axis=-1)
     mesh.uv_layers.new(name="per_vertex_dummy_uv")
-    mesh.uv_layers[-1].data.foreach_set(
-        "uv",
-        [
-            uv
-            for pair in [vert_uvs[loop.vertex_index] for loop in mesh.loops]
-            for uv in pair
-        ],
-    )
+    mesh.uv_layers[-1].data.foreach_set("uv", arrays["uv"])
 
     obj_instancer = bpy.data.objects.new(name_instancer_obj, mesh)
     return obj_instancer
 
 
-def _create_color_image(colors_rgba: np.ndarray, name: str):
-    assert colors_rgba.ndim == 2
-    # dtype and alpha channel checks
-    if colors_rgba.dtype == np.float32:
-        pass
-    elif colors_rgba.dtype == np.uint8:
-        colors_rgba = colors_rgba.astype(np.float32) / 255.0
-    else:
-        raise NotImplementedError(
-            "Cannot handle colors_rgba with dtype {}.".format(str(colors_rgba.dtype))
-        )
-    if colors_rgba.shape[1] == 3:
-        colors_rgba = np.concatenate(
-            (colors_rgba, np.ones_like(colors_rgba[:, :1])), axis=-1
-        )
-    elif colors_rgba.shape[1] == 4:
-        pass
-    else:
-        raise NotImplementedError(
-            "Cannot handle colors_rgba with shape {}.".format(colors_rgba.shape)
-        )
-    assert colors_rgba.shape[1] == 4
+def _create_color_image(colors_rgba: np.ndarray, name: str, pixels=None):
+    if pixels is None:
+        pixels = _prepare_color_pixels(colors_rgba)
 
     if name in bpy.data.images:
         raise RuntimeError("Image '{}' already exists.".format(name))
-    image = bpy.data.images.new(name, len(colors_rgba), 1, alpha=True)
+    image = bpy.data.images.new(name, len(pixels) // 4, 1, alpha=True)
 
-    colors_rgba = colors_rgba.reshape((-1))
-    image.pixels = [a for a in colors_rgba]
+    try:
+        image.pixels.foreach_set(pixels)
+    except AttributeError:
+        # blender < 2.83
+        image.pixels[:] = pixels
     # super important. Otherwise the pixel data will just vanish from memory and be
     # lost for certain after saving + loading the file.
     image.pack()
@@ -125,12 +178,16 @@ def _create_particle_instancer(
     name_prefix: str,
     positions: np.ndarray,
     obj_particle,
+    validate: str = "full",
+    arrays=None,
 ):
     # created entities
     name_mesh = "{}_mesh".format(name_prefix)
     name_obj = "{}_obj_instancer".format(name_prefix)
 
-    obj_instancer = _create_instancer_obj(positions, name_obj, name_mesh)
+    obj_instancer = _create_instancer_obj(
+        positions, name_obj, name_mesh, validate, arrays
+    )
 
     obj_particle.parent = obj_instancer
     # instancing from 'fake' faces is necessary for uv mapping to work.
@@ -139,11 +196,11 @@ def _create_particle_instancer(
     return obj_instancer
 
 
-def _add_material_to_particle(name_prefix, colors, obj_particle, material=None):
+def _add_material_to_particle(name_prefix, pixels, obj_particle, material=None):
     """
 
     :param name_prefix:
-    :param colors:
+    :param pixels: color pixels (see _prepare_particles)
     :param obj_particle:
     :return:
     """
@@ -151,18 +208,18 @@ def _add_material_to_particle(name_prefix, colors, obj_particle, material=None):
     name_image = "{}_colors".format(name_prefix)
     name_material = "{}_material".format(name_prefix)
 
-    if colors is not None:
-        if isinstance(colors, np.ndarray):
-            colors = [colors]
+    if pixels is not None:
+        if isinstance(pixels, np.ndarray):
+            pixels = [pixels]
             name_image = [name_image]
             name_material = [name_material]
         else:
-            name_image = [f"{name_image}_{i}" for i in range(len(colors))]
-            name_material = [f"{name_material}_{i}" for i in range(len(colors))]
+            name_image = [f"{name_image}_{i}" for i in range(len(pixels))]
+            name_material = [f"{name_material}_{i}" for i in range(len(pixels))]
 
         color_selector = []
-        for color_arr, ni, nm in zip(colors, name_image, name_material):
-            image = _create_color_image(color_arr, ni)
+        for pixel_arr, ni, nm in zip(pixels, name_image, name_material):
+            image = _create_color_image(None, ni, pixels=pixel_arr)
             if material is None:
                 # the particle obj will use this material
                 logger.info(f"Creating material {ni}.")
@@ -175,9 +232,15 @@ def _add_material_to_particle(name_prefix, colors, obj_particle, material=None):
             obj_particle.data.materials.append(_material)
             color_selector.append(_cs)
     else:
-        material, color_selector = create_simple_material(
-            base_color=(0.1, 0.1, 0.1, 1.0), name_material=name_material
-        )
+        if material is None:
+            # uncolored particles all share the same default material
+            material, color_selector = create_simple_material(
+                base_color=(0.1, 0.1, 0.1, 1.0),
+                name_material="material_particle_default",
+                use_cache=True,
+            )
+        else:
+            color_selector = None
         obj_particle.data.materials.append(material)
 
     return color_selector
@@ -233,20 +296,53 @@ def create_voxel_particle_obj(
     name_prefix: str,
     scene,
     material=None,
+    validate: str = "full",
+    prepared: dict = None,
 ):
+    if prepared is None:
+        prepared = _prepare_particles(coords, colors)
+
     obj_particle = create_cube(name_prefix + "_cube")
     scene.collection.objects.link(obj_particle)
 
-    obj_voxels = _create_particle_instancer(name_prefix, coords, obj_particle)
+    obj_voxels = _create_particle_instancer(
+        name_prefix, coords, obj_particle, validate, prepared["instancer"]
+    )
     if scene is not None:
         scene.collection.objects.link(obj_voxels)
 
-    color_selector = _add_material_to_particle(
-        name_prefix, colors, obj_particle, material
-    )
+    with stage("material"):
+        color_selector = _add_material_to_particle(
+            name_prefix, prepared["pixels"], obj_particle, material
+        )
     return obj_voxels, color_selector
 
 
+def _voxel_coords(voxels: np.ndarray, colors: np.ndarray = None):
+    assert voxels.ndim == 3
+    assert voxels.dtype == np.bool_
+
+    dtype = np.float32
+    deltas = np.asarray([0.2, 0.2, 0.2], dtype=dtype)
+
+    # indices of the occupied voxels in C order, like indexing np.mgrid
+    coords = np.argwhere(voxels).astype(dtype)
+    coords *= deltas
+    if colors is not None:
+        colors = colors[voxels]
+    return coords, colors
+
+
+def prepare_voxels(**task_kwargs) -> {str: typing.Any}:
+    """Numpy part of add_voxels. Does not touch bpy and can run in a worker thread.
+    Returns the task arguments for add_voxels.
+    """
+    coords, colors = _voxel_coords(task_kwargs["voxels"], task_kwargs.get("colors"))
+    prepared = _prepare_particles(coords, colors)
+    prepared["coords"] = coords
+    return dict(task_kwargs, prepared=prepared)
+
+
 def add_voxels(
     scene,
     *,
@@ -254,6 +350,8 @@ def add_voxels(
     colors: np.ndarray = None,
     name_prefix: str = "voxels",
     material=None,
+    validate: str = "full",
+    prepared: dict = None,
 ):
     """
 
@@ -262,55 +360,88 @@ def add_voxels(
     :param name_prefix:
     :param scene:
     :param material:
+    :param validate: mesh validation mode ('full', 'fast' or 'none')
+    :param prepared: result of prepare_voxels
     :return:
     """
-    assert voxels.ndim == 3
-    assert voxels.dtype == np.bool_
-
-    dtype = np.float32
-    deltas = np.asarray([0.2, 0.2, 0.2], dtype=dtype)
-
-    coords = np.mgrid[[slice(x) for x in voxels.shape]].astype(dtype)
-    coords = np.moveaxis(coords, 0, 3)
-    coords *= deltas
-    coords = coords[voxels]
-    colors = colors[voxels]
+    if prepared is None:
+        prepared = prepare_voxels(voxels=voxels, colors=colors)["prepared"]
 
     obj_voxels, color_selector = create_voxel_particle_obj(
-        coords, colors, name_prefix, scene, material
+        prepared["coords"], None, name_prefix, scene, material, validate, prepared
     )
     return obj_voxels, {"color_selector": color_selector}
 
 
-def add_voxel_list(
-    *,
+def _voxel_list_coords(
     indices: np.ndarray,
     grid_shape: np.ndarray,
     grid_origin: np.ndarray,
     voxel_size: np.ndarray,
-    colors: np.ndarray = None,
-    name_prefix: str = "voxel_list",
-    scene,
 ):
-    """"""
     assert indices.ndim == 1
     assert grid_shape.ndim == 1
-    assert indices.shape[0] == colors.shape[0]
 
     dtype = np.float32
     # cubic voxels
     deltas = np.repeat(voxel_size, 3)
 
-    coords = np.mgrid[[slice(x) for x in grid_shape]].astype(dtype)
-    coords = np.moveaxis(coords, 0, 3)
+    # grid coordinates of the flat indices only, instead of np.mgrid of the
+    # whole grid
+    coords = np.stack(np.unravel_index(indices, tuple(grid_shape)), axis=-1)
+    coords = coords.astype(dtype)
     coords *= deltas
     coords += grid_origin
+    return coords
+
+
+def prepare_voxel_list(**task_kwargs) -> {str: typing.Any}:
+    """Numpy part of add_voxel_list. Does not touch bpy and can run in a worker
+    thread. Returns the task arguments for add_voxel_list.
+    """
+    colors = task_kwargs.get("colors")
+    if colors is not None:
+        assert task_kwargs["indices"].shape[0] == colors.shape[0]
+    coords = _voxel_list_coords(
+        task_kwargs["indices"],
+        task_kwargs["grid_shape"],
+        task_kwargs["grid_origin"],
+        task_kwargs["voxel_size"],
+    )
+    prepared = _prepare_particles(coords, colors)
+    prepared["coords"] = coords
+    return dict(task_kwargs, prepared=prepared)
 
-    coords = coords.reshape([-1, 3])
-    coords = coords[indices]
+
+def add_voxel_list(
+    *,
+    indices: np.ndarray,
+    grid_shape: np.ndarray,
+    grid_origin: np.ndarray,
+    voxel_size: np.ndarray,
+    colors: np.ndarray = None,
+    name_prefix: str = "voxel_list",
+    validate: str = "full",
+    prepared: dict = None,
+    scene,
+):
+    """"""
+    if prepared is None:
+        prepared = prepare_voxel_list(
+            indices=indices,
+            grid_shape=grid_shape,
+            grid_origin=grid_origin,
+            voxel_size=voxel_size,
+            colors=colors,
+        )["prepared"]
 
     obj_voxels, color_selector = create_voxel_particle_obj(
-        coords, colors, name_prefix, scene
+        prepared["coords"],
+        None,
+        name_prefix,
+        scene,
+        validate=validate,
+        prepared=prepared,
     )
     return obj_voxels, {"color_selector": color_selector}
 
@@ -326,7 +457,12 @@ def _add_point_cloud_chunk(
     particle_radius: float = 0.02,
     material=None,
     particle_obj=None,
+    validate: str = "full",
+    prepared: dict = None,
 ):
+    if prepared is None:
+        prepared = _prepare_particles(points, colors)
+
     if particle_obj is None:
         # created entities
         obj_particle = create_icosphere(
@@ -336,11 +472,14 @@ def _add_point_cloud_chunk(
     else:
         obj_particle = particle_obj
 
-    obj_point_cloud = _create_particle_instancer(name_prefix, points, obj_particle)
-    scene.collection.objects.link(obj_point_cloud)
-    color_selector = _add_material_to_particle(
-        name_prefix, colors, obj_particle, material
+    obj_point_cloud = _create_particle_instancer(
+        name_prefix, points, obj_particle, validate, prepared["instancer"]
     )
+    scene.collection.objects.link(obj_point_cloud)
+    with stage("material"):
+        color_selector = _add_material_to_particle(
+            name_prefix, prepared["pixels"], obj_particle, material
+        )
 
     return (
         obj_point_cloud,
@@ -348,6 +487,45 @@ def _add_point_cloud_chunk(
     )
 
 
+# this is limited due to how GPUs work (texture memory)
+MAX_POINTS_PER_CHUNK = 60000
+
+
+def prepare_point_cloud(**task_kwargs) -> {str: typing.Any}:
+    """Numpy part of add_point_cloud. Does not touch bpy and can run in a worker
+    thread. Returns the task arguments for add_point_cloud.
+    """
+    points = task_kwargs["points"]
+    colors = task_kwargs.get("colors")
+
+    num_points = points.shape[0]
+    if num_points < MAX_POINTS_PER_CHUNK:
+        sub_points = [points]
+        sub_colors = [colors]
+    else:
+        for k in ("reflectivity", "row_splits", "material", "particle_obj"):
+            assert task_kwargs.get(k) is None, "chunking not yet supported"
+        num_chunks = num_points // MAX_POINTS_PER_CHUNK
+        sub_points = np.array_split(points, num_chunks)
+        num_chunks = len(sub_points)
+        if colors is None:
+            sub_colors = [
+                None,
+            ] * num_chunks
+        else:
+            sub_colors = np.array_split(colors, num_chunks)
+
+    chunks = []
+    for pts_chunk, color_chunk in zip(sub_points, sub_colors):
+        chunk = _prepare_particles(pts_chunk, color_chunk)
+        chunk["points"] = pts_chunk
+        chunks.append(chunk)
+    return dict(
+        task_kwargs,
+        prepared={"chunks": chunks, "chunked": num_points >= MAX_POINTS_PER_CHUNK},
+    )
+
+
 def add_point_cloud(
     scene,
     *,
@@ -359,6 +537,8 @@ def add_point_cloud(
     particle_radius: float = 0.02,
     material=None,
     particle_obj=None,
+    validate: str = "full",
+    prepared: dict = None,
 ):
     """
 
@@ -371,48 +551,44 @@ def add_point_cloud(
     :param particle_radius:
     :param material: If given, just add nodes to this material
     :param particle_obj: If given, use this object
+    :param validate: mesh validation mode ('full', 'fast' or 'none')
+    :param prepared: result of prepare_point_cloud
     :return:
     """
-    num_points = points.shape[0]
-    max_points_per_chunk = (
-        60000  # this is limited due to how GPUs work (texture memory)
-    )
-    if num_points < max_points_per_chunk:
-        return _add_point_cloud_chunk(
-            scene,
+    if prepared is None:
+        prepared = prepare_point_cloud(
             points=points,
             colors=colors,
             reflectivity=reflectivity,
             row_splits=row_splits,
+            material=material,
+            particle_obj=particle_obj,
+        )["prepared"]
+
+    chunks = prepared["chunks"]
+    if not prepared["chunked"]:
+        return _add_point_cloud_chunk(
+            scene,
+            points=chunks[0]["points"],
+            reflectivity=reflectivity,
+            row_splits=row_splits,
             name_prefix=name_prefix,
             particle_radius=particle_radius,
             material=material,
             particle_obj=particle_obj,
+            validate=validate,
+            prepared=chunks[0],
         )
     else:
         print("Chunking point cloud!")
-        assert reflectivity is None, "chunking not yet supported"
-        assert row_splits is None, "chunking not yet supported"
-        assert material is None, "chunking not yet supported"
-        assert particle_obj is None, "chunking not yet supported"
-        num_chunks = num_points // max_points_per_chunk
-        sub_points = np.array_split(points, num_chunks)
-        num_chunks = len(sub_points)
-        if colors is None:
-            sub_colors = [
-                None,
-            ] * num_chunks
-        else:
-            sub_colors = np.array_split(colors, num_chunks)
-        for chunk_idx, (pts_chunk, color_chunk) in enumerate(
-            zip(sub_points, sub_colors)
-        ):
+        for chunk_idx, chunk in enumerate(chunks):
             _add_point_cloud_chunk(
                 scene,
-                points=pts_chunk,
-                colors=color_chunk,
+                points=chunk["points"],
                 name_prefix=name_prefix + f"_chunk_{chunk_idx}",
                 particle_radius=particle_radius,
+                validate=validate,
+                prepared=chunk,
             )
 
 
@@ -426,48 +602,6 @@ def apply_trafo(points, trafo):
     return np.matmul(trafo, points.T).T
 
 
-# adapted from https://blender.stackexchange.com/a/80592
-def bmesh_join(list_of_bmeshes, list_of_matrices, *, normal_update=False, bmesh):
-    """takes as input a list of bm references and outputs a single merged bmesh
-    allows an additional 'normal_update=True' to force _normal_ calculations.
-    """
-
-    bm = bmesh.new()
-    add_vert = bm.verts.new
-    add_face = bm.faces.new
-    add_edge = bm.edges.new
-
-    for bm_to_add, matrix in zip(list_of_bmeshes, list_of_matrices):
-        bm_to_add.transform(matrix)
-        offset = len(bm.verts)
-
-        for v in bm_to_add.verts:
-            add_vert(v.co)
-
-        bm.verts.index_update()
-        bm.verts.ensure_lookup_table()
-
-        if bm_to_add.faces:
-            for face in bm_to_add.faces:
-                add_face(tuple(bm.verts[i.index + offset] for i in face.verts))
-            bm.faces.index_update()
-
-        if bm_to_add.edges:
-            for edge in bm_to_add.edges:
-                edge_seq = tuple(bm.verts[i.index + offset] for i in edge.verts)
-                try:
-                    add_edge(edge_seq)
-                except ValueError:
-                    # edge exists!
-                    pass
-            bm.edges.index_update()
-
-    if normal_update:
-        bm.normal_update()
-
-    return bm
-
-
 def simple_scale_matrix(factor: np.array, direction: np.array):
     dir_len = np.sqrt(np.sum(direction**2))
     assert dir_len > 0.0, "direction vector of scale matrix may not have length zero"
@@ -480,19 +614,81 @@ def simple_scale_matrix(factor: np.array, direction: np.array):
     return scale_matrix
 
 
-def add_flow_mesh(
-    *,
-    point_cloud: np.ndarray,
-    flow: np.ndarray,
-    colors_rgba: np.ndarray = None,
-    name_prefix: str = "flow",
+def _cone(
+    radius_bottom: float,
+    radius_top: float,
+    depth: float,
+    z_offset: float,
+    segments: int,
+) -> (np.ndarray, [[int]]):
+    """Vertices and polygons of a cone along z like bmesh.ops.create_cone with
+    cap_ends=True and cap_tris=False: one n-gon per cap, a single tip vertex and
+    triangles instead of quads if radius_top is zero. Polygons face outwards.
+    """
+    phi = 2.0 * np.pi * np.arange(segments) / segments
+    ring = np.stack([-np.sin(phi), np.cos(phi), np.zeros_like(phi)], axis=-1)
+    bottom = ring * radius_bottom
+    bottom[:, 2] = z_offset - 0.5 * depth
+    nxt = (np.arange(segments) + 1) % segments
+
+    if radius_top == 0.0:
+        tip = np.array([[0.0, 0.0, z_offset + 0.5 * depth]])
+        vertices = np.concatenate([bottom, tip])
+        sides = [[i, nxt[i], segments] for i in range(segments)]
+        caps = [list(range(segments - 1, -1, -1))]
+    else:
+        top = ring * radius_top
+        top[:, 2] = z_offset + 0.5 * depth
+        vertices = np.concatenate([bottom, top])
+        sides = [[i, nxt[i], segments + nxt[i], segments + i] for i in range(segments)]
+        caps = [list(range(segments - 1, -1, -1)), list(range(segments, 2 * segments))]
+    return vertices, sides + caps
+
+
+def _arrow_template(
     arrow_shaft_diameter: float = 0.05,
     arrow_shaft_length: float = 1.0,
     arrow_head_height: float = 0.2,
     arrow_head_diameter: float = 0.15,
-    scene,
-    mathutils,
-):
+    segments: int = 10,
+) -> {str: np.ndarray}:
+    """One arrow along +z (numpy only): a cylinder shaft centered at z = 0.5 and
+    a cone head centered at z = 1.0.
+
+    :return: vertices [V, 3] and the polygons as flat vertex_index, loop_start and
+        loop_total arrays
+    """
+    shaft_vertices, shaft_polygons = _cone(
+        0.5 * arrow_shaft_diameter,
+        0.5 * arrow_shaft_diameter,
+        arrow_shaft_length,
+        0.5,
+        segments,
+    )
+    head_vertices, head_polygons = _cone(
+        0.5 * arrow_head_diameter, 0.0, arrow_head_height, 1.0, segments
+    )
+    offset = shaft_vertices.shape[0]
+    polygons = shaft_polygons + [[i + offset for i in p] for p in head_polygons]
+
+    loop_total = np.array([len(p) for p in polygons], dtype=np.int32)
+    return {
+        "vertices": np.concatenate([shaft_vertices, head_vertices]),
+        "vertex_index": np.concatenate(polygons).astype(np.int32),
+        "loop_start": (np.cumsum(loop_total) - loop_total).astype(np.int32),
+        "loop_total": loop_total,
+    }
+
+
+def prepare_flow_mesh(**task_kwargs) -> {str: typing.Any}:
+    """Numpy part of add_flow_mesh: one arrow mesh per flow vector and the loop
+    colors. Does not touch bpy and can run in a worker thread. Returns the task
+    arguments for add_flow_mesh.
+    """
+    point_cloud = task_kwargs["point_cloud"]
+    flow = task_kwargs["flow"]
+    colors_rgba = task_kwargs.get("colors_rgba")
+
     if point_cloud.dtype != np.float32:
         print(
             "Warning: dtype of point_cloud should be np.float32. Casting to np.float32"
@@ -503,169 +699,147 @@ def add_flow_mesh(
         print("Warning: dtype of flow should be np.float32. Casting to np.float32")
         flow = flow.astype(np.float32)
 
+    if colors_rgba is None:
+        colors_rgba = np.ones((flow.shape[0], 4), dtype=np.float32)
     if colors_rgba.dtype != np.float32:
         print(
             "Warning: dtype of colors_rgba should be np.float32. Casting to np.float32"
         )
         colors_rgba = colors_rgba.astype(np.float32)
 
-    # arrow shaft
-    arrow_shaft = bmesh.new()
-    bmesh.ops.create_cone(
-        arrow_shaft,
-        cap_ends=True,
-        cap_tris=False,
-        segments=10,
-        radius1=arrow_shaft_diameter / 2.0,
-        radius2=arrow_shaft_diameter / 2.0,
-        depth=arrow_shaft_length,
-        calc_uvs=False,
-    )
-
-    # arrow head
-    arrow_head = bmesh.new()
-    bmesh.ops.create_cone(
-        arrow_head,
-        cap_ends=True,
-        cap_tris=False,
-        segments=10,
-        radius1=arrow_head_diameter / 2.0,
-        radius2=0.0,
-        depth=arrow_head_height,
-        calc_uvs=False,
-    )
-
-    arrow_mesh = bmesh_join(
-        list_of_bmeshes=[arrow_shaft, arrow_head],
-        list_of_matrices=[
-            mathutils.Matrix.Translation((0.0, 0.0, 0.5)),
-            mathutils.Matrix.Translation((0.0, 0.0, 1.0)),
-        ],
-        normal_update=False,
-        bmesh=bmesh,
-    )
-
     assert colors_rgba.shape[1] == 4
-    assert colors_rgba.dtype == np.float32
     assert np.all(np.logical_and(0.0 <= colors_rgba, colors_rgba <= 1.0))
+    assert point_cloud.shape == flow.shape
 
-    me = bpy.data.meshes.new("mesh_{}".format(name_prefix))
-    arrow_mesh.to_mesh(me)
-    arrow_head.free()
-    arrow_shaft.free()
-    arrow_mesh.free()
-
-    polygons = me.polygons
-    npolygons = len(polygons)
-    nloops = len(me.loops)
-
-    startloop = np.empty(npolygons, dtype=int)
-    loop_total = np.empty(npolygons, dtype=int)
-    polygon_indices = np.empty(npolygons, dtype=int)
+    arrow = _arrow_template(
+        **{k: task_kwargs[k] for k in _ARROW_ARGS if task_kwargs.get(k) is not None}
+    )
+    num_verts = arrow["vertices"].shape[0]
+    num_loops = arrow["vertex_index"].shape[0]
+    num_flow_vecs = flow.shape[0]
+    arrow_offsets = np.arange(num_flow_vecs, dtype=np.int32)[:, None]
+
+    vertices = transform_arrows(arrow["vertices"], point_cloud, flow)
+    prepared = {
+        "num_vertices": vertices.shape[0],
+        "co": vertices.astype(np.float32).reshape((-1)),
+        "vertex_index": (
+            arrow["vertex_index"][None, :] + arrow_offsets * num_verts
+        ).reshape((-1)),
+        "loop_start": (
+            arrow["loop_start"][None, :] + arrow_offsets * num_loops
+        ).reshape((-1)),
+        "loop_total": np.tile(arrow["loop_total"], num_flow_vecs),
+        # the loops of an arrow only use the vertices of that arrow
+        "loop_colors": np.repeat(colors_rgba, num_loops, axis=0).reshape((-1)),
+    }
+    return dict(task_kwargs, prepared=prepared)
+
+
+# arguments of add_flow_mesh that shape the arrow (see _arrow_template)
+_ARROW_ARGS = (
+    "arrow_shaft_diameter",
+    "arrow_shaft_length",
+    "arrow_head_height",
+    "arrow_head_diameter",
+)
 
-    polygons.foreach_get("index", polygon_indices)
-    polygons.foreach_get("loop_start", startloop)
-    polygons.foreach_get("loop_total", loop_total)
 
-    vertex_index = np.empty(nloops, dtype=int)
-    me.loops.foreach_get("vertex_index", vertex_index)
-    assert sum(loop_total) == len(vertex_index)
-    mesh_verts = read_verts(me)
-    # dann gather mit vertex indices
+def transform_arrows(
+    arrow_vertices: np.ndarray, point_cloud: np.ndarray, flow: np.ndarray
+) -> np.ndarray:
+    """Vertices of one arrow along +z per flow vector: scaled along z by the flow
+    length, rotated onto the flow direction and moved to the point.
 
-    num_flow_vecs = flow.shape[0]
+    :return: [N * V, 3] vertices (arrow by arrow)
+    """
+    flow = flow.astype(np.float64)
     flow_len = np.linalg.norm(flow, axis=-1)
+    flow_vec_unit = flow / flow_len[:, None]
 
-    vertices_homog = np.concatenate(
-        [mesh_verts, np.ones((mesh_verts.shape[0], 1))], axis=-1
+    # rotation matrices R that rotate +z onto the flow unit vectors
+    v = np.cross(np.array([0.0, 0.0, 1.0]), flow_vec_unit)
+    cosine = flow_vec_unit[:, 2]
+    zero = np.zeros_like(cosine)
+    vx = np.stack(
+        [
+            np.stack([zero, -v[:, 2], v[:, 1]], axis=-1),
+            np.stack([v[:, 2], zero, -v[:, 0]], axis=-1),
+            np.stack([-v[:, 1], v[:, 0], zero], axis=-1),
+        ],
+        axis=1,
     )
+    R = np.eye(3) + vx + np.matmul(vx, vx) * (1.0 / (1.0 + cosine))[:, None, None]
 
-    full_vertices = []
-    vertex_indices = []
-    loop_start = []
-    loop_total = np.tile(loop_total, num_flow_vecs)
+    vert_scaled = np.repeat(arrow_vertices[None, ...], flow.shape[0], axis=0)
+    vert_scaled[..., 2] *= flow_len[:, None]
+    vert_final = np.matmul(vert_scaled, np.transpose(R, (0, 2, 1)))
+    vert_final += point_cloud[:, None, :3]
+    return vert_final.reshape((-1, 3))
 
-    assert point_cloud.shape == flow.shape
-    for flow_vec_idx in range(num_flow_vecs):
-        arrow_head_unit = np.array([0.0, 0.0, 1.0])
-        scale_mat = simple_scale_matrix(
-            flow_len[flow_vec_idx], np.array([0.0, 0.0, 1.0])
-        )
-        vert_scaled = apply_trafo(np.copy(vertices_homog), scale_mat)
-
-        flow_vec = flow[flow_vec_idx]
-
-        flow_vec_unit = flow_vec / np.sqrt(np.sum(flow_vec**2))
-
-        # rotation matrix R that rotates unit vector a onto unit vector b.
-        v = np.cross(arrow_head_unit, flow_vec_unit)
-        cosine = np.dot(arrow_head_unit, flow_vec_unit)
-
-        vx = np.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
-        R = np.eye(3) + vx + np.dot(vx, vx) * 1.0 / (1.0 + cosine)
-        T_rot = np.eye(4)
-        T_rot[0:3, 0:3] = R
-        vert_rotated = apply_trafo(vert_scaled, T_rot)
-
-        translation_matrix = np.eye(4)
-        translation_matrix[:3, 3] = point_cloud[flow_vec_idx][:3]
-
-        vert_translated = apply_trafo(vert_rotated, translation_matrix)
-
-        vert_final = vert_translated[..., 0:3]
-
-        full_vertices.append(vert_final)
-        shifted_start = startloop + flow_vec_idx * nloops
-        loop_start.append(shifted_start)
-        shifted_vertex_indices = vertex_index + flow_vec_idx * len(mesh_verts)
-        vertex_indices.append(shifted_vertex_indices)
-
-    vertex_indices = np.concatenate(vertex_indices, axis=0)
-
-    full_vertices = np.concatenate(full_vertices, axis=0)
-    loop_start = np.concatenate(loop_start, axis=0)
-
-    assert sum(loop_total) == len(vertex_indices)
-    assert loop_total.shape == loop_start.shape
-
-    assert npolygons * num_flow_vecs == len(loop_start)
-    assert npolygons * num_flow_vecs == len(loop_total)
-
-    assert np.all(np.diff(loop_start) == loop_total[:-1])
 
+@needs_bpy_bmesh()
+def add_flow_mesh(
+    *,
+    point_cloud: np.ndarray,
+    flow: np.ndarray,
+    colors_rgba: np.ndarray = None,
+    name_prefix: str = "flow",
+    arrow_shaft_diameter: float = 0.05,
+    arrow_shaft_length: float = 1.0,
+    arrow_head_height: float = 0.2,
+    arrow_head_diameter: float = 0.15,
+    validate: str = "full",
+    prepared: dict = None,
+    scene,
+    bpy,
+):
+    """
+    :param prepared: result of prepare_flow_mesh
+    """
+    if prepared is None:
+        prepared = prepare_flow_mesh(
+            point_cloud=point_cloud,
+            flow=flow,
+            colors_rgba=colors_rgba,
+            arrow_shaft_diameter=arrow_shaft_diameter,
+            arrow_shaft_length=arrow_shaft_length,
+            arrow_head_height=arrow_head_height,
+            arrow_head_diameter=arrow_head_diameter,
+        )["prepared"]
+
+    vertex_indices = prepared["vertex_index"]
+    loop_start = prepared["loop_start"]
+    loop_total = prepared["loop_total"]
+    check_mesh_input(
+        validate, prepared["num_vertices"], vertex_indices, loop_start, loop_total
+    )
     mesh = bpy.data.meshes.new(name="flow_mesh")
     # vertices
-    mesh.vertices.add(full_vertices.shape[0])
-    mesh.vertices.foreach_set("co", full_vertices.astype(np.float32).reshape((-1)))
+    mesh.vertices.add(prepared["num_vertices"])
+    mesh.vertices.foreach_set("co", prepared["co"])
 
     # vertex indices
     mesh.loops.add(vertex_indices.shape[0])
     mesh.loops.foreach_set("vertex_index", vertex_indices)
 
-    # triangles
+    # polygons
     mesh.polygons.add(loop_start.shape[0])
     mesh.polygons.foreach_set("loop_start", loop_start)
     mesh.polygons.foreach_set("loop_total", loop_total)
 
-    colors_per_vertex_index_colors_rgba = np.tile(
-        colors_rgba[:, None, :], reps=[1, len(mesh_verts), 1]
-    )
-    colors_flattened = np.reshape(colors_per_vertex_index_colors_rgba, (-1, 4))
-
-    colors_per_vertex_index = colors_flattened[vertex_indices]
     # Create vertex color layer and set values
     vcol_lay = mesh.vertex_colors.new(name="color_flow")
-    color_verts = np.reshape(colors_per_vertex_index, (-1))
-    vcol_lay.data.foreach_set("color", color_verts)
+    vcol_lay.data.foreach_set("color", prepared["loop_colors"])
 
     vcol_grad = mesh.vertex_colors.new(name="color_grads")
-    vcol_grad.data.foreach_set("color", color_verts)
+    vcol_grad.data.foreach_set("color", prepared["loop_colors"])
 
-    mesh.update()
-    mesh.validate()
+    finalize_mesh(mesh, validate)
 
     obj = bpy.data.objects.new("obj_{}".format(name_prefix), mesh)
-    material = create_flow_material("material_{}".format(name_prefix))
+    with stage("material"):
+        material = create_flow_material("material_{}".format(name_prefix))
     obj.data.materials.append(material)
 
     # baurst: very unsure about this
@@ -675,42 +849,16 @@ def add_flow_mesh(
     return obj
 
 
-def create_cube_with_wireframe(
-    position: np.ndarray,
-    scale: np.ndarray,
-    rotation: np.ndarray,
-    wireframe_scale: float,
-    color: np.ndarray,
-):
-    # create a mesh cube
-    bpy.ops.object.select_all(action="DESELECT")
-    bpy.ops.mesh.primitive_cube_add(
-        size=1, enter_editmode=False, align="WORLD", location=position
-    )
-    cube = bpy.context.object
-
-    # set scale and rotation
-    cube.scale = scale
-    cube.rotation_euler = rotation
-    bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-
-    # add wireframe modifier
-    bpy.ops.object.modifier_add(type="WIREFRAME")
-    wireframe_modifier = cube.modifiers[-1]
-    wireframe_modifier.thickness = wireframe_scale
-
-    # create a new material with the given color
-    material = bpy.data.materials.new(name="CubeMaterial")
-    material.use_nodes = False
-    material.diffuse_color = color
-
-    # assign the material to the cube
-    if len(cube.data.materials) > 0:
-        cube.data.materials[0] = material
-    else:
-        cube.data.materials.append(material)
-
-    return cube
+def _unique_name_prefix(name_prefix: str) -> str:
+    """name_prefix, with a number appended if its object or mesh exists."""
+    unique, i = name_prefix, 0
+    while (
+        "{}_obj".format(unique) in bpy.data.objects
+        or "{}_mesh".format(unique) in bpy.data.meshes
+    ):
+        i += 1
+        unique = "{}_{:03d}".format(name_prefix, i)
+    return unique
 
 
 def add_boxes(
@@ -720,54 +868,83 @@ def add_boxes(
     box_colors_rgba_f64: np.ndarray,
     confidence_threshold: float = 0.0,
     bounding_box_wire_frame_scale: float = 0.2,
+    name_prefix: str = "boxes",
+    shared_material: bool = True,
     verbose: bool = False,
 ):
     """
-    supports only boxes with yaw rotation
+    Add all boxes as a single wireframe mesh. The wireframe is real geometry
+    (one beam per box edge), i.e. no modifiers need to be evaluated.
 
     scene: blender py scene
     boxes: dictionairy with
         * 'pos': np.ndarray with shape [num_boxes, 3] (i.e. box positions in 3d)
-        * 'rot': np.ndarray with shape [num_boxes, 1] (i.e. box yaw angles)
+        * 'rot': np.ndarray with shape [num_boxes, 1] (i.e. box yaw angles),
+          [num_boxes, 3] (euler XYZ), [num_boxes, 4] (quaternion wxyz)
+          or [num_boxes, 3, 3] (rotation matrices)
         * 'dims': np.ndarray with shape [num_boxes, 3] (i.e. box size length, width, height)
-        * 'probs': np.ndarray with shape [num_boxes, 1] (i.e. box confidence)
+        * 'probs': np.ndarray with shape [num_boxes, 1] (i.e. box confidence), optional
     box_colors_rgba_f64: np.ndarray with shape [num_boxes, 4], i.e. a color for each box
     confidence_threshold: boxes below this threshold are discarded
-    bounding_box_wire_frame_scale: this is the thickness of the box wireframe (in meters I think)
+    bounding_box_wire_frame_scale: this is the thickness of the box wireframe (in meters)
+    shared_material: use one attribute driven material for all box objects
+    name_prefix: names of the object and mesh, a number is appended if they exist
     """
 
     assert "pos" in boxes, "need box positions with key 'pos' to work!"
     assert "dims" in boxes, "need box dimensions with key 'dims' to work!"
-    assert "rot" in boxes, "need box rotations (yaw angle) with key 'rot' to work!"
+    assert "rot" in boxes, "need box rotations with key 'rot' to work!"
 
     assert (
         box_colors_rgba_f64 <= 1.0
     ).all(), "this code is only tested with f64 colors <= 1.0!"
 
     num_boxes = boxes["pos"].shape[0]
-    for box_idx in range(num_boxes):
-        box_confidence = np.squeeze(boxes["probs"][box_idx])
-        if box_confidence < confidence_threshold:
-            if verbose:
-                print(f"Discarding box #{box_idx} with confidence {box_confidence}")
-            continue
-        if verbose:
+    if "probs" in boxes:
+        box_confidence = np.reshape(boxes["probs"], (num_boxes,))
+    else:
+        box_confidence = np.ones((num_boxes,))
+    keep = box_confidence >= confidence_threshold
+
+    if verbose:
+        for box_idx in np.flatnonzero(~keep):
+            print(
+                f"Discarding box #{box_idx} with confidence {box_confidence[box_idx]}"
+            )
+        for box_idx in np.flatnonzero(keep):
             print(
                 f"Add box #{box_idx} at position: ",
                 boxes["pos"][box_idx],
                 ", rotation: ",
                 boxes["rot"][box_idx],
-                f", confidence: {box_confidence}",
+                f", confidence: {box_confidence[box_idx]}",
             )
-        cube = create_cube_with_wireframe(
-            position=boxes["pos"][box_idx],
-            scale=boxes["dims"][box_idx],
-            rotation=(
-                0.0,
-                0.0,
-                boxes["rot"][box_idx],
-            ),
-            wireframe_scale=bounding_box_wire_frame_scale,
-            color=box_colors_rgba_f64[box_idx],
-        )
-        scene.collection.objects.link(cube)
+
+    if not keep.any():
+        return None
+
+    vertices, triangles = box_wireframe_tubes(
+        positions=boxes["pos"][keep],
+        dims=boxes["dims"][keep],
+        rotation=np.asarray(boxes["rot"])[keep],
+        thickness=bounding_box_wire_frame_scale,
+    )
+
+    # the colors are linear, byte color attributes hold sRGB
+    colors = linear_to_srgb8(np.asarray(box_colors_rgba_f64)[keep])
+    face_colors = np.repeat(colors, num_tube_triangles_per_box(), axis=0)
+
+    material = None
+    if shared_material:
+        material, _ = create_attribute_color_material("fcolor_box")
+
+    obj, _ = create_obj_from_mesh(
+        vertices,
+        triangles,
+        face_colors={"box": face_colors},
+        use_smooth=False,
+        material=material,
+        name_prefix=_unique_name_prefix(name_prefix),
+    )
+    scene.collection.objects.link(obj)
+    return obj
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""On-disk cache of prepared task data (see blender_kitti.task_preparers).
+
+Every entry is a directory with one .npy file per array and a JSON manifest with
+the nesting of dicts, lists and scalars. Arrays are memory mapped on load, so a
+cache hit costs little more than the upload to blender. The total size of the
+cache is bounded, least recently used entries (by directory mtime) are evicted.
+"""
+
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import typing
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+# bump when the layout of prepared data changes, old entries are never hit again
+CACHE_VERSION = 2
+
+DEFAULT_MAX_MEGABYTES = 4096
+
+_MANIFEST = "manifest.json"
+_ARRAY_KEY = "__array__"
+
+
+def _flatten(value, arrays: [np.ndarray]):
+    """JSON structure of value, arrays are replaced by references into arrays."""
+    if isinstance(value, np.ndarray):
+        arrays.append(value)
+        return {_ARRAY_KEY: len(arrays) - 1}
+    if isinstance(value, dict):
+        return {"dict": {str(k): _flatten(v, arrays) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {"list": [_flatten(v, arrays) for v in value]}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError("Cannot cache value of type {}.".format(type(value)))
+
+
+def _unflatten(structure, directory: pathlib.Path, mmap_mode):
+    if isinstance(structure, dict):
+        if _ARRAY_KEY in structure:
+            filepath = directory / "{}.npy".format(structure[_ARRAY_KEY])
+            return np.load(str(filepath), mmap_mode=mmap_mode, allow_pickle=False)
+        if "dict" in structure:
+            return {
+                k: _unflatten(v, directory, mmap_mode)
+                for k, v in structure["dict"].items()
+            }
+        return [_unflatten(v, directory, mmap_mode) for v in structure["list"]]
+    return structure
+
+
+def _directory_size(directory: pathlib.Path) -> int:
+    return sum(f.stat().st_size for f in directory.iterdir() if f.is_file())
+
+
+class PreparedCache:
+    """Size bounded cache directory. Safe to share between threads and processes:
+    entries are written to a temporary directory and renamed into place.
+    """
+
+    def __init__(self, directory, max_bytes: int = DEFAULT_MAX_MEGABYTES * 2**20):
+        self.directory = pathlib.Path(directory) / "v{}".format(CACHE_VERSION)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _entry(self, key: str) -> pathlib.Path:
+        return self.directory / key
+
+    def get(self, key: str, mmap_mode="r") -> typing.Any:
+        """Cached data for key or None."""
+        entry = self._entry(key)
+        try:
+            with open(str(entry / _MANIFEST), "r") as f:
+                structure = json.load(f)
+            value = _unflatten(structure, entry, mmap_mode)
+        except (OSError, ValueError):
+            # missing, evicted in the meantime or incomplete
+            return None
+        try:
+            # mark as recently used
+            os.utime(str(entry))
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, value) -> bool:
+        """Store value (nested dicts, lists, arrays and scalars) under key."""
+        entry = self._entry(key)
+        if entry.is_dir():
+            return True
+
+        arrays = []
+        structure = _flatten(value, arrays)
+        size = sum(a.nbytes for a in arrays)
+        if size > self.max_bytes:
+            logger.info("Not caching '{}' with {} bytes.".format(key, size))
+            return False
+
+        tmp = pathlib.Path(tempfile.mkdtemp(prefix=".tmp_", dir=str(self.directory)))
+        try:
+            for i, a in enumerate(arrays):
+                np.save(str(tmp / "{}.npy".format(i)), a, allow_pickle=False)
+            with open(str(tmp / _MANIFEST), "w") as f:
+                json.dump(structure, f)
+            os.rename(str(tmp), str(entry))
+        except OSError:
+            # written by someone else in the meantime
+            shutil.rmtree(str(tmp), ignore_errors=True)
+            return entry.is_dir()
+
+        self.evict()
+        return True
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits into max_bytes."""
+        with self._lock:
+            entries = []
+            for entry in self.directory.iterdir():
+                if not entry.is_dir() or entry.name.startswith(".tmp_"):
+                    continue
+                try:
+                    entries.append(
+                        (entry.stat().st_mtime, _directory_size(entry), entry)
+                    )
+                except OSError:
+                    continue
+
+            total = sum(e[1] for e in entries)
+            for _mtime, size, entry in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                logger.info("Evicting cached data '{}'.".format(entry.name))
+                shutil.rmtree(str(entry), ignore_errors=True)
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(str(self.directory), ignore_errors=True)
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+
+def prepared_cache_from_config(config: {str: typing.Any}):
+    """PreparedCache for the render config keys 'prepared_cache_dir' and
+    'prepared_cache_max_mb' or None if no cache directory is configured.
+    """
+    directory = config.get("prepared_cache_dir")
+    if not directory:
+        return None
+    max_megabytes = config.get("prepared_cache_max_mb", DEFAULT_MAX_MEGABYTES)
+    return PreparedCache(directory, max_bytes=int(max_megabytes * 2**20))
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Per-stage profiling: wall time, cpu time, peak memory and counters.
+
+    with stage("load", file=filepath) as s:
+        ...
+        s.count("points", n)
+
+Stages can be nested (per thread). When profiling is disabled (the default),
+stage() returns a shared no-op context, so instrumented code costs one function
+call per stage. Enable it with enable_profiling() or by setting the environment
+variable BLENDER_KITTI_PROFILE to a JSON output path.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import typing
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+PROFILE_ENV_VAR = "BLENDER_KITTI_PROFILE"
+
+
+def _peak_rss_mb() -> typing.Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak / 2**20
+    return peak / 2**10
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, name: str, value=1):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name: str, info: {str: typing.Any}):
+        self._profiler = profiler
+        self.name = name
+        self.info = info
+        self.counters = {}
+
+    def count(self, name: str, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def __enter__(self):
+        stack = self._profiler._stack()
+        self.path = "/".join([s.name for s in stack] + [self.name])
+        stack.append(self)
+        self._rss_start = _peak_rss_mb()
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        peak_rss = _peak_rss_mb()
+        self._profiler._stack().pop()
+
+        record = {
+            "stage": self.name,
+            "path": self.path,
+            "thread": threading.current_thread().name,
+            "wall_s": wall,
+            # cpu time of the whole process (includes other threads)
+            "cpu_s": cpu,
+            "peak_rss_mb": peak_rss,
+            "peak_rss_growth_mb": (
+                None if peak_rss is None else peak_rss - self._rss_start
+            ),
+            "failed": exc_type is not None,
+        }
+        if self.info:
+            record["info"] = self.info
+        if self.counters:
+            record["counters"] = self.counters
+        self._profiler.records.append(record)
+        return False
+
+
+class Profiler:
+    def __init__(self, output_path: str = None):
+        self.output_path = output_path
+        self.records = []
+        self._local = threading.local()
+
+    def _stack(self) -> [_Stage]:
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else _NULL_STAGE
+
+    def summary(self) -> {str: {str: typing.Any}}:
+        """Totals per stage path."""
+        summary = {}
+        for r in self.records:
+            s = summary.setdefault(
+                r["path"],
+                {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": None},
+            )
+            s["calls"] += 1
+            s["wall_s"] += r["wall_s"]
+            s["cpu_s"] += r["cpu_s"]
+            if r["peak_rss_mb"] is not None:
+                s["peak_rss_mb"] = max(s["peak_rss_mb"] or 0.0, r["peak_rss_mb"])
+            for k, v in r.get("counters", {}).items():
+                s.setdefault("counters", {})
+                s["counters"][k] = s["counters"].get(k, 0) + v
+        return summary
+
+    def to_dict(self) -> {str: typing.Any}:
+        return {
+            "pid": os.getpid(),
+            "stages": list(self.records),
+            "summary": self.summary(),
+        }
+
+    def write_json(self, output_path: str = None):
+        output_path = output_path or self.output_path
+        if output_path is None:
+            return
+        with open(str(output_path), "w") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+
+_profiler = None
+
+
+def enable_profiling(output_path: str = None) -> Profiler:
+    """Start recording stages. Records are kept until disable_profiling()."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(output_path)
+    elif output_path is not None:
+        _profiler.output_path = output_path
+    return _profiler
+
+
+def disable_profiling() -> typing.Optional[Profiler]:
+    """Stop recording and return the profiler with the records."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def get_profiler() -> typing.Optional[Profiler]:
+    return _profiler
+
+
+def is_profiling() -> bool:
+    return _profiler is not None
+
+
+def stage(name: str, **info):
+    """Context manager that records a stage. info is stored with the record."""
+    if _profiler is None:
+        return _NULL_STAGE
+    return _Stage(_profiler, name, info)
+
+
+def count(name: str, value=1):
+    """Add to a counter of the innermost running stage of this thread."""
+    if _profiler is not None:
+        _profiler.current().count(name, value)
+
+
+def write_profile(output_path: str = None):
+    """Write the records as JSON (to the path given on enable by default)."""
+    if _profiler is not None:
+        _profiler.write_json(output_path)
+
+
+if os.environ.get(PROFILE_ENV_VAR):
+    enable_profiling(os.environ[PROFILE_ENV_VAR])
+    atexit.register(write_profile)
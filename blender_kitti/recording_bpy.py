@@ -0,0 +1,560 @@
+# -*- coding: utf-8 -*-
+"""In-process stand-in for bpy, bmesh and mathutils that records what is sent to
+blender instead of creating anything.
+
+    from blender_kitti import recording_bpy
+    recorder = recording_bpy.install()
+    add_point_cloud(scene, points=points)
+    recorder.report()  # call counts and foreach_set/foreach_get buffer sizes
+
+Only the subset of bpy.data used by blender_kitti behaves like blender: meshes
+(vertices, loops, polygons, edges, uv_layers, vertex_colors, attributes),
+images (pixels), materials, objects and scenes. foreach_set checks the buffer
+size and copies the values like blender does. Everything else (node trees,
+bpy.ops, render settings, ...) accepts any attribute access, assignment and
+call. Rendering is not emulated.
+
+With the stand-in, the numpy side of the pipeline can be profiled and
+benchmarked in plain python processes.
+"""
+
+import collections
+import importlib.util
+import sys
+import types
+import typing
+
+import numpy as np
+
+from . import bpy_helper
+
+DEFAULT_VERSION = (3, 6, 0)
+
+# values per element of foreach_set/foreach_get attributes (default: 1)
+_ITEM_SIZES = {
+    "co": 3,
+    "normal": 3,
+    "uv": 2,
+    "color": 4,
+    "color_srgb": 4,
+    "vector": 3,
+}
+
+
+class Recorder:
+    """Call counts and foreach buffer sizes (per collection and attribute)."""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.buffers = {}
+
+    def call(self, name: str):
+        self.calls[name] += 1
+
+    def buffer(self, name: str, values: np.ndarray):
+        b = self.buffers.setdefault(name, {"calls": 0, "elements": 0, "bytes": 0})
+        b["calls"] += 1
+        b["elements"] += int(values.size)
+        b["bytes"] += int(values.nbytes)
+
+    def reset(self):
+        self.calls.clear()
+        self.buffers.clear()
+
+    def report(self) -> {str: typing.Any}:
+        return {
+            "calls": dict(sorted(self.calls.items())),
+            "buffers": dict(sorted(self.buffers.items())),
+            "buffer_bytes": sum(b["bytes"] for b in self.buffers.values()),
+        }
+
+
+class _Generic:
+    """Accepts any attribute access, assignment, item access and call."""
+
+    def __init__(self, recorder: Recorder, path: str):
+        self._recorder = recorder
+        self._path = path
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        child = _Generic(self._recorder, "{}.{}".format(self._path, name))
+        setattr(self, name, child)
+        return child
+
+    def __call__(self, *args, **kwargs):
+        self._recorder.call(self._path)
+        return _Generic(self._recorder, self._path + "()")
+
+    def __getitem__(self, key):
+        return _Generic(self._recorder, "{}[]".format(self._path))
+
+    def __setitem__(self, key, value):
+        pass
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __contains__(self, item):
+        return False
+
+    def __repr__(self):
+        return "<stand-in {}>".format(self._path)
+
+    def as_pointer(self) -> int:
+        return id(self)
+
+
+class _IDBase(_Generic):
+    """Like blender, a removed data-block raises ReferenceError on access."""
+
+    _removed = False
+
+    def __getattribute__(self, name: str):
+        if not name.startswith("_") and object.__getattribute__(self, "_removed"):
+            raise ReferenceError(
+                "Data-block '{}' has been removed.".format(
+                    object.__getattribute__(self, "_path")
+                )
+            )
+        return object.__getattribute__(self, name)
+
+
+class _PropCollection(_Generic):
+    """Collection of elements (e.g. mesh vertices) with foreach_set/foreach_get.
+    The length is a number or a callable (for layers sized by their mesh).
+    """
+
+    def __init__(self, recorder: Recorder, path: str, length=0):
+        super().__init__(recorder, path)
+        self._length = length
+        self._values = {}
+
+    def __len__(self):
+        return self._length() if callable(self._length) else self._length
+
+    def add(self, count: int):
+        self._recorder.call(self._path + ".add")
+        self._length += int(count)
+
+    def _check_size(self, attr: str, values: np.ndarray):
+        expected = len(self) * _ITEM_SIZES.get(attr, 1)
+        if values.size != expected:
+            raise RuntimeError(
+                "internal error setting the array: {}.{} expects {} values, got {}.".format(
+                    self._path, attr, expected, values.size
+                )
+            )
+
+    def foreach_set(self, attr: str, seq):
+        # blender copies the values into its own memory
+        values = np.array(seq).reshape(-1)
+        self._check_size(attr, values)
+        self._recorder.call(self._path + ".foreach_set")
+        self._recorder.buffer("{}.{}".format(self._path, attr), values)
+        self._values[attr] = values
+
+    def foreach_get(self, attr: str, seq):
+        self._recorder.call(self._path + ".foreach_get")
+        values = self._values.get(attr)
+        if values is None:
+            values = np.zeros((len(self) * _ITEM_SIZES.get(attr, 1),))
+        out = np.asarray(seq)
+        if out.size != values.size:
+            raise RuntimeError(
+                "internal error getting the array: {}.{}".format(self._path, attr)
+            )
+        self._recorder.buffer("{}.{}".format(self._path, attr), out)
+        seq[:] = values.reshape(out.shape)
+
+
+class _Layer(_Generic):
+    def __init__(self, recorder: Recorder, path: str, name: str, length, **kwargs):
+        super().__init__(recorder, path)
+        self.name = name
+        self.data = _PropCollection(recorder, path + ".data", length)
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+class _Layers(_Generic):
+    """uv_layers, vertex_colors and attributes of a mesh."""
+
+    def __init__(self, recorder: Recorder, path: str, length_of):
+        super().__init__(recorder, path)
+        self._length_of = length_of
+        self._layers = []
+        self.active = None
+
+    def new(self, name: str = "", type: str = None, domain: str = "CORNER", **_kw):
+        self._recorder.call(self._path + ".new")
+        layer = _Layer(
+            self._recorder,
+            self._path,
+            name,
+            self._length_of(domain),
+            data_type=type,
+            domain=domain,
+        )
+        self._layers.append(layer)
+        if self.active is None:
+            self.active = layer
+        return layer
+
+    def remove(self, layer):
+        self._layers.remove(layer)
+
+    def get(self, name: str, default=None):
+        for layer in self._layers:
+            if layer.name == name:
+                return layer
+        return default
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            layer = self.get(key)
+            if layer is None:
+                raise KeyError(key)
+            return layer
+        return self._layers[key]
+
+    def __iter__(self):
+        return iter(list(self._layers))
+
+    def __len__(self):
+        return len(self._layers)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+class _Mesh(_IDBase):
+    def __init__(self, recorder: Recorder, name: str):
+        super().__init__(recorder, "mesh")
+        self.name = name
+        self.vertices = _PropCollection(recorder, "mesh.vertices")
+        self.edges = _PropCollection(recorder, "mesh.edges")
+        self.loops = _PropCollection(recorder, "mesh.loops")
+        self.polygons = _PropCollection(recorder, "mesh.polygons")
+        self.materials = []
+
+        domains = {
+            "POINT": lambda: len(self.vertices),
+            "EDGE": lambda: len(self.edges),
+            "FACE": lambda: len(self.polygons),
+            "CORNER": lambda: len(self.loops),
+        }
+        self.uv_layers = _Layers(recorder, "mesh.uv_layers", domains.get)
+        self.vertex_colors = _Layers(recorder, "mesh.vertex_colors", domains.get)
+        self.attributes = _Layers(recorder, "mesh.attributes", domains.get)
+
+    def update(self, *args, **kwargs):
+        self._recorder.call("mesh.update")
+
+    def validate(self, *args, **kwargs):
+        self._recorder.call("mesh.validate")
+        return False
+
+
+class _Pixels(_PropCollection):
+    def foreach_set(self, seq, *args):
+        values = np.array(seq).reshape(-1)
+        self._check_size("pixels", values)
+        self._recorder.call(self._path + ".foreach_set")
+        self._recorder.buffer(self._path, values)
+        self._values["pixels"] = values
+
+    def foreach_get(self, seq, *args):
+        super().foreach_get("pixels", seq)
+
+    def __setitem__(self, key, value):
+        self.foreach_set(value)
+
+
+class _Image(_IDBase):
+    def __init__(self, recorder: Recorder, name: str, width=0, height=0, **_kw):
+        super().__init__(recorder, "image")
+        self.name = name
+        self.size = (int(width), int(height))
+        self.pixels = _Pixels(recorder, "image.pixels", 4 * int(width) * int(height))
+
+    def pack(self, *args, **kwargs):
+        self._recorder.call("image.pack")
+
+
+class _ObjectsLink(_Generic):
+    def __init__(self, recorder: Recorder, path: str):
+        super().__init__(recorder, path)
+        self._objects = []
+
+    def link(self, obj):
+        self._recorder.call(self._path + ".link")
+        self._objects.append(obj)
+
+    def unlink(self, obj):
+        self._objects.remove(obj)
+
+    def __iter__(self):
+        return iter(list(self._objects))
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, obj):
+        return obj in self._objects
+
+
+class _ID(_IDBase):
+    """Data-block without special behavior (object, material, scene, ...)."""
+
+    def __init__(self, recorder: Recorder, kind: str, name: str, data=None, *_a, **_kw):
+        super().__init__(recorder, kind)
+        self.name = name
+        if kind == "object":
+            self.data = data
+        elif kind == "scene":
+            self.collection = _Generic(recorder, "scene.collection")
+            self.collection.objects = _ObjectsLink(recorder, "scene.collection.objects")
+        elif kind == "collection":
+            self.objects = _ObjectsLink(recorder, "collection.objects")
+
+    def copy(self):
+        """Shallow copy like ID.copy: other datablocks (e.g. the objects of a
+        scene) are shared, not copied.
+        """
+        self._recorder.call(self._path + ".copy")
+        duplicate = self._owner.new(self.name)
+        for k, v in vars(self).items():
+            if not k.startswith("_") and k not in ("name", "collection", "objects"):
+                setattr(duplicate, k, v)
+        if self._path == "scene":
+            for obj in self.collection.objects:
+                duplicate.collection.objects.link(obj)
+        return duplicate
+
+
+class _IDCollection(_Generic):
+    """bpy.data.meshes, bpy.data.objects, ..."""
+
+    def __init__(self, recorder: Recorder, name: str, factory):
+        super().__init__(recorder, "data." + name)
+        self._factory = factory
+        self._items = collections.OrderedDict()
+
+    def _unique_name(self, name: str) -> str:
+        unique, i = name, 0
+        while unique in self._items:
+            i += 1
+            unique = "{}.{:03d}".format(name, i)
+        return unique
+
+    def new(self, name: str, *args, **kwargs):
+        self._recorder.call(self._path + ".new")
+        item = self._factory(self._recorder, self._unique_name(name), *args, **kwargs)
+        item._owner = self
+        self._items[item.name] = item
+        return item
+
+    def load(self, filepath: str, check_existing: bool = False):
+        self._recorder.call(self._path + ".load")
+        name = str(filepath).replace("\\", "/").split("/")[-1]
+        if check_existing and name in self._items:
+            return self._items[name]
+        return self.new(name)
+
+    def remove(self, item, *args, **kwargs):
+        self._recorder.call(self._path + ".remove")
+        # by identity, the item may have been renamed
+        for key, value in list(self._items.items()):
+            if value is item:
+                del self._items[key]
+                item._removed = True
+
+    def batch_remove(self, ids):
+        for item in ids:
+            if any(value is item for value in self._items.values()):
+                self.remove(item)
+
+    def get(self, name: str, default=None):
+        return self._items.get(name, default)
+
+    def keys(self):
+        return list(self._items.keys())
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self._items.values())[key]
+        return self._items[key]
+
+    def __contains__(self, name):
+        return name in self._items
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __len__(self):
+        return len(self._items)
+
+
+class _Data(_Generic):
+    """bpy.data"""
+
+    def batch_remove(self, ids):
+        ids = list(ids)
+        self._recorder.call("data.batch_remove")
+        for collection in vars(self).values():
+            if isinstance(collection, _IDCollection):
+                collection.batch_remove(ids)
+
+
+class _BMesh(_Generic):
+    def __init__(self, recorder: Recorder):
+        super().__init__(recorder, "bmesh")
+        self.counts = (0, 0, 0)
+
+    def to_mesh(self, mesh):
+        self._recorder.call("bmesh.to_mesh")
+        num_verts, num_loops, num_faces = self.counts
+        mesh.vertices.add(num_verts)
+        mesh.loops.add(num_loops)
+        mesh.polygons.add(num_faces)
+
+    def free(self):
+        pass
+
+
+def _bmesh_ops(recorder: Recorder) -> _Generic:
+    ops = _Generic(recorder, "bmesh.ops")
+
+    def create_cube(bm, **_kw):
+        recorder.call("bmesh.ops.create_cube")
+        bm.counts = (8, 24, 6)
+
+    def create_icosphere(bm, subdivisions: int = 1, **_kw):
+        recorder.call("bmesh.ops.create_icosphere")
+        faces = 20 * 4 ** (subdivisions - 1)
+        bm.counts = (faces // 2 + 2, 3 * faces, faces)
+
+    def create_cone(bm, segments: int = 32, **_kw):
+        recorder.call("bmesh.ops.create_cone")
+        bm.counts = (2 * segments, 6 * segments, segments + 2)
+
+    ops.create_cube = create_cube
+    ops.create_icosphere = create_icosphere
+    ops.create_cone = create_cone
+    return ops
+
+
+class _StandInModule(types.ModuleType):
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        child = _Generic(self._recorder, "{}.{}".format(self.__name__, name))
+        setattr(self, name, child)
+        return child
+
+
+def make_modules(
+    recorder: Recorder, version=DEFAULT_VERSION
+) -> {str: types.ModuleType}:
+    """Stand-in modules bpy, bmesh and mathutils that report to recorder."""
+    bpy = _StandInModule("bpy")
+    bpy._recorder = recorder
+
+    def id_factory(kind):
+        return lambda r, name, *args, **kwargs: _ID(r, kind, name, *args, **kwargs)
+
+    data = _Data(recorder, "data")
+    data.meshes = _IDCollection(recorder, "meshes", _Mesh)
+    data.images = _IDCollection(recorder, "images", _Image)
+    for name, kind in [
+        ("objects", "object"),
+        ("materials", "material"),
+        ("scenes", "scene"),
+        ("worlds", "world"),
+        ("cameras", "camera"),
+        ("lights", "light"),
+        ("collections", "collection"),
+        ("node_groups", "node_group"),
+        ("textures", "texture"),
+    ]:
+        setattr(data, name, _IDCollection(recorder, name, id_factory(kind)))
+    bpy.data = data
+
+    bpy.context = _Generic(recorder, "context")
+    bpy.context.scene = data.scenes.new("Scene")
+    bpy.ops = _Generic(recorder, "ops")
+    bpy.app = _Generic(recorder, "app")
+    bpy.app.version = tuple(version)
+    bpy.app.version_string = ".".join(str(v) for v in version)
+    bpy.app.binary_path = "blender"
+    bpy.app.background = True
+
+    bmesh = _StandInModule("bmesh")
+    bmesh._recorder = recorder
+    bmesh.new = lambda *args, **kwargs: _BMesh(recorder)
+    bmesh.ops = _bmesh_ops(recorder)
+
+    mathutils = _StandInModule("mathutils")
+    mathutils._recorder = recorder
+
+    return {"bpy": bpy, "bmesh": bmesh, "mathutils": mathutils}
+
+
+_recorder = None
+
+
+def _rebind(modules: {str: typing.Any}):
+    """Update bpy/bmesh/mathutils globals of the imported blender_kitti modules
+    that did not find the real modules.
+    """
+    bpy_helper.set_bpy_modules(**modules)
+    for module_name, module in list(sys.modules.items()):
+        if module is None or not module_name.startswith("blender_kitti"):
+            continue
+        for name, replacement in modules.items():
+            current = module.__dict__.get(name, False)
+            if current is None or isinstance(current, _StandInModule):
+                setattr(module, name, replacement)
+
+
+def install(version=DEFAULT_VERSION) -> Recorder:
+    """Put the stand-in modules into sys.modules and the already imported
+    blender_kitti modules.
+
+    :raises RuntimeError: if the real bpy is available
+    """
+    global _recorder
+    current = sys.modules.get("bpy")
+    if not isinstance(current, _StandInModule) and (
+        current is not None or importlib.util.find_spec("bpy") is not None
+    ):
+        raise RuntimeError("bpy is available, the stand-in is not needed.")
+
+    recorder = Recorder()
+    modules = make_modules(recorder, version)
+    sys.modules.update(modules)
+    _rebind(modules)
+    _recorder = recorder
+    return recorder
+
+
+def uninstall():
+    """Remove the stand-in modules again."""
+    global _recorder
+    if _recorder is None:
+        return
+    for name in ("bpy", "bmesh", "mathutils"):
+        if isinstance(sys.modules.get(name), _StandInModule):
+            del sys.modules[name]
+    _rebind({"bpy": None, "bmesh": None, "mathutils": None})
+    _recorder = None
+
+
+def get_recorder() -> typing.Optional[Recorder]:
+    """Recorder of the installed stand-in (None if not installed)."""
+    return _recorder
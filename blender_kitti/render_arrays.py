@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""Render into numpy arrays instead of image files.
+
+The combined pass is read from the compositor's Viewer node. Depth and object
+index are written by a File Output node (32 bit OpenEXR, temporary directory)
+and read back. Arrays are top-down (row 0 is the top of the image):
+
+    passes = render_arrays(scene, camera, passes=("combined", "depth"))
+    passes["combined"]  # [H, W, 4] float32, linear (before the view transform)
+    passes["depth"]  # [H, W] float32, distance to the camera plane
+
+The object index pass contains the pass_index of the objects, see
+set_pass_indices. It needs cycles.
+
+ImageWriter encodes and writes arrays in a background thread, so that the next
+view renders while the previous one is written:
+
+    with ImageWriter() as writer:
+        for name, camera in cameras.items():
+            passes = render_arrays(scene, camera)
+            writer.write("/tmp/{}.png".format(name), linear_to_srgb8(passes["combined"]))
+"""
+
+import logging
+import pathlib
+import queue
+import tempfile
+import threading
+import typing
+
+import numpy as np
+
+from .bpy_helper import needs_bpy_bmesh
+from .profiling import stage
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+RENDER_PASSES = ("combined", "depth", "object_index")
+
+# render layer output and view layer switch of the passes written to files
+_FILE_PASSES = {
+    "depth": ("Depth", "use_pass_z"),
+    "object_index": ("IndexOB", "use_pass_object_index"),
+}
+
+_VIEWER_NODE_NAME = "blender_kitti_viewer"
+_FILE_OUTPUT_NODE_NAME = "blender_kitti_passes"
+
+
+def _node_of_type(tree, node_type: str, bl_idname: str, added: list):
+    for node in tree.nodes:
+        if node.type == node_type:
+            return node
+    node = tree.nodes.new(bl_idname)
+    added.append(node)
+    return node
+
+
+def _setup_compositor(scene, passes: [str], directory: str) -> {str: typing.Any}:
+    """Viewer node for the combined pass and File Output node for the others.
+
+    :return: the previous settings and the added nodes and links, see
+        _restore_compositor
+    """
+    view_layer = scene.view_layers[0]
+    state = {
+        "use_nodes": scene.use_nodes,
+        "use_compositing": scene.render.use_compositing,
+        "view_layer": view_layer,
+        "use_passes": {
+            use_pass: getattr(view_layer, use_pass)
+            for _output, use_pass in _FILE_PASSES.values()
+        },
+        "nodes": [],
+        "links": [],
+    }
+    scene.use_nodes = True
+    scene.render.use_compositing = True
+    tree = scene.node_tree
+    state["active"] = tree.nodes.active
+    nodes = state["nodes"]
+    render_layers = _node_of_type(tree, "R_LAYERS", "CompositorNodeRLayers", nodes)
+    composite = _node_of_type(tree, "COMPOSITE", "CompositorNodeComposite", nodes)
+    if not composite.inputs["Image"].is_linked:
+        state["links"].append(
+            tree.links.new(render_layers.outputs["Image"], composite.inputs["Image"])
+        )
+
+    if "combined" in passes:
+        viewer = tree.nodes.new("CompositorNodeViewer")
+        viewer.name = _VIEWER_NODE_NAME
+        viewer.use_alpha = True
+        nodes.append(viewer)
+        tree.links.new(render_layers.outputs["Image"], viewer.inputs["Image"])
+        if "Alpha" in viewer.inputs:
+            tree.links.new(render_layers.outputs["Alpha"], viewer.inputs["Alpha"])
+        # the active viewer writes the 'Viewer Node' image
+        tree.nodes.active = viewer
+
+    file_passes = [p for p in passes if p in _FILE_PASSES]
+    if not file_passes:
+        return state
+    file_output = tree.nodes.new("CompositorNodeOutputFile")
+    nodes.append(file_output)
+    file_output.name = _FILE_OUTPUT_NODE_NAME
+    file_output.base_path = directory
+    file_output.format.file_format = "OPEN_EXR"
+    file_output.format.color_depth = "32"
+    file_output.file_slots.clear()
+    for p in file_passes:
+        output_name, use_pass = _FILE_PASSES[p]
+        setattr(view_layer, use_pass, True)
+        file_output.file_slots.new(p)
+        tree.links.new(render_layers.outputs[output_name], file_output.inputs[p])
+    return state
+
+
+def _restore_compositor(scene, state: {str: typing.Any}):
+    """Undo _setup_compositor: following renders must not write the passes, and
+    the compositor of the scene is left as it was.
+    """
+    tree = scene.node_tree
+    for link in state["links"]:
+        tree.links.remove(link)
+    # links of the added nodes are removed with them
+    for node in reversed(state["nodes"]):
+        tree.nodes.remove(node)
+    if state["active"] is not None:
+        tree.nodes.active = state["active"]
+    for use_pass, value in state["use_passes"].items():
+        setattr(state["view_layer"], use_pass, value)
+    scene.render.use_compositing = state["use_compositing"]
+    scene.use_nodes = state["use_nodes"]
+
+
+def _image_array(image) -> np.ndarray:
+    """[H, W, 4] float32 pixels of an image, top-down."""
+    width, height = image.size
+    pixels = np.empty((width * height * 4,), dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return np.ascontiguousarray(pixels.reshape((height, width, 4))[::-1])
+
+
+@needs_bpy_bmesh()
+def _load_pass(directory: str, name: str, *, bpy) -> np.ndarray:
+    # File Output node files are named <slot><frame>.exr
+    paths = sorted(pathlib.Path(directory).glob("{}*.exr".format(name)))
+    if not paths:
+        raise RuntimeError("Render pass '{}' was not written.".format(name))
+    image = bpy.data.images.load(str(paths[-1]))
+    try:
+        return _image_array(image)[..., 0]
+    finally:
+        bpy.data.images.remove(image)
+
+
+@needs_bpy_bmesh()
+def render_arrays(
+    scene, camera=None, passes: typing.Iterable[str] = ("combined",), *, bpy
+) -> {str: np.ndarray}:
+    """Render scene (with camera, default: the scene camera) without writing an
+    image file.
+
+    :param passes: subset of RENDER_PASSES
+    :return: pass name -> array, see module docstring
+    """
+    passes = tuple(passes)
+    unknown = set(passes) - set(RENDER_PASSES)
+    if unknown:
+        raise ValueError("Unknown render passes: {}.".format(sorted(unknown)))
+    if camera is not None:
+        scene.camera = camera
+
+    result = {}
+    with tempfile.TemporaryDirectory() as directory:
+        state = _setup_compositor(scene, passes, directory)
+        try:
+            with stage("render", camera=scene.camera.data.name):
+                bpy.ops.render.render(write_still=False, scene=scene.name)
+
+            with stage("read_passes"):
+                if "combined" in passes:
+                    result["combined"] = _image_array(bpy.data.images["Viewer Node"])
+                if "depth" in passes:
+                    result["depth"] = _load_pass(directory, "depth")
+                if "object_index" in passes:
+                    result["object_index"] = np.rint(
+                        _load_pass(directory, "object_index")
+                    ).astype(np.int32)
+        finally:
+            _restore_compositor(scene, state)
+    return result
+
+
+def set_pass_indices(scene, start: int = 1) -> {int: str}:
+    """Number the mesh and curve objects of scene (pass_index start, start+1,
+    ...) for the object index pass.
+
+    :return: pass index -> object name
+    """
+    indices = {}
+    for obj in scene.objects:
+        if obj.type in ("MESH", "CURVE"):
+            obj.pass_index = start + len(indices)
+            indices[obj.pass_index] = obj.name
+    return indices
+
+
+def linear_to_srgb8(rgba: np.ndarray) -> np.ndarray:
+    """8 bit sRGB (the 'Standard' view transform) of linear colors, alpha is kept
+    linear.
+    """
+    rgba = np.clip(rgba, 0.0, 1.0)
+    rgb = rgba[..., :3]
+    srgb = np.where(
+        rgb <= 0.0031308, 12.92 * rgb, 1.055 * np.power(rgb, 1.0 / 2.4) - 0.055
+    )
+    out = np.concatenate((srgb, rgba[..., 3:]), axis=-1)
+    return np.round(out * 255.0).astype(np.uint8)
+
+
+def _write_array(path: pathlib.Path, array: np.ndarray):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".npy":
+        np.save(str(path), array)
+    elif path.suffix == ".npz":
+        np.savez_compressed(str(path), array=array)
+    else:
+        # png, jpg, ... (float images in [0, 1], 2D arrays with a colormap)
+        from matplotlib import image as mpl_image
+
+        mpl_image.imsave(str(path), array)
+
+
+def render_views_to_arrays(
+    scene,
+    cameras,
+    passes: typing.Iterable[str] = ("combined",),
+    writer: "ImageWriter" = None,
+    outputs: {str: pathlib.Path} = None,
+) -> {str: {str: np.ndarray}}:
+    """render_arrays for every camera (see render_stage.render_views).
+
+    :param writer: also write the combined pass (8 bit sRGB) of every camera to
+        its output path, without waiting for the files
+    :return: camera name -> pass name -> array
+    """
+    arrays = {}
+    for name, cam in cameras.items():
+        arrays[name] = render_arrays(scene, cam, passes)
+        if writer is not None and "combined" in arrays[name]:
+            writer.write(outputs[name], linear_to_srgb8(arrays[name]["combined"]))
+    return arrays
+
+
+class ImageWriter:
+    """Writes arrays to image (or .npy/.npz) files in a background thread.
+
+    :param max_pending: write() blocks while this many images are waiting
+    """
+
+    def __init__(self, max_pending: int = 8):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._errors = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            path, array = item
+            try:
+                with stage("encode", path=str(path)):
+                    _write_array(path, array)
+            except Exception as e:
+                logger.error("Failed to write '{}': {}".format(path, e))
+                self._errors.append((path, e))
+
+    def write(self, path, array: np.ndarray):
+        """Queue array to be written to path (the array must not be modified
+        afterwards).
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("ImageWriter is closed.")
+        self._queue.put((pathlib.Path(path), array))
+
+    def close(self):
+        """Wait until all images are written.
+
+        :raise RuntimeError: if an image could not be written
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._errors:
+            raise RuntimeError(
+                "Failed to write {} image(s), first: '{}': {}".format(
+                    len(self._errors), *self._errors[0]
+                )
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+            return
+        # keep the exception of the with block, write errors are only logged
+        try:
+            self.close()
+        except RuntimeError as e:
+            logger.error(str(e))
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""Render stage from the render config: render settings, cameras and views.
+
+Example config:
+
+    render:
+      resolution: [1920, 1080]
+      samples: 64
+      adaptive_threshold: 0.02
+      time_limit: 30
+      threads: 8
+      profile: final  # or preview (EEVEE), see scene_setup.apply_render_profile
+      preset: balanced  # see RENDER_PRESETS, the settings above take precedence
+      output: "/tmp/renders/{stem}_{camera}.png"
+    cameras:
+      - name: main
+        type: perspective
+        location: [-33.3, 24.1, 26.1]
+        rotation_quat: [0.421, 0.213, -0.397, -0.787]
+        focal_length: 50.0
+      - name: top
+        type: ortho
+        center: [0.0, 0.0]
+        scale: 20.0
+    views: [main, top]
+
+All views are rendered from the same scene. Persistent data is enabled so that
+cycles keeps the scene (including the BVH) between the views and only
+synchronizes the changed objects for the next file of a batch.
+"""
+
+import logging
+import pathlib
+import time
+import typing
+
+from .bpy_helper import needs_bpy_bmesh
+from .profiling import is_profiling, stage
+from .scene_setup import (
+    add_cameras_default,
+    apply_render_profile,
+    create_camera_perspective,
+    create_camera_top_view_ortho,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+DEFAULT_OUTPUT_TEMPLATE = "{parent}/{stem}_{camera}.png"
+
+DEFAULT_RENDER_SETTINGS = {
+    "resolution": None,
+    "resolution_percentage": None,
+    "samples": None,
+    "adaptive_threshold": None,
+    "time_limit": None,
+    "threads": None,
+    "max_bounces": None,
+    "denoise": None,
+    "tile_size": None,
+    "persistent_data": True,
+    "profile": None,
+    "preset": None,
+    "output": DEFAULT_OUTPUT_TEMPLATE,
+}
+
+# names of the cameras of add_cameras_default
+DEFAULT_CAMERA_NAMES = ("CameraPerspective", "CameraTopViewOrtho")
+
+# cycles performance presets, explicit render settings take precedence.
+# denoise: False, "fast" or "accurate" (OpenImageDenoise on the CPU)
+RENDER_PRESETS = {
+    "draft": {
+        "samples": 16,
+        "adaptive_threshold": 0.1,
+        "max_bounces": 2,
+        "denoise": "fast",
+        "threads": 0,
+        "tile_size": 2048,
+    },
+    "balanced": {
+        "samples": 64,
+        "adaptive_threshold": 0.02,
+        "max_bounces": 4,
+        "denoise": "fast",
+        "threads": 0,
+        "tile_size": 2048,
+    },
+    "quality": {
+        "samples": 256,
+        "adaptive_threshold": 0.01,
+        "max_bounces": 8,
+        "denoise": "accurate",
+        "threads": 0,
+        "tile_size": 1024,
+    },
+}
+
+
+def format_output_path(
+    template: str, filepath: pathlib.Path, index: int, camera: str
+) -> pathlib.Path:
+    """Fields: {stem}, {name}, {parent}, {index} and {camera}."""
+    return pathlib.Path(
+        template.format(
+            stem=filepath.stem,
+            name=filepath.name,
+            parent=str(filepath.parent),
+            index=index,
+            camera=camera,
+        )
+    )
+
+
+def render_settings_from_config(config: {str: typing.Any}) -> {str: typing.Any}:
+    """Settings of the 'render' config section, completed with defaults."""
+    settings = dict(config.get("render") or {})
+    unknown = set(settings) - set(DEFAULT_RENDER_SETTINGS)
+    if unknown:
+        raise ValueError("Unknown render settings: {}.".format(sorted(unknown)))
+    preset = settings.get("preset")
+    if preset is not None and preset not in RENDER_PRESETS:
+        raise ValueError(
+            "Unknown render preset '{}', expected one of {}.".format(
+                preset, sorted(RENDER_PRESETS)
+            )
+        )
+    return {**DEFAULT_RENDER_SETTINGS, **RENDER_PRESETS.get(preset, {}), **settings}
+
+
+def _apply_denoise(scene, denoise):
+    cycles = scene.cycles
+    cycles.use_denoising = bool(denoise)
+    for view_layer in scene.view_layers:
+        view_layer.cycles.use_denoising = bool(denoise)
+    if not denoise:
+        return
+    if hasattr(cycles, "denoiser"):
+        # OpenImageDenoise runs on the CPU
+        cycles.denoiser = "OPENIMAGEDENOISE"
+    if hasattr(cycles, "denoising_prefilter"):
+        cycles.denoising_prefilter = "FAST" if denoise == "fast" else "ACCURATE"
+    if hasattr(cycles, "denoising_input_passes"):
+        cycles.denoising_input_passes = (
+            "RGB_ALBEDO" if denoise == "fast" else "RGB_ALBEDO_NORMAL"
+        )
+
+
+def apply_render_settings(scene, settings: {str: typing.Any}):
+    """Settings that are None keep the scene's value."""
+    render = scene.render
+    if settings["profile"] is not None:
+        apply_render_profile(scene, settings["profile"])
+    if settings["resolution"] is not None:
+        render.resolution_x, render.resolution_y = (
+            int(x) for x in settings["resolution"]
+        )
+    if settings["resolution_percentage"] is not None:
+        render.resolution_percentage = int(settings["resolution_percentage"])
+
+    if settings["samples"] is not None:
+        if render.engine == "CYCLES":
+            scene.cycles.samples = int(settings["samples"])
+        else:
+            scene.eevee.taa_render_samples = int(settings["samples"])
+    if settings["adaptive_threshold"] is not None:
+        scene.cycles.use_adaptive_sampling = settings["adaptive_threshold"] > 0.0
+        scene.cycles.adaptive_threshold = float(settings["adaptive_threshold"])
+    if settings["time_limit"] is not None:
+        if hasattr(scene.cycles, "time_limit"):
+            scene.cycles.time_limit = float(settings["time_limit"])
+        else:
+            logger.warning("Render time limit needs blender 3.0+. Ignoring it.")
+
+    if settings["max_bounces"] is not None:
+        max_bounces = int(settings["max_bounces"])
+        scene.cycles.max_bounces = max_bounces
+        # volume and transparent bounces keep their values
+        scene.cycles.diffuse_bounces = max_bounces
+        scene.cycles.glossy_bounces = max_bounces
+        scene.cycles.transmission_bounces = max_bounces
+    if settings["denoise"] is not None:
+        _apply_denoise(scene, settings["denoise"])
+    if settings["tile_size"] is not None:
+        if hasattr(scene.cycles, "tile_size"):
+            scene.cycles.use_auto_tile = True
+            scene.cycles.tile_size = int(settings["tile_size"])
+        else:
+            # blender < 3.0
+            render.tile_x = render.tile_y = int(settings["tile_size"])
+
+    if settings["threads"]:
+        render.threads_mode = "FIXED"
+        render.threads = int(settings["threads"])
+    elif settings["threads"] is not None:
+        render.threads_mode = "AUTO"
+
+    # keep the synchronized scene between renders of the views and of the files
+    # of a batch (only changed objects are synchronized again)
+    render.use_persistent_data = bool(settings["persistent_data"])
+
+
+def _create_camera(camera_config: {str: typing.Any}):
+    camera_config = dict(camera_config)
+    name = camera_config.pop("name")
+    camera_type = camera_config.pop("type", "perspective")
+    if camera_type == "perspective":
+        return create_camera_perspective(
+            location=tuple(camera_config["location"]),
+            rotation_quat=tuple(camera_config["rotation_quat"]),
+            name=name,
+            focal_length=camera_config.get("focal_length", 50.0),
+        )
+    if camera_type == "ortho":
+        return create_camera_top_view_ortho(
+            name=name,
+            center=tuple(camera_config.get("center", (0.0, 0.0))),
+            scale=camera_config.get("scale", 20.0),
+        )
+    raise ValueError("Unknown camera type '{}'.".format(camera_type))
+
+
+def add_cameras_from_config(scene, config: {str: typing.Any}):
+    """Cameras of the 'cameras' config section (default: add_cameras_default).
+
+    :return: camera name (the name in the config) -> camera object, in render
+        order of the 'views' config section (default: all cameras)
+    """
+    if "cameras" in config:
+        # keyed by the config name, blender renames the datablocks if the name
+        # is taken (e.g. 'main.001')
+        cameras = {}
+        for camera_config in config["cameras"]:
+            if camera_config["name"] in cameras:
+                raise ValueError(
+                    "Duplicate camera name '{}'.".format(camera_config["name"])
+                )
+            cameras[camera_config["name"]] = _create_camera(camera_config)
+        for cam in cameras.values():
+            scene.collection.objects.link(cam)
+        if cameras:
+            scene.camera = next(iter(cameras.values()))
+    else:
+        cameras = dict(zip(DEFAULT_CAMERA_NAMES, add_cameras_default(scene)))
+
+    views = config.get("views")
+    if views is None:
+        return cameras
+    missing = [v for v in views if v not in cameras]
+    if missing:
+        raise ValueError("Views without camera: {}.".format(missing))
+    return {v: cameras[v] for v in views}
+
+
+@needs_bpy_bmesh()
+def render_camera(scene, camera, output_path: pathlib.Path, *, bpy):
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    scene.camera = camera
+    scene.render.filepath = str(output_path)
+    if is_profiling():
+        # evaluate the dependency graph here (instead of in the render) so that
+        # scene synchronization shows up as separate stage
+        with stage("scene_sync"):
+            scene.view_layers[0].update()
+    with stage("render", camera=camera.data.name):
+        bpy.ops.render.render(write_still=True, scene=scene.name)
+
+
+def render_views(scene, cameras, outputs: {str: pathlib.Path}) -> {str: float}:
+    """Render every camera to its output path.
+
+    :return: render seconds per camera name
+    """
+    seconds = {}
+    for name, cam in cameras.items():
+        t = time.perf_counter()
+        render_camera(scene, cam, outputs[name])
+        seconds[name] = time.perf_counter() - t
+        logger.info(
+            "Rendered view '{}' to '{}' in {:.2f}s.".format(
+                name, outputs[name], seconds[name]
+            )
+        )
+    return seconds
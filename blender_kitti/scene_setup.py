@@ -2,22 +2,22 @@
 """"""
 
 import pathlib
-import bpy
-# from .bpy_helper import needs_bpy_bmesh
 
+try:
+    import bpy
+except ImportError:
+    # outside of blender, see recording_bpy
+    bpy = None
 
-def clear_all():
-    bpy.ops.object.select_all(action="SELECT")
-    bpy.ops.object.delete()
+# from .bpy_helper import needs_bpy_bmesh
+from .datablocks import remove_all_datablocks
 
-    master_collection = bpy.context.scene.collection
-    for c in master_collection.children:
-        master_collection.children.unlink(c)
 
-    for c in bpy.data.collections:
-        for o in c.objects:
-            bpy.data.objects.remove(o)
-        bpy.data.collections.remove(c)
+def clear_all():
+    """Remove all objects and collections in one batch. Their meshes, materials,
+    images, ... are kept (see datablocks.remove_all_datablocks to remove them too).
+    """
+    remove_all_datablocks(kinds=("objects", "collections"))
 
 
 def add_light_source(scene):
@@ -57,15 +57,23 @@ def add_light_source(scene):
     world.light_settings.use_ambient_occlusion = True
 
 
-def create_world_with_hdr_background(name: str = "world_hdr"):
-    hdr_filepath = (
-        pathlib.Path(__file__).parent.parent / "assets" / "ruckenkreuz_2k.hdr"
-    )
+HDR_BACKGROUND_PATH = (
+    pathlib.Path(__file__).parent.parent / "assets" / "ruckenkreuz_2k.hdr"
+)
+
+# shared worlds by HDR file path
+_world_cache = {}
+
+
+def create_world_with_hdr_background(
+    name: str = "world_hdr", hdr_filepath: pathlib.Path = HDR_BACKGROUND_PATH
+):
     if not hdr_filepath.is_file():
         raise FileNotFoundError(
             "Cannot find HDR background file {}".format(str(hdr_filepath))
         )
-    background_image = bpy.data.images.load(str(hdr_filepath), check_existing=False)
+    # an image of this file that is already loaded is reused
+    background_image = bpy.data.images.load(str(hdr_filepath), check_existing=True)
 
     world = bpy.data.worlds.new(name)
     world.use_nodes = True
@@ -89,10 +97,42 @@ def create_world_with_hdr_background(name: str = "world_hdr"):
     return world
 
 
+def get_cached_world(hdr_filepath: pathlib.Path = HDR_BACKGROUND_PATH):
+    """World with the HDR background, shared by all scenes. It is created again
+    if it has been removed from bpy.data in the meantime.
+    """
+    key = str(pathlib.Path(hdr_filepath).resolve())
+    try:
+        world = _world_cache[key]
+        # removed datablocks raise ReferenceError on access
+        _ = world.name
+        return world
+    except (KeyError, ReferenceError):
+        world = create_world_with_hdr_background(
+            hdr_filepath=pathlib.Path(hdr_filepath)
+        )
+        _world_cache[key] = world
+        return world
+
+
+def is_cached_world(datablock) -> bool:
+    """Whether datablock is a cached world or its background image."""
+    for world in _world_cache.values():
+        try:
+            if datablock == world:
+                return True
+            for node in world.node_tree.nodes:
+                if getattr(node, "image", None) == datablock:
+                    return True
+        except ReferenceError:
+            continue
+    return False
+
+
 def create_camera_top_view_ortho(
     name: str = "CameraTopViewOrtho", center=(0.0, 0.0), scale: float = 20.0
 ):
-    """top view orthographic. """
+    """top view orthographic."""
     cam = bpy.data.cameras.new(name)
     cam = bpy.data.objects.new("Obj" + name, cam)
     cam.location = center + (45.0,)
@@ -120,7 +160,7 @@ def create_camera_perspective(
 
 
 def add_cameras_default(scene):
-    """ Make two camera (main/top) default setup for demo images."""
+    """Make two camera (main/top) default setup for demo images."""
     cam_main = create_camera_perspective(
         location=(-33.3056, 24.1123, 26.0909),
         rotation_quat=(0.42119, 0.21272, -0.39741, -0.78703),
@@ -135,15 +175,67 @@ def add_cameras_default(scene):
     return cam_main, cam_top
 
 
-def setup_scene(name: str = "blender_kitti", use_background_image: bool = True):
+# "final": cycles path tracing, "preview": EEVEE rasterization
+RENDER_PROFILES = ("final", "preview")
+
+# EEVEE settings of the preview profile
+_PREVIEW_SAMPLES = 8
+_PREVIEW_DISABLED_EFFECTS = (
+    "use_bloom",
+    "use_ssr",
+    "use_gtao",
+    "use_soft_shadows",
+    "use_motion_blur",
+    "use_volumetric_lights",
+    "use_raytracing",
+)
+
+
+def _eevee_engine() -> str:
+    # EEVEE Next has its own engine name in blender 4.2 - 4.x
+    if (4, 2, 0) <= tuple(bpy.app.version) < (5, 0, 0):
+        return "BLENDER_EEVEE_NEXT"
+    return "BLENDER_EEVEE"
+
+
+def apply_render_profile(scene, profile: str = "final"):
+    """Set the render engine of a profile (see RENDER_PROFILES).
+
+    The preview profile renders the same materials (vertex, attribute and image
+    colors) with EEVEE, few samples and without screen space effects and soft
+    shadows. A frame takes a fraction of a second.
+    """
+    if profile == "final":
+        scene.render.engine = "CYCLES"
+    elif profile == "preview":
+        scene.render.engine = _eevee_engine()
+        scene.eevee.taa_render_samples = _PREVIEW_SAMPLES
+        for name in _PREVIEW_DISABLED_EFFECTS:
+            # the available options depend on the blender version
+            if hasattr(scene.eevee, name):
+                setattr(scene.eevee, name, False)
+    else:
+        raise ValueError(
+            "Unknown render profile '{}', expected one of {}.".format(
+                profile, RENDER_PROFILES
+            )
+        )
+
+
+def setup_scene(
+    name: str = "blender_kitti",
+    use_background_image: bool = True,
+    render_profile: str = "final",
+):
+    """:param render_profile: see apply_render_profile"""
     scene = bpy.data.scenes.new(name)
-    scene.render.engine = "CYCLES"
+    apply_render_profile(scene, render_profile)
     scene.render.film_transparent = True
 
     # clear_all()
 
     if use_background_image:
-        scene.world = create_world_with_hdr_background()
+        scene.world = get_cached_world()
     else:
         add_light_source(scene)
     return scene
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Scene templates: a scene with world, cameras and render settings that is set
+up once and copied for every job.
+
+    template = SceneTemplate(config)
+    with datablock_scope("job_1") as scope:
+        scene, cameras = template.new_scene("job_1")
+        add_objects_from_data(tasks, scene)
+        render_views(scene, cameras, outputs)
+    free_datablocks(scope)
+
+A copy (Scene.copy) links the objects of the template (the cameras) and shares
+its world, so creating it is cheap. Objects added to a copy are only in the copy
+and render settings changed on a copy do not affect the template.
+"""
+
+import typing
+
+from .blender_kitti import make_scene
+from .render_stage import (
+    add_cameras_from_config,
+    apply_render_settings,
+    render_settings_from_config,
+)
+from .system_setup import setup_system
+
+
+class SceneTemplate:
+    """Scene of make_scene with the cameras and render settings of config (see
+    render_stage).
+    """
+
+    def __init__(
+        self, config: {str: typing.Any} = None, name: str = "blender_kitti_template"
+    ):
+        if config is None:
+            config = {}
+        self.config = config
+        self.settings = render_settings_from_config(config)
+        self.scene = make_scene(config, fallback_scene_name=name)
+        self.cameras = add_cameras_from_config(self.scene, config)
+        try:
+            setup_system(
+                enable_gpu_rendering=config.get("gpu", False), scene=self.scene
+            )
+        except ImportError:
+            pass
+        apply_render_settings(self.scene, self.settings)
+
+    def new_scene(self, name: str):
+        """Copy of the template scene.
+
+        :return: scene and its cameras (camera name -> object, see
+            add_cameras_from_config)
+        """
+        scene = self.scene.copy()
+        scene.name = name
+        return scene, dict(self.cameras)
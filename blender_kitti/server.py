@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+"""Render server: one blender process that keeps a scene template (world, cameras,
+render settings, cached materials) and renders jobs received over a local Unix
+socket.
+
+Requests and responses are JSON lines, binary payloads follow their line:
+
+    {"id": 1, "file": "/data/000001.npz"}
+    {"id": 2, "npz_bytes": 123456, "name": "frame_2", "return_images": true}
+    <123456 bytes of an .npz file>
+    {"id": 3, "shared_memory": {"segment": ..., "arrays": ...}, "name": "frame_3"}
+
+The last one reads the arrays from a shared memory segment of the client, see
+shared_arrays.SharedFrame.
+
+Optional job keys: "views" (subset of the cameras), "render" (render settings for
+this job, see render_stage), "output" (output path template, see
+format_output_path) and "return_images" (send the encoded images back instead of
+keeping the files). Responses contain "status" ("done" or "failed"), "outputs"
+(camera -> path), "images" ([{"camera": ..., "bytes": ...}], the image data
+follows the line in this order), "seconds" and "error".
+{"op": "ping"} and {"op": "stop"} query and stop the server. Jobs that are not
+rendered when the server stops (sent after the stop request, or interrupted)
+fail.
+
+Connections are handled by an asyncio event loop in a separate thread. Jobs are
+queued and rendered one after another on the main thread (bpy is not thread
+safe). Every job renders a copy of the template scene (see scene_template), which
+is removed with the objects of the job after rendering (see datablocks).
+"""
+
+import asyncio
+import io
+import json
+import logging
+import pathlib
+import queue
+import socket
+import stat
+import tempfile
+import threading
+import time
+import typing
+
+import numpy as np
+
+from .batch import build_file_objects, build_task_objects
+from .blender_kitti import extract_data_tasks_from_arrays, load_task_data
+from .datablocks import datablock_scope, free_datablocks
+from .material_shader import is_cached_material
+from .prepared_cache import prepared_cache_from_config
+from .profiling import stage
+from .render_stage import (
+    apply_render_settings,
+    format_output_path,
+    render_settings_from_config,
+    render_views,
+)
+from .scene_template import SceneTemplate
+from .shared_arrays import SharedFrame, shared_data_tasks
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+DEFAULT_SOCKET_PATH = "/tmp/blender_kitti.sock"
+STOPPING_ERROR = "Render server is stopping."
+
+
+def build_npz_bytes_objects(
+    payload: bytes,
+    name: str,
+    scene,
+    config: {str: typing.Any},
+    prepared_cache=None,
+) -> {str: float}:
+    """Add the objects of an .npz file in memory to scene (see build_file_objects).
+
+    :param name: file description (instance name prefix) if the data has none
+    :return: seconds for loading the data and building the objects
+    """
+    seconds = {}
+    t = time.perf_counter()
+    with stage("file_load", file=name):
+        with np.load(io.BytesIO(payload), allow_pickle=False) as npz:
+            data = dict(npz)
+        tasks, _file_config = extract_data_tasks_from_arrays(
+            data,
+            name,
+            whitelist=config.get("whitelist"),
+            data_types=config.get("data_types"),
+            load=False,
+        )
+        load_task_data(tasks)
+    seconds["load"] = time.perf_counter() - t
+    seconds.update(build_task_objects(tasks, scene, config, prepared_cache, file=name))
+    return seconds
+
+
+def build_shared_objects(
+    descriptor: {str: typing.Any},
+    name: str,
+    scene,
+    config: {str: typing.Any},
+    prepared_cache=None,
+) -> {str: float}:
+    """Add the objects of arrays in shared memory (see shared_arrays) to scene.
+
+    :param name: file description (instance name prefix) if the data has none
+    :return: seconds for opening the arrays and building the objects
+    """
+    t = time.perf_counter()
+    with shared_data_tasks(
+        descriptor,
+        name,
+        whitelist=config.get("whitelist"),
+        data_types=config.get("data_types"),
+    ) as (tasks, _file_config):
+        seconds = {"load": time.perf_counter() - t}
+        seconds.update(
+            build_task_objects(tasks, scene, config, prepared_cache, file=name)
+        )
+    return seconds
+
+
+class RenderServer:
+    """Scene and render settings of the render config, set up once. See the
+    module docstring for the protocol.
+
+    :param output_template: default output path template of the jobs
+        (default: 'output' of the render settings)
+    """
+
+    def __init__(self, config: {str: typing.Any} = None, output_template: str = None):
+        if config is None:
+            config = {}
+        self.config = config
+        settings = render_settings_from_config(config)
+        self.output_template = output_template or settings["output"]
+
+        # every job renders a copy of the template scene
+        self.template = SceneTemplate(config, name="blender_kitti_server")
+        self.cameras = self.template.cameras
+        self.prepared_cache = prepared_cache_from_config(config)
+
+        self.num_jobs = 0
+        # (job, payload, future) items, None stops the server
+        self._jobs = queue.Queue()
+        # future of the job that is rendered
+        self._current = None
+        # no jobs are accepted after a stop request
+        self._stopping = False
+        self._loop = None
+        self._stopped = None
+        # connection handler task -> stream writer
+        self._connections = {}
+
+    def render_job(
+        self, job: {str: typing.Any}, payload: bytes = None
+    ) -> ({str: typing.Any}, [bytes]):
+        """Build the objects of a job, render its views and remove the objects.
+
+        :param payload: .npz file content (instead of job['file'])
+        :return: response and the encoded images (with job['return_images'])
+        """
+        index = self.num_jobs
+        self.num_jobs += 1
+        t_job = time.perf_counter()
+        seconds = {}
+        response = {"id": job.get("id"), "seconds": seconds}
+        images = []
+        scope = None
+        try:
+            views = job.get("views") or list(self.cameras)
+            missing = [v for v in views if v not in self.cameras]
+            if missing:
+                raise ValueError("Views without camera: {}.".format(missing))
+            cameras = {v: self.cameras[v] for v in views}
+            overrides = dict(job.get("render") or {})
+            # raises for unknown settings
+            settings = render_settings_from_config(
+                {"render": {**(self.config.get("render") or {}), **overrides}}
+            )
+
+            if payload is None and "shared_memory" not in job:
+                filepath = pathlib.Path(job["file"])
+            else:
+                filepath = pathlib.Path(
+                    "{}.npz".format(job.get("name") or "job_{}".format(index))
+                )
+
+            with datablock_scope(str(filepath)) as scope:
+                scene, _ = self.template.new_scene(filepath.stem)
+                if overrides:
+                    apply_render_settings(scene, settings)
+
+                if "shared_memory" in job:
+                    seconds.update(
+                        build_shared_objects(
+                            job["shared_memory"],
+                            filepath.stem,
+                            scene,
+                            self.config,
+                            self.prepared_cache,
+                        )
+                    )
+                elif payload is None:
+                    seconds.update(
+                        build_file_objects(
+                            filepath, scene, self.config, self.prepared_cache
+                        )
+                    )
+                else:
+                    seconds.update(
+                        build_npz_bytes_objects(
+                            payload,
+                            filepath.stem,
+                            scene,
+                            self.config,
+                            self.prepared_cache,
+                        )
+                    )
+
+                with tempfile.TemporaryDirectory() as tmp:
+                    if job.get("return_images"):
+                        outputs = {
+                            name: pathlib.Path(tmp) / "{}.png".format(name)
+                            for name in cameras
+                        }
+                    else:
+                        template = job.get("output") or self.output_template
+                        outputs = {
+                            name: format_output_path(template, filepath, index, name)
+                            for name in cameras
+                        }
+
+                    seconds["views"] = render_views(scene, cameras, outputs)
+
+                    if job.get("return_images"):
+                        images = [outputs[name].read_bytes() for name in cameras]
+                        response["images"] = [
+                            {"camera": name, "bytes": len(data)}
+                            for name, data in zip(cameras, images)
+                        ]
+                    else:
+                        response["outputs"] = {k: str(v) for k, v in outputs.items()}
+            response["status"] = "done"
+        except Exception as e:
+            logger.error("Failed to render job {}: {}".format(job.get("id"), e))
+            response["status"] = "failed"
+            response["error"] = str(e)
+            images = []
+            response.pop("images", None)
+        finally:
+            t = time.perf_counter()
+            if scope is not None:
+                free_datablocks(scope, keep=is_cached_material)
+            seconds["cleanup"] = time.perf_counter() - t
+            seconds["total"] = time.perf_counter() - t_job
+        return response, images
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                job = json.loads(line)
+                payload = None
+                if job.get("npz_bytes"):
+                    payload = await reader.readexactly(int(job["npz_bytes"]))
+
+                images = []
+                op = job.get("op", "render")
+                if op == "ping":
+                    response = {
+                        "status": "ok",
+                        "cameras": list(self.cameras),
+                        "queued": self._jobs.qsize(),
+                        "jobs": self.num_jobs,
+                    }
+                elif op == "stop":
+                    # jobs queued before are still rendered
+                    self._stopping = True
+                    self._jobs.put(None)
+                    response = {"status": "stopping"}
+                elif op == "render" and self._stopping:
+                    response = {"status": "failed", "error": STOPPING_ERROR}
+                elif op == "render":
+                    future = asyncio.get_event_loop().create_future()
+                    self._jobs.put((job, payload, future))
+                    response, images = await future
+                else:
+                    response = {"status": "failed", "error": "unknown op " + op}
+
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                for data in images:
+                    writer.write(data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.warning("Connection closed: {}".format(e))
+        except ValueError as e:
+            logger.warning("Invalid request: {}".format(e))
+        finally:
+            writer.close()
+            self._connections.pop(task, None)
+
+    def _run_loop(self, socket_path: str, started: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._stopped = asyncio.Event()
+        server = loop.run_until_complete(
+            asyncio.start_unix_server(self._handle_connection, path=socket_path)
+        )
+        started.set()
+        try:
+            loop.run_until_complete(self._stopped.wait())
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            self._fail_pending_jobs()
+            # let the handlers send the failures
+            loop.run_until_complete(asyncio.sleep(0))
+            # close the connections that are still open (their reads end)
+            for writer in self._connections.values():
+                writer.close()
+            loop.run_until_complete(
+                asyncio.gather(*self._connections, return_exceptions=True)
+            )
+            loop.close()
+
+    @staticmethod
+    def _set_result(future, result):
+        # the client may have disconnected
+        if not future.done():
+            future.set_result(result)
+
+    def _fail_pending_jobs(self):
+        """Fail the interrupted job and the jobs that are still queued, so that
+        their connections end. Runs on the event loop.
+        """
+        self._stopping = True
+        futures = [] if self._current is None else [self._current]
+        while True:
+            try:
+                item = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                futures.append(item[2])
+        for future in futures:
+            self._set_result(
+                future, ({"status": "failed", "error": STOPPING_ERROR}, [])
+            )
+
+    def serve(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        """Render jobs until a stop request (or KeyboardInterrupt). Blocks the
+        calling (main) thread.
+        """
+        path = pathlib.Path(socket_path)
+        if path.exists() and stat.S_ISSOCK(path.stat().st_mode):
+            # left over from a previous server
+            path.unlink()
+
+        started = threading.Event()
+        loop_thread = threading.Thread(
+            target=self._run_loop, args=(str(path), started), daemon=True
+        )
+        loop_thread.start()
+        started.wait()
+        logger.info(
+            "Render server listening on '{}' (cameras: {}).".format(
+                path, list(self.cameras)
+            )
+        )
+
+        try:
+            while True:
+                item = self._jobs.get()
+                if item is None:
+                    break
+                job, payload, future = item
+                self._current = future
+                result = self.render_job(job, payload)
+                logger.info(
+                    "Job {} {} in {:.2f}s.".format(
+                        job.get("id"),
+                        result[0]["status"],
+                        result[0]["seconds"]["total"],
+                    )
+                )
+                self._loop.call_soon_threadsafe(self._set_result, future, result)
+                self._current = None
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+            loop_thread.join()
+            if path.exists():
+                path.unlink()
+        logger.info("Render server stopped after {} jobs.".format(self.num_jobs))
+
+
+def serve(
+    config: {str: typing.Any} = None,
+    socket_path: str = DEFAULT_SOCKET_PATH,
+    output_template: str = None,
+):
+    """Set up the scene of config and render jobs from socket_path."""
+    RenderServer(config, output_template=output_template).serve(socket_path)
+
+
+class RenderClient:
+    """Connection to a render server (plain python, no blender needed).
+
+    with RenderClient() as client:
+        response = client.render(data={"point_cloud+lidar+points": points},
+                                 return_images=True)
+        png = response["images"]["main"]
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: float = None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(str(socket_path))
+        self._file = self._socket.makefile("rb")
+        self._next_id = 0
+
+    def _request(self, message: {str: typing.Any}, payload: bytes = None):
+        if payload is not None:
+            message = dict(message, npz_bytes=len(payload))
+        self._socket.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        if payload is not None:
+            self._socket.sendall(payload)
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Render server closed the connection.")
+        return json.loads(line)
+
+    def render(
+        self,
+        file: str = None,
+        data: typing.Union[bytes, typing.Mapping[str, np.ndarray]] = None,
+        shared: SharedFrame = None,
+        **options
+    ) -> {str: typing.Any}:
+        """Render a data file (path on the server side) or data in memory.
+
+        :param data: .npz file content or arrays by data key (see
+            extract_data_tasks_from_arrays)
+        :param shared: arrays in shared memory, keep the frame open until the
+            response has been received
+        :param options: further job keys (name, views, render, output,
+            return_images), see module docstring
+        :return: response, "images" maps camera -> encoded image
+        """
+        if sum(x is not None for x in (file, data, shared)) != 1:
+            raise ValueError("Pass one of file, data or shared.")
+        message = {"id": self._next_id, **options}
+        self._next_id += 1
+        payload = None
+        if file is not None:
+            message["file"] = str(file)
+        elif shared is not None:
+            message["shared_memory"] = shared.descriptor
+        elif isinstance(data, bytes):
+            payload = data
+        else:
+            buffer = io.BytesIO()
+            np.savez(buffer, **data)
+            payload = buffer.getvalue()
+
+        response = self._request(message, payload)
+        images = {}
+        for image in response.get("images", []):
+            images[image["camera"]] = self._read_exactly(image["bytes"])
+        response["images"] = images
+        return response
+
+    def _read_exactly(self, num_bytes: int) -> bytes:
+        data = self._file.read(num_bytes)
+        if len(data) != num_bytes:
+            raise ConnectionError("Render server closed the connection.")
+        return data
+
+    def ping(self) -> {str: typing.Any}:
+        return self._request({"op": "ping"})
+
+    def stop(self) -> {str: typing.Any}:
+        """Stop the server after the jobs that are already queued."""
+        return self._request({"op": "stop"})
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Pass data arrays from another process through shared memory instead of .npz
+files.
+
+The producer writes the arrays of a frame into one shared memory segment and
+sends the small (JSON serializable) descriptor, e.g. to the render server:
+
+    with SharedFrame({"point_cloud+lidar+points": points}) as frame:
+        client.render(shared=frame)  # see server.RenderClient
+
+The blender side builds the tasks directly over the shared buffer (no copy, no
+file, no deserialization):
+
+    with shared_data_tasks(frame.descriptor, "frame_0001") as (tasks, config):
+        add_objects_from_data(tasks, scene)
+
+Arrays should already have the dtype the tasks use (e.g. float32 points),
+otherwise they are converted (copied) while preparing. Needs python 3.8+.
+"""
+
+import contextlib
+import logging
+import typing
+
+import numpy as np
+
+from .blender_kitti import extract_data_tasks_from_arrays
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # python < 3.8
+    resource_tracker, shared_memory = None, None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+formatter = logging.Formatter(
+    fmt="%(asctime)s - %(levelname)s - %(module)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+handler.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+# offsets of the arrays in a segment
+_ALIGNMENT = 64
+
+# names of the open segments created by SharedFrames of this process
+_own_segments = set()
+
+
+def _check_available():
+    if shared_memory is None:
+        raise RuntimeError("Shared memory arrays need python 3.8 or newer.")
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class SharedFrame:
+    """Arrays (data key -> array, see extract_data_tasks_from_arrays) copied into
+    one new shared memory segment. The producer owns the segment: keep the frame
+    open until the consumer is done, close() removes the segment.
+    """
+
+    def __init__(self, arrays: typing.Mapping[str, typing.Any]):
+        _check_available()
+        arrays = {k: np.ascontiguousarray(v) for k, v in arrays.items()}
+        for key, array in arrays.items():
+            if array.dtype.hasobject:
+                raise ValueError("Array '{}' has dtype object.".format(key))
+
+        layout = {}
+        size = 0
+        for key, array in arrays.items():
+            offset = _aligned(size)
+            layout[key] = {
+                "offset": offset,
+                "shape": list(array.shape),
+                "dtype": array.dtype.str,
+            }
+            size = offset + array.nbytes
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        _own_segments.add(self.shm.name)
+        for key, array in arrays.items():
+            np.ndarray(
+                array.shape,
+                dtype=array.dtype,
+                buffer=self.shm.buf,
+                offset=layout[key]["offset"],
+            )[...] = array
+        self.descriptor = {"segment": self.shm.name, "arrays": layout}
+
+    def close(self):
+        if self.shm is not None:
+            _own_segments.discard(self.shm.name)
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _attach(name: str):
+    """Open an existing segment without taking ownership: the resource tracker
+    of this process must not remove it on exit.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 always tracks the segment
+        shm = shared_memory.SharedMemory(name=name)
+        # the tracker keeps one registration per name: for a segment of a
+        # SharedFrame in this process, it is the one of the frame, which
+        # unregisters it on unlink
+        if name not in _own_segments:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def open_shared_arrays(descriptor: {str: typing.Any}):
+    """Arrays of a SharedFrame descriptor as views of the shared buffer.
+
+    :return: data key -> array, and the segment (close it after the arrays
+        have been released)
+    """
+    _check_available()
+    shm = _attach(descriptor["segment"])
+    data = {
+        key: np.ndarray(
+            tuple(a["shape"]),
+            dtype=np.dtype(a["dtype"]),
+            buffer=shm.buf,
+            offset=a["offset"],
+        )
+        for key, a in descriptor["arrays"].items()
+    }
+    return data, shm
+
+
+@contextlib.contextmanager
+def shared_data_tasks(
+    descriptor: {str: typing.Any},
+    default_file_desc: str,
+    *,
+    whitelist=None,
+    data_types=None,
+):
+    """Tasks over the arrays of a SharedFrame descriptor (see
+    extract_data_tasks_from_arrays). The arguments of the tasks are views of the
+    shared buffer and are removed when the with block is left.
+
+    :return: (tasks, global config)
+    """
+    data, shm = open_shared_arrays(descriptor)
+    tasks = {}
+    try:
+        tasks, global_config = extract_data_tasks_from_arrays(
+            data,
+            default_file_desc,
+            whitelist=whitelist,
+            data_types=data_types,
+        )
+        yield tasks, global_config
+    finally:
+        for _task_f, task_kwargs in tasks.values():
+            task_kwargs.clear()
+        del data
+        try:
+            shm.close()
+        except BufferError:
+            logger.warning(
+                "Shared arrays of '{}' are still referenced, the segment is "
+                "closed when they are released.".format(descriptor["segment"])
+            )
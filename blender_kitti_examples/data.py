@@ -5,6 +5,8 @@ import pathlib
 import numpy as np
 from ruamel.yaml import YAML
 
+from blender_kitti.profiling import stage
+
 
 def unpack(compressed: np.ndarray):
     assert compressed.ndim == 1
@@ -68,15 +70,19 @@ def get_semantic_kitti_voxels():
         / "data"
         / "voxel_label_kitti_odometry_08_001000"
     )
-    data = read_semantic_kitti_voxel_label(semantic_kitti_sample)
-    voxel_label = np.vectorize(mapping.get, otypes=[np.int16])(data["label"])
+    with stage("file_load"):
+        data = read_semantic_kitti_voxel_label(semantic_kitti_sample)
 
-    semantic_colors = np.asarray(
-        [list(color_bgr[k]) for k in learning_map.keys()], np.uint8
-    )
-    # BGR -> RGB
-    semantic_colors = semantic_colors[..., ::-1]
-    color_grid = semantic_colors[voxel_label]
+    with stage("label_mapping") as s:
+        s.count("voxels", data["label"].size)
+        voxel_label = np.vectorize(mapping.get, otypes=[np.int16])(data["label"])
+
+        semantic_colors = np.asarray(
+            [list(color_bgr[k]) for k in learning_map.keys()], np.uint8
+        )
+        # BGR -> RGB
+        semantic_colors = semantic_colors[..., ::-1]
+        color_grid = semantic_colors[voxel_label]
     return data["label"] != 0, color_grid
 
 
@@ -99,29 +105,32 @@ def get_semantic_kitti_point_cloud():
         raise FileNotFoundError("Cannot find semantic kitti label file.")
 
     config_data = get_semantic_kitti_config()
-    point_cloud = np.fromfile(str(file_point_cloud), dtype=np.float32).reshape(
-        (
-            -1,
-            4,
+    with stage("file_load"):
+        point_cloud = np.fromfile(str(file_point_cloud), dtype=np.float32).reshape(
+            (
+                -1,
+                4,
+            )
         )
-    )
-    label = np.fromfile(str(file_semantic_label), dtype=np.uint32).reshape((-1,))
+        label = np.fromfile(str(file_semantic_label), dtype=np.uint32).reshape((-1,))
     label_sem = label & 0xFFFF  # semantic label in lower half
     label_inst = label >> 16  # instance id in upper half
     # sanity check
     assert (label_sem + (label_inst << 16) == label).all()
 
-    color_bgr = dict(config_data["color_map"])
-    learning_map = dict(config_data["learning_map"])
-    mapping = {k: v for k, v in zip(learning_map.keys(), range(len(learning_map)))}
-    semantic_colors = np.asarray(
-        [list(color_bgr[k]) for k in learning_map.keys()], np.uint8
-    )
-    # BGR -> RGB
-    semantic_colors = semantic_colors[..., ::-1]
+    with stage("label_mapping") as s:
+        s.count("points", label_sem.size)
+        color_bgr = dict(config_data["color_map"])
+        learning_map = dict(config_data["learning_map"])
+        mapping = {k: v for k, v in zip(learning_map.keys(), range(len(learning_map)))}
+        semantic_colors = np.asarray(
+            [list(color_bgr[k]) for k in learning_map.keys()], np.uint8
+        )
+        # BGR -> RGB
+        semantic_colors = semantic_colors[..., ::-1]
 
-    label = np.vectorize(mapping.get, otypes=[np.int16])(label_sem)
-    colors = semantic_colors[label]
+        label = np.vectorize(mapping.get, otypes=[np.int16])(label_sem)
+        colors = semantic_colors[label]
     return point_cloud[:, :3], colors
 
 
@@ -4,6 +4,7 @@
 import pathlib
 import numpy as np
 from blender_kitti.bpy_helper import needs_bpy_bmesh
+from blender_kitti.profiling import enable_profiling, stage, write_profile
 from blender_kitti import (
     add_boxes,
     add_point_cloud,
@@ -22,7 +23,6 @@ from .data import (
     get_pseudo_flow,
 )
 import bpy
-import mathutils
 
 
 def dry_render(_scene, cameras, output_path):
@@ -42,7 +42,8 @@ def dry_render(_scene, cameras, output_path):
 
 @needs_bpy_bmesh(alternative_func=dry_render)
 def render(scene, cameras, output_path, *, bpy, gpu_compute):
-    if gpu_compute:
+    # only cycles has compute devices (the preview profile renders with EEVEE)
+    if gpu_compute and scene.render.engine == "CYCLES":
         preferences = bpy.context.preferences
         cycles_preferences = preferences.addons["cycles"].preferences
         cycles_preferences.refresh_devices()
@@ -61,6 +62,8 @@ def render(scene, cameras, output_path, *, bpy, gpu_compute):
             some_dict["use"] = 1  # Using all devices, include GPU and CPU
             print(some_dict["name"], some_dict["use"])
 
+    # keep the synchronized scene (and the BVH) between the cameras
+    scene.render.use_persistent_data = True
     for cam in cameras:
         if isinstance(output_path, str):
             p = output_path.format(cam.data.name)
@@ -75,11 +78,20 @@ def render(scene, cameras, output_path, *, bpy, gpu_compute):
 
         scene.camera = cam
         scene.render.filepath = p
-        bpy.ops.render.render(write_still=True, scene=scene.name)
-
-
-def render_kitti_point_cloud(gpu_compute=False):
-    scene = setup_scene()
+        with stage("render", camera=cam.data.name):
+            bpy.ops.render.render(write_still=True, scene=scene.name)
+    write_profile()
+
+
+def render_kitti_point_cloud(
+    gpu_compute=False, profile: str = None, render_profile: str = "final"
+):
+    """:param profile: write per stage timings as JSON to this path
+    :param render_profile: 'final' (cycles) or 'preview' (EEVEE)
+    """
+    if profile is not None:
+        enable_profiling(profile)
+    scene = setup_scene(render_profile=render_profile)
     cameras = add_cameras_default(scene)
 
     scene.view_layers["ViewLayer"].cycles.use_denoising = True
@@ -90,7 +102,8 @@ def render_kitti_point_cloud(gpu_compute=False):
     scene.render.film_transparent = True
 
     point_cloud, colors = get_semantic_kitti_point_cloud()
-    _ = add_point_cloud(points=point_cloud, colors=colors, scene=scene)
+    with stage("build"):
+        _ = add_point_cloud(points=point_cloud, colors=colors, scene=scene)
     render(
         scene,
         cameras,
@@ -100,8 +113,15 @@ def render_kitti_point_cloud(gpu_compute=False):
     )
 
 
-def render_kitti_scene_flow(gpu_compute=False):
-    scene = setup_scene()
+def render_kitti_scene_flow(
+    gpu_compute=False, profile: str = None, render_profile: str = "final"
+):
+    """:param profile: write per stage timings as JSON to this path
+    :param render_profile: 'final' (cycles) or 'preview' (EEVEE)
+    """
+    if profile is not None:
+        enable_profiling(profile)
+    scene = setup_scene(render_profile=render_profile)
     cameras = add_cameras_default(scene)
 
     scene.view_layers["ViewLayer"].cycles.use_denoising = True
@@ -122,13 +142,13 @@ def render_kitti_scene_flow(gpu_compute=False):
     point_cloud_downsample = point_cloud[indices, ...]
 
     flow, colors = get_pseudo_flow(point_cloud_downsample)
-    _ = add_flow_mesh(
-        point_cloud=point_cloud_downsample,
-        flow=flow,
-        colors_rgba=colors,
-        scene=scene,
-        mathutils=mathutils,
-    )
+    with stage("build"):
+        _ = add_flow_mesh(
+            point_cloud=point_cloud_downsample,
+            flow=flow,
+            colors_rgba=colors,
+            scene=scene,
+        )
     render(
         scene,
         cameras,
@@ -138,8 +158,15 @@ def render_kitti_scene_flow(gpu_compute=False):
     )
 
 
-def render_kitti_bounding_boxes(gpu_compute=True):
-    scene = setup_scene()
+def render_kitti_bounding_boxes(
+    gpu_compute=True, profile: str = None, render_profile: str = "final"
+):
+    """:param profile: write per stage timings as JSON to this path
+    :param render_profile: 'final' (cycles) or 'preview' (EEVEE)
+    """
+    if profile is not None:
+        enable_profiling(profile)
+    scene = setup_scene(render_profile=render_profile)
     cameras = add_cameras_default(scene)
     scene.view_layers["ViewLayer"].cycles.use_denoising = True
     scene.render.resolution_percentage = 100
@@ -149,7 +176,8 @@ def render_kitti_bounding_boxes(gpu_compute=True):
     scene.render.film_transparent = True
 
     point_cloud, colors = get_semantic_kitti_point_cloud()
-    _ = add_point_cloud(points=point_cloud, colors=colors, scene=scene)
+    with stage("build"):
+        _ = add_point_cloud(points=point_cloud, colors=colors, scene=scene)
 
     box_range_max = point_cloud.max(axis=0) / 2
     box_range_min = point_cloud.min(axis=0) / 2
@@ -177,6 +205,7 @@ def render_kitti_bounding_boxes(gpu_compute=True):
         boxes=boxes_pred,
         box_colors_rgba_f64=pred_box_colors,
         confidence_threshold=0.3,
+        name_prefix="boxes_pred",
         verbose=True,
     )
 
@@ -239,6 +268,7 @@ def render_kitti_bounding_boxes(gpu_compute=True):
         boxes=boxes_gt,
         box_colors_rgba_f64=gt_box_colors,
         confidence_threshold=0.3,
+        name_prefix="boxes_gt",
         verbose=True,
     )
 
@@ -251,8 +281,15 @@ def render_kitti_bounding_boxes(gpu_compute=True):
     )
 
 
-def render_kitti_voxels(gpu_compute=False):
-    scene = setup_scene()
+def render_kitti_voxels(
+    gpu_compute=False, profile: str = None, render_profile: str = "final"
+):
+    """:param profile: write per stage timings as JSON to this path
+    :param render_profile: 'final' (cycles) or 'preview' (EEVEE)
+    """
+    if profile is not None:
+        enable_profiling(profile)
+    scene = setup_scene(render_profile=render_profile)
     cam_main = create_camera_perspective(
         location=(2.86, 17.52, 3.74),
         rotation_quat=(0.749, 0.620, -0.150, -0.181),
@@ -273,7 +310,8 @@ def render_kitti_voxels(gpu_compute=False):
     scene.render.film_transparent = True
 
     voxels, colors = get_semantic_kitti_voxels()
-    _ = add_voxels(voxels=voxels, colors=colors, scene=scene)
+    with stage("build"):
+        _ = add_voxels(voxels=voxels, colors=colors, scene=scene)
     render(
         scene,
         [cam_top, cam_main],
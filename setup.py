@@ -12,5 +12,15 @@ setup(
     zip_safe=False,
     install_requires=["ruamel.yaml", "matplotlib", "click", "numpy", "decorator",],
     python_requires=">=3.5",
-    entry_points={"console_scripts": ["blender_kitti_render=blender_kitti.cli:render"]},
+    entry_points={
+        "console_scripts": [
+            "blender_kitti_render=blender_kitti.cli:render",
+            "blender_kitti_render_batch=blender_kitti.cli:render_batch",
+            "blender_kitti_render_farm=blender_kitti.cli:render_farm",
+            "blender_kitti_serve=blender_kitti.cli:serve",
+            "blender_kitti_contact_sheet=blender_kitti.cli:render_contact_sheet",
+            "blender_kitti_benchmark=blender_kitti.cli:run_benchmark",
+            "blender_kitti_inspect=blender_kitti.data_inspect:inspect",
+        ]
+    },
 )
@@ -0,0 +1,32 @@
+"""Test case base that runs blender_kitti with the recording bpy stand-in."""
+
+import unittest
+
+from blender_kitti import recording_bpy
+from blender_kitti.blender_kitti import _content_cache
+from blender_kitti.datablocks import registry
+from blender_kitti.material_shader import clear_material_cache
+
+
+class StandInTestCase(unittest.TestCase):
+    """Installs a fresh stand-in (see recording_bpy) for every test. Skipped when
+    the real bpy is available.
+    """
+
+    def setUp(self):
+        try:
+            self.recorder = recording_bpy.install()
+        except RuntimeError:
+            self.skipTest("bpy is available, the stand-in is not used.")
+        import bpy
+
+        # module level state refers to the datablocks of the previous stand-in
+        _content_cache.clear()
+        clear_material_cache()
+        registry.scopes.clear()
+
+        self.bpy = bpy
+        self.scene = bpy.data.scenes.new("test_scene")
+
+    def tearDown(self):
+        recording_bpy.uninstall()
@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+
+from blender_kitti.box_geometry import (
+    BOX_EDGES,
+    box_corners,
+    box_rotation_matrices,
+    box_wireframe_edges,
+    box_wireframe_tubes,
+    num_tube_triangles_per_box,
+)
+
+
+class TestBoxRotations(unittest.TestCase):
+    def test_formats_agree(self):
+        yaw = np.asarray([0.0, 0.3, -2.0])
+        expected = box_rotation_matrices(yaw, 3)
+        euler = np.stack([np.zeros(3), np.zeros(3), yaw], axis=1)
+        quat = np.stack(
+            [np.cos(yaw / 2), np.zeros(3), np.zeros(3), np.sin(yaw / 2)], axis=1
+        )
+        np.testing.assert_allclose(box_rotation_matrices(yaw[:, None], 3), expected)
+        np.testing.assert_allclose(box_rotation_matrices(euler, 3), expected)
+        np.testing.assert_allclose(
+            box_rotation_matrices(2.0 * quat, 3), expected, atol=1e-12
+        )
+        np.testing.assert_allclose(box_rotation_matrices(expected, 3), expected)
+
+    def test_euler_order(self):
+        # rotation about x first, then about z
+        r = box_rotation_matrices([[np.pi / 2, 0.0, np.pi / 2]], 1)[0]
+        np.testing.assert_allclose(r @ [0.0, 1.0, 0.0], [0.0, 0.0, 1.0], atol=1e-12)
+        np.testing.assert_allclose(r @ [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], atol=1e-12)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            box_rotation_matrices(np.zeros((2,)), 3)
+        with self.assertRaises(ValueError):
+            box_rotation_matrices(np.zeros((2, 5)), 2)
+        with self.assertRaises(ValueError):
+            box_rotation_matrices(np.zeros((1, 4)), 1)
+
+
+class TestBoxGeometry(unittest.TestCase):
+    def setUp(self):
+        self.positions = np.asarray([[1.0, 2.0, 3.0], [-5.0, 0.0, 0.5]])
+        self.dims = np.asarray([[2.0, 4.0, 6.0], [1.0, 1.0, 1.0]])
+        self.yaw = np.asarray([0.0, 0.7])
+
+    def test_corners(self):
+        corners = box_corners(self.positions, self.dims, self.yaw)
+        self.assertEqual(corners.shape, (2, 8, 3))
+        np.testing.assert_allclose(corners[0].min(axis=0), [0.0, 0.0, 0.0])
+        np.testing.assert_allclose(corners[0].max(axis=0), [2.0, 4.0, 6.0])
+        np.testing.assert_allclose(corners.mean(axis=1), self.positions)
+
+    def test_edges(self):
+        vertices, edges = box_wireframe_edges(self.positions, self.dims, self.yaw)
+        self.assertEqual(vertices.shape, (16, 3))
+        self.assertEqual(vertices.dtype, np.float32)
+        np.testing.assert_array_equal(edges[12:], BOX_EDGES + 8)
+        lengths = np.linalg.norm(vertices[edges[:, 0]] - vertices[edges[:, 1]], axis=1)
+        np.testing.assert_allclose(
+            np.sort(lengths[:12]), np.repeat([2.0, 4.0, 6.0], 4), rtol=1e-6
+        )
+
+    def test_tubes(self):
+        thickness = 0.2
+        vertices, triangles = box_wireframe_tubes(
+            self.positions, self.dims, self.yaw, thickness
+        )
+        self.assertEqual(vertices.shape, (2 * 12 * 8, 3))
+        self.assertEqual(triangles.shape, (2 * num_tube_triangles_per_box(), 3))
+        self.assertEqual(triangles.max(), vertices.shape[0] - 1)
+        # the beams of an axis aligned box fill its outline plus half the thickness
+        first = vertices[: 12 * 8]
+        np.testing.assert_allclose(
+            first.min(axis=0), [-0.1, -0.1, -0.1], rtol=1e-6, atol=1e-6
+        )
+        np.testing.assert_allclose(first.max(axis=0), [2.1, 4.1, 6.1], rtol=1e-6)
+
+    def test_tube_normals_point_outwards(self):
+        vertices, triangles = box_wireframe_tubes(
+            np.zeros((1, 3)), np.ones((1, 3)), np.zeros((1,)), 0.1
+        )
+        vertices = vertices.astype(np.float64)
+        a, b, c = (vertices[triangles[:, i]] for i in range(3))
+        normals = np.cross(b - a, c - a)
+        beam_centers = vertices.reshape((12, 8, 3)).mean(axis=1)
+        centers = (a + b + c) / 3.0 - np.repeat(beam_centers, 12, axis=0)
+        self.assertTrue(np.all(np.sum(normals * centers, axis=1) > 0.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from blender_kitti.particles import add_boxes
+from blender_kitti.render_arrays import linear_to_srgb8
+
+from stand_in import StandInTestCase
+
+
+class TestAddBoxes(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.boxes = {
+            "pos": np.asarray([[0.0, 0.0, 0.0], [5.0, 0.0, 0.0]]),
+            "dims": np.ones((2, 3)),
+            "rot": np.zeros((2, 1)),
+            "probs": np.asarray([0.9, 0.1]),
+        }
+        self.colors = np.asarray([[0.2, 0.5, 1.0, 1.0], [1.0, 0.0, 0.0, 1.0]])
+
+    def _add(self, **kwargs):
+        return add_boxes(
+            scene=self.scene,
+            boxes=self.boxes,
+            box_colors_rgba_f64=self.colors,
+            **kwargs
+        )
+
+    def test_unique_names(self):
+        first = self._add()
+        second = self._add()
+        self.assertEqual(first.name, "boxes_obj")
+        self.assertEqual(second.name, "boxes_001_obj")
+        self.assertEqual(second.data.name, "boxes_001_mesh")
+        self.assertEqual(self._add(name_prefix="boxes_gt").name, "boxes_gt_obj")
+
+    def test_confidence_threshold(self):
+        self.assertIsNone(self._add(confidence_threshold=0.95))
+        obj = self._add(confidence_threshold=0.5)
+        self.assertEqual(len(obj.data.vertices), 12 * 8)
+
+    def test_colors_are_srgb(self):
+        obj = self._add()
+        values = obj.data.attributes["fcolor_box"].data._values["color_srgb"]
+        np.testing.assert_allclose(
+            values.reshape((-1, 4))[0],
+            linear_to_srgb8(self.colors[0]) / 255.0,
+            rtol=1e-6,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from blender_kitti.contact_sheet import cell_offset, grid_shape
+
+
+class TestGrid(unittest.TestCase):
+    def test_grid_shape(self):
+        self.assertEqual(grid_shape(1), (1, 1))
+        self.assertEqual(grid_shape(4), (2, 2))
+        self.assertEqual(grid_shape(5), (2, 3))
+        self.assertEqual(grid_shape(10), (3, 4))
+        self.assertEqual(grid_shape(10, columns=5), (2, 5))
+        self.assertEqual(grid_shape(3, columns=8), (1, 8))
+        for num_cells in range(1, 50):
+            rows, columns = grid_shape(num_cells)
+            self.assertGreaterEqual(rows * columns, num_cells)
+            self.assertLess((rows - 1) * columns, num_cells)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            grid_shape(0)
+        with self.assertRaises(ValueError):
+            grid_shape(3, columns=0)
+
+    def test_cell_offset(self):
+        self.assertEqual(cell_offset(0, 0, (2.0, 3.0)), (0.0, 0.0))
+        # columns go to the right, rows down in the image
+        self.assertEqual(cell_offset(1, 2, (2.0, 3.0)), (4.0, -3.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+from click.testing import CliRunner
+
+from blender_kitti.data_inspect import (
+    estimate_scene_bytes,
+    format_report,
+    inspect,
+    inspect_file,
+    parse_data_keys,
+)
+
+
+class TestDataInspect(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filepath = pathlib.Path(self.directory.name) / "data.npz"
+        voxels = np.zeros((4, 4, 4), dtype=bool)
+        voxels[0, 1, 2] = voxels[3, 3, 3] = True
+        np.savez(
+            str(self.filepath),
+            **{
+                "point_cloud+lidar+points": np.zeros((100, 3), np.float32),
+                "point_cloud+lidar+colors": np.zeros((100, 3), np.uint8),
+                "voxels+grid+voxels": voxels,
+                "mesh+car+vertices": np.zeros((8, 3), np.float32),
+                "mesh+car+triangles": np.zeros((12, 3), np.int32),
+                "mesh+car+vertex_colors/semantics": np.zeros((8, 3), np.uint8),
+                "flow+scene+point_cloud": np.zeros((5, 3), np.float32),
+                "flow+scene+flow": np.zeros((5, 3), np.float32),
+                "lines+rays+points": np.zeros((2, 3)),
+                "mesh+broken+vertices": np.zeros((8, 3), np.float32),
+                "not_a_task": np.zeros((1,)),
+                "config": np.frombuffer(b'{"gpu": false}', dtype=np.uint8),
+            }
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_parse_data_keys(self):
+        tasks, unknown = parse_data_keys(
+            ["mesh+a+vertices", "mesh+a+vertex_colors/x", "bad", "config"]
+        )
+        self.assertEqual(
+            dict(tasks),
+            {
+                ("mesh", "a"): {
+                    "vertices": "mesh+a+vertices",
+                    "vertex_colors": {"x": "mesh+a+vertex_colors/x"},
+                }
+            },
+        )
+        self.assertEqual(unknown, ["bad"])
+
+    def test_inspect_file(self):
+        report = inspect_file(self.filepath)
+        tasks = {(t["type"], t["instance"]): t for t in report["tasks"]}
+        self.assertEqual(report["unknown_keys"], ["not_a_task"])
+        self.assertEqual(report["config"], '{"gpu": false}')
+
+        lidar = tasks["point_cloud", "lidar"]
+        self.assertEqual(lidar["elements"]["instances"], 100)
+        self.assertEqual(lidar["elements"]["vertices"], 300)
+        self.assertEqual(lidar["payload_bytes"], 100 * 12 + 100 * 3)
+        self.assertTrue(lidar["arrays"]["points"]["memory_mapped"])
+        self.assertEqual(tasks["voxels", "grid"]["elements"]["instances"], 2)
+
+        car = tasks["mesh", "car"]
+        self.assertEqual(car["elements"]["loops"], 36)
+        self.assertEqual(car["elements"]["attribute_bytes"], 4 * 8)
+        self.assertIn("vertex_colors/semantics", car["arrays"])
+        self.assertEqual(
+            car["estimated_scene_bytes"], estimate_scene_bytes(car["elements"])
+        )
+
+        self.assertEqual(tasks["flow", "scene"]["elements"]["instances"], 5)
+        self.assertEqual(tasks["lines", "rays"]["error"], "unknown data type")
+        self.assertIn("missing", tasks["mesh", "broken"]["error"])
+        self.assertEqual(
+            report["estimated_scene_bytes"],
+            sum(t.get("estimated_scene_bytes", 0) for t in report["tasks"]),
+        )
+
+        text = format_report(report)
+        self.assertIn("point_cloud+lidar: 100 instances", text)
+        self.assertIn("unknown key 'not_a_task'", text)
+
+    def test_estimate_scene_bytes(self):
+        self.assertEqual(estimate_scene_bytes({}), 0)
+        elements = {"vertices": 3, "loops": 4, "polygons": 1, "attribute_bytes": 10}
+        estimate = estimate_scene_bytes(elements)
+        self.assertGreater(estimate, 10)
+        self.assertEqual(
+            estimate_scene_bytes({k: 2 * v for k, v in elements.items()}),
+            2 * estimate,
+        )
+
+    def test_command(self):
+        result = CliRunner().invoke(inspect, ["--json", str(self.filepath)])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("tasks", json.loads(result.output)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+
+from blender_kitti.datablocks import (
+    datablock_scope,
+    free_datablocks,
+    is_removed,
+    registry,
+    remove_all_datablocks,
+)
+from blender_kitti.scene_setup import clear_all
+
+from stand_in import StandInTestCase
+
+
+class TestDatablockScopes(StandInTestCase):
+    def _add_object(self, name: str):
+        mesh = self.bpy.data.meshes.new(name + "_mesh")
+        return self.bpy.data.objects.new(name, mesh)
+
+    def test_record_and_free(self):
+        before = self._add_object("before")
+        with datablock_scope("file") as scope:
+            obj = self._add_object("obj")
+            mesh = obj.data
+            material = self.bpy.data.materials.new("material")
+        self.assertTrue(scope.closed)
+        self.assertEqual(len(scope.datablocks), 3)
+        self.assertEqual(registry.scopes, [scope])
+
+        self.assertEqual(free_datablocks(scope), 3)
+        self.assertTrue(is_removed(obj))
+        self.assertTrue(is_removed(mesh))
+        self.assertTrue(is_removed(material))
+        self.assertFalse(is_removed(before))
+        self.assertEqual(registry.scopes, [])
+
+    def test_nested(self):
+        with datablock_scope("outer") as outer:
+            with datablock_scope("task") as inner:
+                obj = self._add_object("inner")
+            other = self._add_object("outer")
+        self.assertEqual(outer.children, [inner])
+        self.assertIs(inner.parent, outer)
+        self.assertEqual(len(inner.datablocks), 2)
+        # the outer scope also records the datablocks of the inner one
+        self.assertEqual(len(outer.datablocks), 4)
+        self.assertEqual(registry.find("task"), [inner])
+
+        self.assertEqual(free_datablocks("task"), 2)
+        self.assertTrue(is_removed(obj))
+        self.assertEqual(outer.children, [])
+        self.assertEqual(len(outer.alive()), 2)
+        # removed datablocks are skipped
+        self.assertEqual(free_datablocks(outer), 2)
+        self.assertTrue(is_removed(other))
+
+    def test_nested_only(self):
+        with datablock_scope("task", nested_only=True) as scope:
+            self._add_object("obj")
+        self.assertIsNone(scope)
+        self.assertEqual(registry.scopes, [])
+
+        with datablock_scope("outer") as outer:
+            with datablock_scope("task", nested_only=True) as inner:
+                self._add_object("inner")
+        self.assertEqual(outer.children, [inner])
+        self.assertEqual(len(inner.datablocks), 2)
+
+    def test_keep_and_free_on_exit(self):
+        with datablock_scope("file", free=True, keep=lambda x: x.name == "kept"):
+            kept = self.bpy.data.materials.new("kept")
+            removed = self.bpy.data.materials.new("removed")
+        self.assertFalse(is_removed(kept))
+        self.assertTrue(is_removed(removed))
+        self.assertEqual(registry.scopes, [])
+
+    def test_open_scope(self):
+        with datablock_scope("outer"):
+            with datablock_scope("inner"):
+                pass
+            outer = registry._open[-1]
+            with self.assertRaises(RuntimeError):
+                free_datablocks(outer)
+
+    def test_context_scene_is_kept(self):
+        with datablock_scope("scenes") as scope:
+            scene = self.bpy.data.scenes.new("scene")
+            self.bpy.context.scene = scene
+        self.assertEqual(free_datablocks(scope), 0)
+        self.assertFalse(is_removed(scene))
+
+    def test_remove_all(self):
+        with datablock_scope("file"):
+            self._add_object("obj")
+        self.assertEqual(remove_all_datablocks(), 2)
+        self.assertEqual(len(self.bpy.data.objects), 0)
+        self.assertIn("test_scene", self.bpy.data.scenes)
+        self.assertEqual(registry.scopes, [])
+
+    def test_clear_all_keeps_data(self):
+        with datablock_scope("file") as scope:
+            obj = self._add_object("obj")
+            mesh = obj.data
+            collection = self.bpy.data.collections.new("collection")
+        clear_all()
+        self.assertTrue(is_removed(obj))
+        self.assertTrue(is_removed(collection))
+        self.assertFalse(is_removed(mesh))
+        self.assertEqual(registry.scopes, [scope])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+from blender_kitti.blender_kitti import add_objects_from_data
+from blender_kitti.datablocks import datablock_scope, free_datablocks
+from blender_kitti.particles import add_point_cloud
+
+from stand_in import StandInTestCase
+
+
+def _point_cloud_task(points: np.ndarray, name_prefix: str):
+    return {
+        name_prefix: (add_point_cloud, {"points": points, "name_prefix": name_prefix})
+    }
+
+
+class TestDeduplication(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        rng = np.random.RandomState(0)
+        self.points_a = rng.rand(50, 3).astype(np.float32)
+        self.points_b = rng.rand(70, 3).astype(np.float32)
+
+    def _add(self, points, name_prefix):
+        results = add_objects_from_data(
+            _point_cloud_task(points, name_prefix), self.scene
+        )
+        # instancer object and color selectors
+        return results[name_prefix][0]
+
+    def test_identical_data_is_linked(self):
+        first = self._add(self.points_a, "first")
+        second = self._add(self.points_a, "second")
+        self.assertIsNot(first, second)
+        self.assertIs(second.data, first.data)
+        self.assertEqual(second.name, "second_obj_linked")
+
+    def test_different_data_is_not_linked(self):
+        first = self._add(self.points_a, "first")
+        second = self._add(self.points_b, "second")
+        self.assertIsNot(second.data, first.data)
+
+    def test_removed_object_is_not_reused_by_name(self):
+        with datablock_scope("a") as scope:
+            self._add(self.points_a, "pc")
+        free_datablocks(scope)
+        # takes the name of the removed object
+        b = self._add(self.points_b, "pc")
+        self.assertEqual(b.name, "pc_obj_instancer")
+
+        again = self._add(self.points_a, "other")
+        self.assertIsNot(again.data, b.data)
+        self.assertEqual(len(again.data.vertices), 3 * 50)
+
+    def test_free_forgets_cached_objects(self):
+        from blender_kitti.blender_kitti import _content_cache
+
+        with datablock_scope("a") as scope:
+            self._add(self.points_a, "pc")
+        self.assertEqual(len(_content_cache), 1)
+        free_datablocks(scope)
+        self.assertEqual(len(_content_cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
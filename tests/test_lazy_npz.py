@@ -0,0 +1,79 @@
+import pathlib
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+
+from blender_kitti.lazy_npz import LazyArray, load_value, open_npz
+
+
+class TestLazyNpz(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+        rng = np.random.RandomState(0)
+        self.arrays = {
+            "points": rng.rand(100, 3).astype(np.float32),
+            "labels": rng.randint(0, 10, (100,)),
+            "fortran": np.asfortranarray(rng.rand(4, 5)),
+            "empty": np.zeros((0, 3), np.float32),
+            "scalar": np.asarray(3.5),
+        }
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _check(self, lazy, memory_mapped):
+        self.assertEqual(set(lazy), set(self.arrays))
+        for key, expected in self.arrays.items():
+            value = lazy[key]
+            self.assertIsInstance(value, LazyArray)
+            self.assertEqual(value.shape, expected.shape)
+            self.assertEqual(value.dtype, expected.dtype)
+            self.assertEqual(value.nbytes, expected.nbytes)
+            self.assertEqual(value.is_memory_mapped, memory_mapped)
+            np.testing.assert_array_equal(value.load(), expected)
+
+    def test_stored(self):
+        filepath = self.path / "data.npz"
+        np.savez(str(filepath), **self.arrays)
+        self._check(open_npz(filepath), memory_mapped=True)
+        self.assertIsInstance(open_npz(filepath)["points"].load(), np.memmap)
+
+    def test_compressed(self):
+        filepath = self.path / "data.npz"
+        np.savez_compressed(str(filepath), **self.arrays)
+        self._check(open_npz(filepath), memory_mapped=False)
+
+    def test_header_versions(self):
+        filepath = self.path / "versions.npz"
+        arrays = {
+            "v1": np.arange(5),
+            "v2": np.arange(6.0),
+            # utf-8 field names need version 3.0
+            "v3": np.zeros((3,), dtype=[("ä", "f4"), ("b", "i2")]),
+        }
+        with zipfile.ZipFile(str(filepath), "w") as zf:
+            for (key, array), version in zip(arrays.items(), [1, 2, 3]):
+                with zf.open(key + ".npy", "w") as f:
+                    np.lib.format.write_array(f, array, version=(version, 0))
+        lazy = open_npz(filepath)
+        for key, array in arrays.items():
+            self.assertEqual(lazy[key].shape, array.shape)
+            self.assertEqual(lazy[key].dtype, array.dtype)
+            np.testing.assert_array_equal(lazy[key].load(), array)
+        self.assertTrue(lazy["v2"].is_memory_mapped)
+        self.assertFalse(lazy["v3"].is_memory_mapped)
+
+    def test_load_value(self):
+        filepath = self.path / "data.npz"
+        np.savez(str(filepath), **self.arrays)
+        lazy = open_npz(filepath)
+        loaded = load_value({"nested": {"points": lazy["points"]}, "name": "x"})
+        np.testing.assert_array_equal(loaded["nested"]["points"], self.arrays["points"])
+        self.assertEqual(loaded["name"], "x")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from blender_kitti import recording_bpy
+from blender_kitti.mesh import add_object_from_mesh_file, create_mesh, srgb_to_linear
+from blender_kitti.render_arrays import linear_to_srgb8
+
+from stand_in import StandInTestCase
+
+
+class TestSrgbToLinear(unittest.TestCase):
+    def test_round_trip(self):
+        values = np.arange(256, dtype=np.uint8)
+        srgb = np.stack([values] * 4, axis=-1).astype(np.float32) / 255.0
+        linear = srgb_to_linear(srgb)
+        self.assertEqual(linear.dtype, np.float32)
+        # alpha stays linear
+        np.testing.assert_array_equal(linear[:, 3], srgb[:, 3])
+        np.testing.assert_array_equal(
+            linear_to_srgb8(linear), np.stack([values] * 4, -1)
+        )
+
+
+def _without_color_srgb(foreach_set):
+    """foreach_set of blender < 3.4, which has no 'color_srgb' property."""
+
+    def patched(self, attr, seq):
+        if attr == "color_srgb":
+            raise TypeError("foreach_set(attr, sequence) 'color_srgb' not found")
+        return foreach_set(self, attr, seq)
+
+    return patched
+
+
+class TestByteColorFallback(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.colors = np.asarray(
+            [[0, 128, 255], [10, 20, 30], [255, 255, 255]], np.uint8
+        )
+        self.expected = srgb_to_linear(
+            np.concatenate((self.colors / 255.0, np.ones((3, 1))), axis=-1)
+        )
+
+    def _color_values(self, mesh, attr_key):
+        values = mesh.attributes[attr_key].data._values
+        self.assertNotIn("color_srgb", values)
+        return values["color"].reshape((-1, 4))
+
+    def test_create_mesh(self):
+        with mock.patch.object(
+            recording_bpy._PropCollection,
+            "foreach_set",
+            _without_color_srgb(recording_bpy._PropCollection.foreach_set),
+        ):
+            mesh, attr_keys, _ = create_mesh(
+                np.zeros((3, 3)),
+                np.asarray([[0, 1, 2]]),
+                vertex_colors={"rgb": self.colors},
+                name="mesh",
+            )
+        np.testing.assert_allclose(
+            self._color_values(mesh, "vcolor_rgb"), self.expected, rtol=1e-6
+        )
+
+    def test_streaming(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory)
+            np.save(str(path / "vertices.npy"), np.zeros((3, 3), np.float32))
+            np.save(str(path / "triangles.npy"), np.asarray([[0, 1, 2]], np.int32))
+            np.save(str(path / "vertex_colors.npy"), self.colors)
+            with mock.patch.object(
+                recording_bpy._PropCollection,
+                "foreach_set",
+                _without_color_srgb(recording_bpy._PropCollection.foreach_set),
+            ):
+                obj, _ = add_object_from_mesh_file(
+                    directory, scene=self.scene, name_prefix="file", chunk_size=2
+                )
+        np.testing.assert_allclose(
+            self._color_values(obj.data, "vcolor_file"), self.expected, rtol=1e-6
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
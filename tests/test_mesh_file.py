@@ -0,0 +1,74 @@
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from blender_kitti.mesh import add_object_from_mesh_file
+
+from stand_in import StandInTestCase
+
+
+class TestMeshFile(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        path = pathlib.Path(self.directory.name)
+        self.vertices = np.random.RandomState(0).rand(10, 3).astype(np.float32)
+        self.triangles = np.asarray([[0, 1, 2], [2, 3, 4], [7, 8, 9]], np.int32)
+        np.save(str(path / "vertices.npy"), self.vertices)
+        np.save(str(path / "triangles.npy"), self.triangles)
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def _add(self, **kwargs):
+        return add_object_from_mesh_file(
+            self.directory.name, scene=self.scene, name_prefix="file", **kwargs
+        )
+
+    def test_npy_directory(self):
+        obj, _ = self._add()
+        mesh = obj.data
+        co = np.empty((len(mesh.vertices) * 3,), dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        np.testing.assert_array_equal(co.reshape((-1, 3)), self.vertices)
+        vertex_index = np.empty((len(mesh.loops),), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", vertex_index)
+        np.testing.assert_array_equal(vertex_index, self.triangles.reshape((-1)))
+        self.assertIn(obj, self.scene.collection.objects)
+
+    def test_vertex_colors(self):
+        colors = np.arange(30, dtype=np.uint8).reshape((10, 3))
+        np.save(str(pathlib.Path(self.directory.name) / "vertex_colors.npy"), colors)
+        obj, _ = self._add(chunk_size=3)
+        self.assertIn("vcolor_file", obj.data.attributes)
+        values = obj.data.attributes["vcolor_file"].data._values["color_srgb"]
+        expected = np.concatenate((colors / 255.0, np.ones((10, 1))), axis=-1)
+        np.testing.assert_allclose(values.reshape((-1, 4)), expected, rtol=1e-6)
+
+    def test_legacy_vertex_colors(self):
+        colors = np.arange(30, dtype=np.uint8).reshape((10, 3))
+        np.save(str(pathlib.Path(self.directory.name) / "vertex_colors.npy"), colors)
+        with mock.patch("blender_kitti.mesh.has_attribute_api", return_value=False):
+            obj, _ = self._add(chunk_size=2)
+        values = obj.data.vertex_colors["vcolor_file"].data._values["color"]
+        expected = np.concatenate((colors / 255.0, np.ones((10, 1))), axis=-1)
+        np.testing.assert_allclose(
+            values.reshape((-1, 4)), expected[self.triangles.reshape((-1))], rtol=1e-6
+        )
+
+    def test_fast_validation(self):
+        self.triangles[-1, -1] = 10
+        np.save(
+            str(pathlib.Path(self.directory.name) / "triangles.npy"), self.triangles
+        )
+        with self.assertRaises(ValueError):
+            self._add(validate="fast")
+        self.assertEqual(len(self.bpy.data.meshes), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+
+from blender_kitti.mesh_io import load_mesh_mmap, load_mesh_npy, read_ply_mmap
+
+
+def _write_ply(filepath, vertices, triangles, colors=None, byte_order="<"):
+    fields = [("x", "f4"), ("y", "f4"), ("z", "f4")]
+    header = [
+        "ply",
+        "format binary_{}_endian 1.0".format("little" if byte_order == "<" else "big"),
+        "comment written by test_mesh_io",
+        "element vertex {}".format(len(vertices)),
+        "property float x",
+        "property float y",
+        "property float z",
+    ]
+    if colors is not None:
+        fields += [(c, "u1") for c in ("red", "green", "blue")]
+        header += ["property uchar {}".format(c) for c in ("red", "green", "blue")]
+    header += [
+        "element face {}".format(len(triangles)),
+        "property list uchar int vertex_indices",
+        "end_header",
+    ]
+    vertex_data = np.empty(
+        (len(vertices),), dtype=[(n, byte_order + t) for n, t in fields]
+    )
+    for i, name in enumerate("xyz"):
+        vertex_data[name] = vertices[:, i]
+    if colors is not None:
+        for i, name in enumerate(("red", "green", "blue")):
+            vertex_data[name] = colors[:, i]
+    face_data = np.empty(
+        (len(triangles),),
+        dtype=[
+            ("count", "u1"),
+            ("vertex_indices", byte_order + "i4", (3,)),
+        ],
+    )
+    face_data["count"] = 3
+    face_data["vertex_indices"] = triangles
+    with open(str(filepath), "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        f.write(vertex_data.tobytes())
+        f.write(face_data.tobytes())
+
+
+class TestMeshIO(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+        rng = np.random.RandomState(0)
+        self.vertices = rng.rand(6, 3).astype(np.float32)
+        self.triangles = np.asarray([[0, 1, 2], [3, 4, 5], [0, 2, 4]], np.int32)
+        self.colors = rng.randint(0, 256, (6, 3)).astype(np.uint8)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_ply(self):
+        for byte_order in "<>":
+            filepath = self.path / "mesh{}.ply".format(byte_order == "<")
+            _write_ply(filepath, self.vertices, self.triangles, self.colors, byte_order)
+            mesh = read_ply_mmap(filepath)
+            np.testing.assert_array_equal(mesh["vertices"], self.vertices)
+            np.testing.assert_array_equal(mesh["triangles"], self.triangles)
+            np.testing.assert_array_equal(mesh["vertex_colors"], self.colors)
+            del mesh
+
+    def test_ply_without_colors(self):
+        filepath = self.path / "mesh.ply"
+        _write_ply(filepath, self.vertices, self.triangles)
+        mesh = load_mesh_mmap(filepath)
+        self.assertNotIn("vertex_colors", mesh)
+        # consecutive float fields are viewed without a copy
+        self.assertIsInstance(mesh["vertices"].base, np.memmap)
+        np.testing.assert_array_equal(mesh["vertices"], self.vertices)
+
+    def test_ply_quads(self):
+        filepath = self.path / "quads.ply"
+        _write_ply(filepath, self.vertices, self.triangles)
+        data = bytearray(filepath.read_bytes())
+        # the count of the last face
+        data[-13] = 4
+        filepath.write_bytes(bytes(data))
+        with self.assertRaises(NotImplementedError):
+            read_ply_mmap(filepath)
+
+    def test_ply_ascii(self):
+        filepath = self.path / "ascii.ply"
+        filepath.write_text("ply\nformat ascii 1.0\nend_header\n")
+        with self.assertRaises(NotImplementedError):
+            read_ply_mmap(filepath)
+
+    def test_npy_directory(self):
+        np.save(str(self.path / "vertices.npy"), self.vertices)
+        np.save(str(self.path / "triangles.npy"), self.triangles)
+        mesh = load_mesh_mmap(self.path)
+        self.assertEqual(set(mesh), {"vertices", "triangles"})
+        self.assertIsInstance(mesh["vertices"], np.memmap)
+        np.testing.assert_array_equal(mesh["triangles"], self.triangles)
+
+        np.save(str(self.path / "vertex_colors.npy"), self.colors)
+        np.testing.assert_array_equal(
+            load_mesh_npy(self.path)["vertex_colors"], self.colors
+        )
+
+    def test_missing(self):
+        with self.assertRaises(FileNotFoundError):
+            load_mesh_npy(self.path)
+        with self.assertRaises(ValueError):
+            load_mesh_mmap(self.path / "mesh.obj")
+
+
+if __name__ == "__main__":
+    unittest.main()
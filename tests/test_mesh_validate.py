@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+from blender_kitti.mesh import check_mesh_arrays, create_mesh, prepare_mesh_arrays
+
+from stand_in import StandInTestCase
+
+
+def _arrays(triangles, num_vertices=4):
+    prepared = prepare_mesh_arrays(
+        np.zeros((num_vertices, 3), np.float32), np.asarray(triangles, np.int32)
+    )
+    return (
+        prepared["num_vertices"],
+        prepared["vertex_index"],
+        prepared["loop_start"],
+        prepared["loop_total"],
+    )
+
+
+class TestCheckMeshArrays(unittest.TestCase):
+    def test_valid(self):
+        check_mesh_arrays(*_arrays([[0, 1, 2], [1, 2, 3]]))
+        check_mesh_arrays(*_arrays(np.zeros((0, 3))))
+
+    def test_out_of_bounds(self):
+        with self.assertRaises(ValueError):
+            check_mesh_arrays(*_arrays([[0, 1, 4]]))
+        with self.assertRaises(ValueError):
+            check_mesh_arrays(*_arrays([[0, -1, 2]]))
+
+    def test_loops(self):
+        num_vertices, vertex_index, loop_start, loop_total = _arrays(
+            [[0, 1, 2], [1, 2, 3]]
+        )
+        with self.assertRaises(ValueError):
+            check_mesh_arrays(num_vertices, vertex_index, loop_start, loop_total + 1)
+        with self.assertRaises(ValueError):
+            check_mesh_arrays(num_vertices, vertex_index, loop_start[::-1], loop_total)
+        with self.assertRaises(ValueError):
+            check_mesh_arrays(num_vertices, vertex_index, loop_start[:1], loop_total)
+
+
+class TestCreateMesh(StandInTestCase):
+    def test_fast_validation_before_creation(self):
+        vertices = np.zeros((4, 3), np.float32)
+        with self.assertRaises(ValueError):
+            create_mesh(vertices, np.asarray([[0, 1, 4]]), validate="fast", name="bad")
+        self.assertEqual(len(self.bpy.data.meshes), 0)
+
+        mesh, _, _ = create_mesh(
+            vertices, np.asarray([[0, 1, 3]]), validate="fast", name="good"
+        )
+        self.assertEqual(len(mesh.polygons), 1)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            create_mesh(
+                np.zeros((3, 3)), np.asarray([[0, 1, 2]]), validate="x", name="bad"
+            )
+        self.assertEqual(len(self.bpy.data.meshes), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
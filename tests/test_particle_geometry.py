@@ -0,0 +1,191 @@
+import unittest
+
+import numpy as np
+
+from blender_kitti.data_inspect import _ARROW_LOOPS, _ARROW_POLYGONS, _ARROW_VERTICES
+from blender_kitti.mesh import check_mesh_arrays
+from blender_kitti.particles import (
+    _arrow_template,
+    _voxel_coords,
+    _voxel_list_coords,
+    apply_trafo,
+    prepare_flow_mesh,
+    simple_scale_matrix,
+    transform_arrows,
+)
+
+
+def transform_arrows_per_arrow(mesh_verts, point_cloud, flow):
+    """Per arrow loop of add_flow_mesh before it was vectorized."""
+    flow_len = np.linalg.norm(flow, axis=-1)
+    vertices_homog = np.concatenate(
+        [mesh_verts, np.ones((mesh_verts.shape[0], 1))], axis=-1
+    )
+    full_vertices = []
+    for flow_vec_idx in range(flow.shape[0]):
+        arrow_head_unit = np.array([0.0, 0.0, 1.0])
+        scale_mat = simple_scale_matrix(
+            flow_len[flow_vec_idx], np.array([0.0, 0.0, 1.0])
+        )
+        vert_scaled = apply_trafo(np.copy(vertices_homog), scale_mat)
+        flow_vec = flow[flow_vec_idx]
+        flow_vec_unit = flow_vec / np.sqrt(np.sum(flow_vec**2))
+        v = np.cross(arrow_head_unit, flow_vec_unit)
+        cosine = np.dot(arrow_head_unit, flow_vec_unit)
+        vx = np.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
+        R = np.eye(3) + vx + np.dot(vx, vx) * 1.0 / (1.0 + cosine)
+        T_rot = np.eye(4)
+        T_rot[0:3, 0:3] = R
+        vert_rotated = apply_trafo(vert_scaled, T_rot)
+        translation_matrix = np.eye(4)
+        translation_matrix[:3, 3] = point_cloud[flow_vec_idx][:3]
+        vert_translated = apply_trafo(vert_rotated, translation_matrix)
+        full_vertices.append(vert_translated[..., 0:3])
+    return np.concatenate(full_vertices, axis=0)
+
+
+class TestFlowArrows(unittest.TestCase):
+    def test_same_as_per_arrow_transform(self):
+        rng = np.random.RandomState(0)
+        # any template works, the arrow mesh itself comes from _arrow_template
+        mesh_verts = rng.uniform(-0.1, 1.1, size=(42, 3)).astype(np.float32)
+        point_cloud = rng.uniform(-20.0, 20.0, size=(100, 3)).astype(np.float32)
+        flow = rng.normal(size=(100, 3)).astype(np.float32)
+        # axis aligned flow, except exactly opposite to +z
+        flow[:3] = [[0.0, 0.0, 2.0], [1.0, 0.0, 0.0], [0.0, -0.5, 0.0]]
+
+        expected = transform_arrows_per_arrow(mesh_verts, point_cloud, flow)
+        actual = transform_arrows(mesh_verts, point_cloud, flow)
+        self.assertEqual(actual.shape, (100 * 42, 3))
+        np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-5)
+
+    def test_arrow_points_along_flow(self):
+        tip = np.array([[0.0, 0.0, 1.0]], dtype=np.float32)
+        point_cloud = np.array([[1.0, 2.0, 3.0]], dtype=np.float32)
+        flow = np.array([[0.0, 3.0, 4.0]], dtype=np.float32)
+        np.testing.assert_allclose(
+            transform_arrows(tip, point_cloud, flow), [[1.0, 5.0, 7.0]], atol=1e-6
+        )
+
+
+def signed_volume(vertices, vertex_index, loop_start, loop_total):
+    """Volume of a closed mesh, negative if its polygons face inwards."""
+    volume = 0.0
+    for start, total in zip(loop_start, loop_total):
+        polygon = vertices[vertex_index[start : start + total]]
+        for i in range(1, total - 1):
+            volume += np.linalg.det(polygon[[0, i, i + 1]]) / 6.0
+    return volume
+
+
+class TestArrowTemplate(unittest.TestCase):
+    def test_counts_match_data_inspect(self):
+        arrow = _arrow_template()
+        self.assertEqual(arrow["vertices"].shape, (_ARROW_VERTICES, 3))
+        self.assertEqual(arrow["vertex_index"].shape, (_ARROW_LOOPS,))
+        self.assertEqual(arrow["loop_total"].shape, (_ARROW_POLYGONS,))
+        check_mesh_arrays(
+            _ARROW_VERTICES,
+            arrow["vertex_index"],
+            arrow["loop_start"],
+            arrow["loop_total"],
+        )
+
+    def test_closed_and_facing_outwards(self):
+        arrow = _arrow_template(
+            arrow_shaft_diameter=0.1,
+            arrow_shaft_length=1.0,
+            arrow_head_height=0.3,
+            arrow_head_diameter=0.2,
+            segments=64,
+        )
+        np.testing.assert_allclose(
+            [arrow["vertices"][:, 2].min(), arrow["vertices"][:, 2].max()],
+            [0.0, 1.15],
+        )
+        # cylinder and cone, up to the polygon approximation of the circles
+        expected = np.pi * 0.05**2 * 1.0 + np.pi * 0.1**2 * 0.3 / 3.0
+        volume = signed_volume(
+            arrow["vertices"],
+            arrow["vertex_index"],
+            arrow["loop_start"],
+            arrow["loop_total"],
+        )
+        self.assertAlmostEqual(volume / expected, 1.0, delta=0.01)
+
+        # every edge is shared by exactly two polygons, in opposite directions
+        edges = set()
+        for start, total in zip(arrow["loop_start"], arrow["loop_total"]):
+            polygon = arrow["vertex_index"][start : start + total]
+            for a, b in zip(polygon, np.roll(polygon, -1)):
+                self.assertNotIn((a, b), edges)
+                edges.add((a, b))
+        self.assertTrue(all((b, a) in edges for a, b in edges))
+
+
+class TestPrepareFlowMesh(unittest.TestCase):
+    def test_arrow_per_flow_vector(self):
+        rng = np.random.RandomState(0)
+        point_cloud = rng.uniform(-20.0, 20.0, size=(5, 3)).astype(np.float32)
+        flow = rng.normal(size=(5, 3)).astype(np.float32)
+        colors = rng.uniform(size=(5, 4)).astype(np.float32)
+
+        prepared = prepare_flow_mesh(
+            point_cloud=point_cloud,
+            flow=flow,
+            colors_rgba=colors,
+            arrow_head_height=0.3,
+        )["prepared"]
+
+        arrow = _arrow_template(arrow_head_height=0.3)
+        self.assertEqual(prepared["num_vertices"], 5 * _ARROW_VERTICES)
+        np.testing.assert_allclose(
+            prepared["co"].reshape((-1, 3)),
+            transform_arrows(arrow["vertices"], point_cloud, flow),
+            atol=1e-5,
+        )
+        check_mesh_arrays(
+            prepared["num_vertices"],
+            prepared["vertex_index"],
+            prepared["loop_start"],
+            prepared["loop_total"],
+        )
+        # the loops of an arrow use its vertices and color
+        arrow_of_loop = prepared["vertex_index"] // _ARROW_VERTICES
+        np.testing.assert_array_equal(
+            arrow_of_loop, np.repeat(np.arange(5), _ARROW_LOOPS)
+        )
+        np.testing.assert_array_equal(
+            prepared["loop_colors"].reshape((-1, 4)), colors[arrow_of_loop]
+        )
+
+
+class TestVoxelCoords(unittest.TestCase):
+    def test_same_as_mgrid(self):
+        rng = np.random.RandomState(0)
+        voxels = rng.rand(7, 5, 6) > 0.7
+        colors = rng.randint(0, 255, size=(7, 5, 6, 3)).astype(np.uint8)
+
+        grid = np.moveaxis(np.mgrid[[slice(x) for x in voxels.shape]], 0, 3)
+        expected = grid.astype(np.float32) * np.float32(0.2)
+
+        coords, voxel_colors = _voxel_coords(voxels, colors)
+        np.testing.assert_allclose(coords, expected[voxels], rtol=1e-6)
+        np.testing.assert_array_equal(voxel_colors, colors[voxels])
+
+    def test_voxel_list_same_as_mgrid(self):
+        grid_shape = np.array([6, 4, 5])
+        grid_origin = np.array([-1.0, 2.0, 0.5])
+        voxel_size = np.array([0.25])
+        indices = np.array([0, 7, 33, 119, 64])
+
+        grid = np.moveaxis(np.mgrid[[slice(x) for x in grid_shape]], 0, 3)
+        expected = grid.astype(np.float32) * 0.25 + grid_origin
+        expected = expected.reshape([-1, 3])[indices]
+
+        coords = _voxel_list_coords(indices, grid_shape, grid_origin, voxel_size)
+        np.testing.assert_allclose(coords, expected, rtol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from blender_kitti.prepared_cache import PreparedCache, prepared_cache_from_config
+
+
+class TestPreparedCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = PreparedCache(self.directory.name, max_bytes=10000)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        value = {
+            "co": np.arange(12, dtype=np.float32),
+            "pixels": [np.ones((2, 4), np.float32), None],
+            "num_vertices": np.int64(4),
+            "material": {"name": "mat", "alpha": 0.5, "smooth": True},
+        }
+        self.assertIsNone(self.cache.get("key"))
+        self.assertTrue(self.cache.put("key", value))
+        cached = self.cache.get("key")
+        self.assertIsInstance(cached["co"], np.memmap)
+        np.testing.assert_array_equal(cached["co"], value["co"])
+        np.testing.assert_array_equal(cached["pixels"][0], value["pixels"][0])
+        self.assertIsNone(cached["pixels"][1])
+        self.assertEqual(cached["num_vertices"], 4)
+        self.assertEqual(cached["material"], value["material"])
+        self.assertIsInstance(self.cache.get("key", mmap_mode=None)["co"], np.ndarray)
+
+    def test_unsupported(self):
+        with self.assertRaises(TypeError):
+            self.cache.put("key", {"value": object()})
+
+    def test_too_large(self):
+        self.assertFalse(self.cache.put("key", np.zeros((20000,), np.uint8)))
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_incomplete_entry(self):
+        self.cache.put("key", {"a": np.zeros((3,))})
+        os.remove(str(self.cache.directory / "key" / "0.npy"))
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_evict_least_recently_used(self):
+        for i, key in enumerate(["a", "b", "c"]):
+            self.cache.put(key, np.zeros((3000,), np.uint8))
+            os.utime(str(self.cache.directory / key), (i, i))
+        # "a" is used again, so "b" is the least recently used entry
+        self.assertIsNotNone(self.cache.get("a"))
+        self.cache.put("d", np.zeros((3000,), np.uint8))
+        self.assertIsNone(self.cache.get("b"))
+        for key in ("a", "c", "d"):
+            self.assertIsNotNone(self.cache.get(key))
+
+    def test_clear(self):
+        self.cache.put("key", np.zeros((3,)))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_from_config(self):
+        self.assertIsNone(prepared_cache_from_config({}))
+        cache = prepared_cache_from_config(
+            {"prepared_cache_dir": self.directory.name, "prepared_cache_max_mb": 2}
+        )
+        self.assertEqual(cache.max_bytes, 2 * 2**20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import pathlib
+import tempfile
+import types
+import unittest
+
+import numpy as np
+
+from blender_kitti.render_arrays import ImageWriter, linear_to_srgb8, render_arrays
+
+from stand_in import StandInTestCase
+
+
+class TestLinearToSrgb8(unittest.TestCase):
+    def test_values(self):
+        rgba = np.asarray([[0.0, 0.001, 0.0031308, 1.0], [0.5, 0.214, 1.0, 0.5]])
+        out = linear_to_srgb8(rgba)
+        self.assertEqual(out.dtype, np.uint8)
+        np.testing.assert_array_equal(out[0], [0, 3, 10, 255])
+        # sRGB 0.5 is about linear 0.214, alpha stays linear
+        np.testing.assert_array_equal(out[1], [188, 127, 255, 128])
+
+    def test_clip_and_shape(self):
+        rgba = np.full((2, 3, 4), 2.0, np.float32)
+        rgba[0, 0] = -1.0
+        out = linear_to_srgb8(rgba)
+        self.assertEqual(out.shape, (2, 3, 4))
+        np.testing.assert_array_equal(out[0, 0], [0, 0, 0, 0])
+        np.testing.assert_array_equal(out[1, 2], [255, 255, 255, 255])
+
+    def test_monotonic(self):
+        values = np.linspace(0.0, 1.0, 1001)
+        rgba = np.stack([values] * 4, axis=-1)
+        self.assertTrue(np.all(np.diff(linear_to_srgb8(rgba)[:, 0].astype(int)) >= 0))
+
+
+class TestRenderArrays(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.scene.use_nodes = False
+        self.scene.render.use_compositing = False
+        self.view_layer = types.SimpleNamespace(
+            use_pass_z=False, use_pass_object_index=True
+        )
+        self.scene.view_layers = [self.view_layer]
+        image = self.bpy.data.images.new("Viewer Node", width=2, height=3)
+        image.pixels.foreach_set(np.arange(24, dtype=np.float32))
+
+    def _check_restored(self):
+        self.assertFalse(self.scene.use_nodes)
+        self.assertFalse(self.scene.render.use_compositing)
+        self.assertFalse(self.view_layer.use_pass_z)
+        self.assertTrue(self.view_layer.use_pass_object_index)
+        calls = self.bpy._recorder.calls
+        self.assertEqual(
+            calls["scene.node_tree.nodes.new"], calls["scene.node_tree.nodes.remove"]
+        )
+
+    def test_combined(self):
+        passes = render_arrays(self.scene)
+        # top-down rows
+        np.testing.assert_array_equal(
+            passes["combined"][0, 0], np.arange(16, 20, dtype=np.float32)
+        )
+        self._check_restored()
+
+    def test_restored_after_failure(self):
+        # no pass files are written without blender
+        with self.assertRaises(RuntimeError):
+            render_arrays(self.scene, passes=("combined", "depth"))
+        self._check_restored()
+
+
+class TestImageWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # a directory cannot be written as file
+        self.bad_path = pathlib.Path(self.directory.name) / "bad.npy"
+        self.bad_path.mkdir()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write(self):
+        path = pathlib.Path(self.directory.name) / "a.npy"
+        with ImageWriter() as writer:
+            writer.write(path, np.arange(4))
+        np.testing.assert_array_equal(np.load(str(path)), np.arange(4))
+
+    def test_write_errors_raised(self):
+        with self.assertRaises(RuntimeError):
+            with ImageWriter() as writer:
+                writer.write(self.bad_path, np.arange(4))
+
+    def test_exception_of_with_block_kept(self):
+        with self.assertRaises(KeyError):
+            with ImageWriter() as writer:
+                writer.write(self.bad_path, np.arange(4))
+                raise KeyError("render failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
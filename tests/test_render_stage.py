@@ -0,0 +1,113 @@
+import pathlib
+import unittest
+
+from blender_kitti.render_stage import (
+    DEFAULT_RENDER_SETTINGS,
+    DEFAULT_CAMERA_NAMES,
+    RENDER_PRESETS,
+    add_cameras_from_config,
+    apply_render_settings,
+    format_output_path,
+    render_settings_from_config,
+)
+
+from stand_in import StandInTestCase
+
+
+class TestRenderSettings(unittest.TestCase):
+    def test_defaults(self):
+        self.assertEqual(render_settings_from_config({}), DEFAULT_RENDER_SETTINGS)
+        self.assertEqual(
+            render_settings_from_config({"render": None}), DEFAULT_RENDER_SETTINGS
+        )
+
+    def test_presets(self):
+        for name, preset in RENDER_PRESETS.items():
+            settings = render_settings_from_config({"render": {"preset": name}})
+            self.assertEqual(set(settings), set(DEFAULT_RENDER_SETTINGS))
+            for key, value in preset.items():
+                self.assertEqual(settings[key], value)
+            self.assertEqual(settings["preset"], name)
+
+    def test_explicit_settings_take_precedence(self):
+        settings = render_settings_from_config(
+            {"render": {"preset": "quality", "samples": 32, "denoise": False}}
+        )
+        self.assertEqual(settings["samples"], 32)
+        self.assertFalse(settings["denoise"])
+        self.assertEqual(
+            settings["max_bounces"], RENDER_PRESETS["quality"]["max_bounces"]
+        )
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            render_settings_from_config({"render": {"preset": "ultra"}})
+        with self.assertRaises(ValueError):
+            render_settings_from_config({"render": {"sample": 4}})
+
+    def test_format_output_path(self):
+        path = format_output_path(
+            "{parent}/{index:03d}_{stem}_{camera}.png",
+            pathlib.Path("/data/000001.npz"),
+            7,
+            "main",
+        )
+        self.assertEqual(path, pathlib.Path("/data/007_000001_main.png"))
+
+
+class TestApplyRenderSettings(StandInTestCase):
+    def test_preset(self):
+        self.scene.render.engine = "CYCLES"
+        settings = render_settings_from_config(
+            {"render": {"preset": "draft", "resolution": [640, 480]}}
+        )
+        apply_render_settings(self.scene, settings)
+        self.assertEqual(self.scene.cycles.samples, 16)
+        self.assertEqual(self.scene.cycles.max_bounces, 2)
+        self.assertTrue(self.scene.cycles.use_denoising)
+        self.assertEqual(
+            (self.scene.render.resolution_x, self.scene.render.resolution_y),
+            (640, 480),
+        )
+
+
+class TestCameras(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.config = {
+            "cameras": [
+                {
+                    "name": "main",
+                    "location": [0.0, 0.0, 10.0],
+                    "rotation_quat": [1.0, 0.0, 0.0, 0.0],
+                },
+                {"name": "top", "type": "ortho"},
+            ]
+        }
+
+    def test_config_names(self):
+        # blender renames the new camera data to 'main.001'
+        self.bpy.data.cameras.new("main")
+        cameras = add_cameras_from_config(self.scene, self.config)
+        self.assertEqual(list(cameras), ["main", "top"])
+        self.assertEqual(cameras["main"].data.name, "main.001")
+        self.assertIs(self.scene.camera, cameras["main"])
+
+        views = add_cameras_from_config(self.scene, dict(self.config, views=["top"]))
+        self.assertEqual(list(views), ["top"])
+        with self.assertRaises(ValueError):
+            add_cameras_from_config(self.scene, dict(self.config, views=["side"]))
+
+    def test_duplicate_names(self):
+        self.config["cameras"][1]["name"] = "main"
+        with self.assertRaises(ValueError):
+            add_cameras_from_config(self.scene, self.config)
+
+    def test_default_cameras(self):
+        self.bpy.data.cameras.new("CameraPerspective")
+        cameras = add_cameras_from_config(self.scene, {})
+        self.assertEqual(tuple(cameras), DEFAULT_CAMERA_NAMES)
+
+
+if __name__ == "__main__":
+    unittest.main()
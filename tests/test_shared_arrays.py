@@ -0,0 +1,85 @@
+import pathlib
+import subprocess
+import sys
+import textwrap
+import unittest
+
+import numpy as np
+
+from blender_kitti.shared_arrays import (
+    SharedFrame,
+    open_shared_arrays,
+    shared_data_tasks,
+)
+
+
+class TestSharedArrays(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.arrays = {
+            "point_cloud+lidar+points": rng.rand(101, 3).astype(np.float32),
+            "point_cloud+lidar+colors": rng.randint(0, 256, (101, 3), np.uint8),
+            "voxels+grid+voxels": rng.rand(3, 4, 5) > 0.5,
+        }
+
+    def test_round_trip(self):
+        with SharedFrame(self.arrays) as frame:
+            layout = frame.descriptor["arrays"]
+            self.assertTrue(all(a["offset"] % 64 == 0 for a in layout.values()))
+            data, shm = open_shared_arrays(frame.descriptor)
+            for key, array in self.arrays.items():
+                self.assertEqual(data[key].dtype, array.dtype)
+                np.testing.assert_array_equal(data[key], array)
+            del data
+            shm.close()
+
+    def test_tasks(self):
+        with SharedFrame(self.arrays) as frame:
+            with shared_data_tasks(
+                frame.descriptor, "frame", data_types=["point_cloud"]
+            ) as (tasks, _config):
+                self.assertEqual(len(tasks), 1)
+                ((_task_f, kwargs),) = tasks.values()
+                np.testing.assert_array_equal(
+                    kwargs["points"], self.arrays["point_cloud+lidar+points"]
+                )
+                # views of the segment, not copies
+                self.assertIsNotNone(kwargs["points"].base)
+            self.assertEqual(kwargs, {})
+
+    def test_close(self):
+        frame = SharedFrame(self.arrays)
+        descriptor = frame.descriptor
+        frame.close()
+        frame.close()
+        with self.assertRaises(FileNotFoundError):
+            open_shared_arrays(descriptor)
+
+    def test_object_arrays(self):
+        with self.assertRaises(ValueError):
+            SharedFrame({"a": np.asarray([None, 1])})
+
+    def test_same_process_tracking(self):
+        # the resource tracker reports a KeyError for a segment that is
+        # unregistered twice
+        script = textwrap.dedent("""
+            import numpy as np
+            from blender_kitti.shared_arrays import SharedFrame, shared_data_tasks
+
+            with SharedFrame({"point_cloud+a+points": np.zeros((5, 3))}) as frame:
+                with shared_data_tasks(frame.descriptor, "frame"):
+                    pass
+            """)
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            cwd=str(pathlib.Path(__file__).resolve().parents[1]),
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotIn("KeyError", result.stderr)
+        self.assertNotIn("leaked", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()